@@ -161,6 +161,8 @@ def tau_profile(lam0, fval, gamma, vkms, column_density,
     array if lambda_bins is None.  Default: 12000
     :param dlambda (float): lambda bin width if lambda_bins is 
     None. Default: 0.01
+    The line parameters may also be given as arrays of shape (N, 1),
+    with lambda_bins of shape (N, M), to make N profiles at once.
     """
 
     ## constants
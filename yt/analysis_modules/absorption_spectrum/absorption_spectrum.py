@@ -19,6 +19,10 @@ import numpy as np
 from absorption_line import tau_profile
 
 from yt.funcs import get_pbar
+from yt.utilities.parallel_tools.parallel_analysis_interface import \
+    using_process_pool
+from yt.utilities.parallel_tools.process_pool import \
+    get_pool_size, process_map
 from yt.utilities.physical_constants import \
     amu_cgs, boltzmann_constant_cgs, \
     speed_of_light_cgs, km_per_cm
@@ -38,6 +42,9 @@ class AbsorptionSpectrum(object):
     n_lambda : float
        number of wavelength bins.
     """
+    # The largest number of wavelength bins over which voigt profiles are
+    # evaluated at once.
+    _profile_batch_size = 1 << 20
 
     def __init__(self, lambda_min, lambda_max, n_lambda):
         self.n_lambda = n_lambda
@@ -188,12 +195,35 @@ class AbsorptionSpectrum(object):
         """
         Add the absorption lines to the spectrum.
         """
+        if using_process_pool() and len(self.line_list) > 1:
+            # Each worker deposits its share of the lines into its own copy
+            # of the optical depth field.
+            nworkers = min(len(self.line_list), get_pool_size())
+            results = process_map(
+                lambda worker_id, nworkers:
+                    self._deposit_lines(self.line_list[worker_id::nworkers],
+                                        field_data, use_peculiar_velocity),
+                nworkers)
+        else:
+            results = [self._deposit_lines(self.line_list, field_data,
+                                           use_peculiar_velocity)]
+        for tau_field, spectrum_line_list in results:
+            self.tau_field += tau_field
+            self.spectrum_line_list.extend(spectrum_line_list)
+
+    def _deposit_lines(self, line_list, field_data, use_peculiar_velocity):
+        """
+        Deposit the voigt profiles of all absorbers of each line in
+        *line_list*.  Returns the optical depth and the labelled lines.
+        """
         # Only make voigt profile for slice of spectrum that is 10 times the line width.
         spectrum_bin_ratio = 5
         # Widen wavelength window until optical depth reaches a max value at the ends.
         max_tau = 0.001
 
-        for line in self.line_list:
+        tau_field = np.zeros(self.lambda_bins.size)
+        spectrum_line_list = []
+        for line in line_list:
             column_density = field_data[line['field_name']] * field_data['dl']
             delta_lambda = line['wavelength'] * field_data['redshift']
             if use_peculiar_velocity:
@@ -203,12 +233,15 @@ class AbsorptionSpectrum(object):
             thermal_b = km_per_cm * np.sqrt((2 * boltzmann_constant_cgs *
                                              field_data['temperature']) /
                                             (amu_cgs * line['atomic_mass']))
+            column_density = np.asarray(column_density)
+            delta_lambda = np.asarray(delta_lambda)
+            thermal_b = np.asarray(thermal_b)
             center_bins = np.digitize((delta_lambda + line['wavelength']),
                                       self.lambda_bins)
 
             # ratio of line width to bin width
-            width_ratio = ((line['wavelength'] + delta_lambda) * \
-                thermal_b / speed_of_light_kms / self.bin_width).value
+            width_ratio = (line['wavelength'] + delta_lambda) * \
+                thermal_b / speed_of_light_kms.d / self.bin_width
 
             # do voigt profiles for a subset of the full spectrum
             left_index  = (center_bins -
@@ -216,50 +249,93 @@ class AbsorptionSpectrum(object):
             right_index = (center_bins +
                            spectrum_bin_ratio * width_ratio).astype(int).clip(0, self.n_lambda)
 
-            # loop over all lines wider than the bin width
+            # deposit all lines wider than the bin width
             valid_lines = np.where((width_ratio >= 1.0) &
                                    (right_index - left_index > 1))[0]
             pbar = get_pbar("Adding line - %s [%f A]: " % (line['label'], line['wavelength']),
                             valid_lines.size)
-            for i, lixel in enumerate(valid_lines):
-                my_bin_ratio = spectrum_bin_ratio
-                while True:
-                    lambda_bins, line_tau = \
-                        tau_profile(line['wavelength'], line['f_value'],
-                                    line['gamma'], thermal_b[lixel],
-                                    column_density[lixel],
-                                    delta_lambda=delta_lambda[lixel],
-                                    lambda_bins=self.lambda_bins[left_index[lixel]:right_index[lixel]])
-                    # Widen wavelength window until optical depth reaches a max value at the ends.
-                    if (line_tau[0] < max_tau and line_tau[-1] < max_tau) or \
-                      (left_index[lixel] <= 0 and right_index[lixel] >= self.n_lambda):
-                        break
-                    my_bin_ratio *= 2
-                    left_index[lixel]  = (center_bins[lixel] -
-                                          my_bin_ratio *
-                                          width_ratio[lixel]).astype(int).clip(0, self.n_lambda)
-                    right_index[lixel] = (center_bins[lixel] +
-                                          my_bin_ratio *
-                                          width_ratio[lixel]).astype(int).clip(0, self.n_lambda)
-                self.tau_field[left_index[lixel]:right_index[lixel]] += line_tau
-                if line['label_threshold'] is not None and \
-                        column_density[lixel] >= line['label_threshold']:
+            # Every absorber starts with the same window, so the absorbers
+            # whose wings are still too deep have their windows doubled
+            # together until none are left.
+            my_bin_ratio = spectrum_bin_ratio
+            active = valid_lines
+            n_done = 0
+            while active.size > 0:
+                left = (center_bins[active] -
+                        my_bin_ratio * width_ratio[active]).astype(int).clip(0, self.n_lambda)
+                right = (center_bins[active] +
+                         my_bin_ratio * width_ratio[active]).astype(int).clip(0, self.n_lambda)
+                done = self._deposit_profiles(
+                    tau_field, line, thermal_b[active], column_density[active],
+                    delta_lambda[active], left, right, max_tau)
+                n_done += done.sum()
+                pbar.update(n_done)
+                active = active[~done]
+                my_bin_ratio *= 2
+            pbar.finish()
+
+            if line['label_threshold'] is not None:
+                labelled = valid_lines[column_density[valid_lines] >=
+                                       line['label_threshold']]
+                for lixel in labelled:
                     if use_peculiar_velocity:
                         peculiar_velocity = km_per_cm * field_data['los_velocity'][lixel]
                     else:
                         peculiar_velocity = 0.0
-                    self.spectrum_line_list.append({'label': line['label'],
-                                                    'wavelength': (line['wavelength'] +
-                                                                   delta_lambda[lixel]),
-                                                    'column_density': column_density[lixel],
-                                                    'b_thermal': thermal_b[lixel],
-                                                    'redshift': field_data['redshift'][lixel],
-                                                    'v_pec': peculiar_velocity})
-                    pbar.update(i)
-            pbar.finish()
+                    spectrum_line_list.append({'label': line['label'],
+                                               'wavelength': (line['wavelength'] +
+                                                              delta_lambda[lixel]),
+                                               'column_density': column_density[lixel],
+                                               'b_thermal': thermal_b[lixel],
+                                               'redshift': field_data['redshift'][lixel],
+                                               'v_pec': peculiar_velocity})
 
             del column_density, delta_lambda, thermal_b, \
                 center_bins, width_ratio, left_index, right_index
+        return tau_field, spectrum_line_list
+
+    def _deposit_profiles(self, tau_field, line, thermal_b, column_density,
+                          delta_lambda, left_index, right_index, max_tau):
+        """
+        Evaluate the voigt profiles of a set of absorbers of a line over the
+        windows from *left_index* to *right_index* and add those whose
+        optical depth has fallen below *max_tau* at both ends of the window,
+        or whose window spans the whole spectrum, to *tau_field*.  Returns a
+        mask of the absorbers that were added.
+        """
+        done = np.zeros(left_index.size, dtype="bool")
+        width = right_index - left_index
+        # Absorbers are evaluated together in groups of similar window size,
+        # with windows padded up to the next power of two.
+        group = np.ceil(np.log2(width)).astype("int64")
+        for level in np.unique(group):
+            size = 1 << level
+            members = np.where(group == level)[0]
+            batch = max(1, self._profile_batch_size // size)
+            for start in range(0, members.size, batch):
+                rows = members[start:start + batch]
+                bins = np.arange(size)
+                in_window = bins < width[rows, None]
+                indices = np.minimum(left_index[rows, None] + bins,
+                                     self.n_lambda - 1)
+                lambda_bins, line_tau = \
+                    tau_profile(line['wavelength'], line['f_value'],
+                                line['gamma'], thermal_b[rows, None],
+                                column_density[rows, None],
+                                delta_lambda=delta_lambda[rows, None],
+                                lambda_bins=self.lambda_bins[indices])
+                # Widen wavelength window until optical depth reaches a max value at the ends.
+                my_done = ((line_tau[:, 0] < max_tau) &
+                           (line_tau[np.arange(rows.size),
+                                     width[rows] - 1] < max_tau)) | \
+                          ((left_index[rows] <= 0) &
+                           (right_index[rows] >= self.n_lambda))
+                done[rows] = my_done
+                in_window &= my_done[:, None]
+                tau_field += np.bincount(indices[in_window],
+                                         weights=line_tau[in_window],
+                                         minlength=self.n_lambda)
+        return done
 
     def _write_spectrum_line_list(self, filename):
         """
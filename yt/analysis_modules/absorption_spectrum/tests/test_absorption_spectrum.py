@@ -0,0 +1,126 @@
+"""
+Unit test the absorption_spectrum analysis module.
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import time
+import h5py
+import numpy as np
+
+from yt.testing import *
+from yt.analysis_modules.absorption_spectrum.api import AbsorptionSpectrum
+from yt.analysis_modules.absorption_spectrum.absorption_line import \
+    tau_profile
+from yt.utilities.physical_constants import \
+    amu_cgs, boltzmann_constant_cgs, speed_of_light_cgs, km_per_cm
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _write_ray(filename, n_cells):
+    np.random.seed(0x4d3d3d3)
+    f = h5py.File(filename, "w")
+    f.create_dataset("dl", data=np.random.uniform(1e20, 1e21, n_cells))
+    f.create_dataset("redshift",
+                     data=np.sort(np.random.uniform(0.0, 0.2, n_cells)))
+    f.create_dataset("temperature",
+                     data=10**np.random.uniform(3.5, 6.5, n_cells))
+    f.create_dataset("los_velocity", data=np.random.normal(0, 1e7, n_cells))
+    f.create_dataset("H_number_density",
+                     data=10**np.random.uniform(-12, -6, n_cells))
+    f.close()
+
+def _make_spectrum(n_lambda=20000):
+    sp = AbsorptionSpectrum(900.0, 1800.0, n_lambda)
+    sp.add_line("HI 1216", "H_number_density", 1215.6700,
+                0.4164, 6.265e8, 1.00794, label_threshold=1e14)
+    sp.add_line("HI 1026", "H_number_density", 1025.7223,
+                0.07912, 1.897e8, 1.00794, label_threshold=1e14)
+    return sp
+
+def _reference_tau(sp, filename):
+    # One voigt profile at a time, doubling each window separately.
+    f = h5py.File(filename, "r")
+    field_data = dict((field, f[field][:]) for field in f)
+    f.close()
+    tau_field = np.zeros(sp.n_lambda)
+    for line in sp.line_list:
+        column_density = field_data[line['field_name']] * field_data['dl']
+        delta_lambda = line['wavelength'] * field_data['redshift'] + \
+            line['wavelength'] * (1 + field_data['redshift']) * \
+            field_data['los_velocity'] / speed_of_light_cgs.d
+        thermal_b = km_per_cm * np.sqrt((2 * boltzmann_constant_cgs.d *
+                                         field_data['temperature']) /
+                                        (amu_cgs.d * line['atomic_mass']))
+        center_bins = np.digitize(delta_lambda + line['wavelength'],
+                                  sp.lambda_bins)
+        width_ratio = (line['wavelength'] + delta_lambda) * thermal_b / \
+            (speed_of_light_cgs.d * km_per_cm) / sp.bin_width
+        for lixel in range(column_density.size):
+            ratio = 5
+            while True:
+                left = int(center_bins[lixel] - ratio * width_ratio[lixel])
+                right = int(center_bins[lixel] + ratio * width_ratio[lixel])
+                left = min(max(left, 0), sp.n_lambda)
+                right = min(max(right, 0), sp.n_lambda)
+                if ratio == 5 and (width_ratio[lixel] < 1.0 or
+                                   right - left <= 1):
+                    break
+                lambda_bins, line_tau = \
+                    tau_profile(line['wavelength'], line['f_value'],
+                                line['gamma'], thermal_b[lixel],
+                                column_density[lixel],
+                                delta_lambda=delta_lambda[lixel],
+                                lambda_bins=sp.lambda_bins[left:right])
+                if (line_tau[0] < 0.001 and line_tau[-1] < 0.001) or \
+                  (left <= 0 and right >= sp.n_lambda):
+                    tau_field[left:right] += line_tau
+                    break
+                ratio *= 2
+    return tau_field
+
+def test_batched_line_deposition():
+    with process_pool_test_dir() as use_processes:
+        _write_ray("ray.h5", 200)
+        sp = _make_spectrum()
+        sp.make_spectrum("ray.h5", output_file="spectrum.h5",
+                         line_list_file="lines.txt")
+        answer = _reference_tau(sp, "ray.h5")
+        yield assert_allclose, sp.tau_field, answer, 1e-10
+        labelled = len(sp.spectrum_line_list)
+        yield assert_equal, labelled > 0, True
+        # Spreading the lines over worker processes gives the same spectrum.
+        use_processes(2)
+        sp = _make_spectrum()
+        sp.make_spectrum("ray.h5", output_file="spectrum.h5",
+                         line_list_file="lines.txt")
+        yield assert_allclose, sp.tau_field, answer, 1e-10
+        yield assert_equal, len(sp.spectrum_line_list), labelled
+
+def _benchmark_line_deposition(n_cells=5000):
+    with process_pool_test_dir():
+        _write_ray("ray.h5", n_cells)
+        sp = _make_spectrum(50000)
+        t1 = time.time()
+        answer = _reference_tau(sp, "ray.h5")
+        t2 = time.time()
+        sp.make_spectrum("ray.h5", output_file="spectrum.h5",
+                         line_list_file="lines.txt")
+        t3 = time.time()
+        print "%s cells: one at a time %0.3f s, batched %0.3f s, " \
+              "max relative difference %0.3e" % \
+              (n_cells, t2 - t1, t3 - t2,
+               (np.abs(sp.tau_field - answer) /
+                np.maximum(answer, 1e-300)).max())
+
+if __name__ == "__main__":
+    _benchmark_line_deposition()
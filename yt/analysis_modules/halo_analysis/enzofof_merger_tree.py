@@ -25,22 +25,23 @@ compare parent/child relationships.
 # 3. Load dataset at time t+1
 # 4. Parse catalogs for t and t+1
 # 5. Place halos for t+1 in kD-tree
-# 6. For every halo in t, execute ball-query with some linking length
-# 7. For every halo in ball-query result, execute numpy's intersect1d on
-#    particle IDs
+# 6. For every halo in t, find the halos of t+1 within some linking length
+# 7. Sort the particle IDs of each catalog once, and count the particles
+#    shared by every pair of halos with searchsorted
 # 8. Parentage is described by a fraction of particles that pass from one to
 #    the other; we have both descendent fractions and ancestory fractions. 
 
 
 import numpy as np
 import h5py
+import os
 import time
 import pdb
 import cPickle
 import glob
 
 from yt.funcs import *
-from yt.extern.pykdtree import KDTree
+from yt.utilities.spatial import cKDTree
 import yt.extern.pydot as pydot
 
 # We don't currently use this, but we may again find a use for it in the
@@ -94,6 +95,7 @@ class HaloCatalog(object):
         Directory where FOF files are located
     """
     cache = None
+    _sorted_particle_ids = None
     def __init__(self, output_id, cache = True, external_FOF=True, FOF_directory="FOF"):
         self.output_id = output_id
         self.external_FOF = external_FOF
@@ -123,7 +125,7 @@ class HaloCatalog(object):
             hp.append([x,y,z])
         if hp != []:
             self.halo_positions = np.array(hp)
-            self.halo_kdtree = KDTree(self.halo_positions)
+            self.halo_kdtree = cKDTree(self.halo_positions)
         else:
             self.halo_positions = None
             self.halo_kdtree = None
@@ -154,47 +156,76 @@ class HaloCatalog(object):
             hp.append([x,y,z])
         if hp != []:
             self.halo_positions = np.array(hp)
-            self.halo_kdtree = KDTree(self.halo_positions)
+            self.halo_kdtree = cKDTree(self.halo_positions)
         else:
             self.halo_positions = None
             self.halo_kdtree = None
         return hp
 
+    def _read_halo_particle_ids(self, halo_id):
+        if self.external_FOF:
+            return self.particle_file["/Halo%08i/Particle ID" % halo_id][:]
+        else:
+            return self.particle_file["/Halo%08i/particle_index" % halo_id][:]
+
     def read_particle_ids(self, halo_id):        
         if self.cache is not None:
             if halo_id not in self.cache:
-                if self.external_FOF:
-                    self.cache[halo_id] = \
-                    self.particle_file["/Halo%08i/Particle ID" % halo_id][:]
-                else:
-                    self.cache[halo_id] = \
-                    self.particle_file["/Halo%08i/particle_index" % halo_id][:]
+                self.cache[halo_id] = self._read_halo_particle_ids(halo_id)
             ids = self.cache[halo_id]
         else:
-            if self.external_FOF:
-                ids = self.particle_file["/Halo%08i/Particle ID" % halo_id][:]
-            else:
-                ids = self.particle_file["/Halo%08i/particle_index" % halo_id][:]
+            ids = self._read_halo_particle_ids(halo_id)
         return HaloParticleList(halo_id, self.halo_positions[halo_id,:], ids)
 
+    def read_all_particle_ids(self):
+        r"""Return the particle IDs of every halo in the catalog, sorted, along
+        with the halo each one belongs to and the number of particles in each
+        halo.
+
+        A particle listed more than once in the same halo appears only once.
+        The result is kept, so that each catalog is read and sorted only once
+        when it is compared with both the output before and the one after it.
+        """
+        if self._sorted_particle_ids is not None:
+            return self._sorted_particle_ids
+        if self.halo_positions is None:
+            nhalos = 0
+        else:
+            nhalos = self.halo_positions.shape[0]
+        pieces = [np.array([], dtype="int64")]
+        counts = np.zeros(nhalos, dtype="int64")
+        for halo_id in range(nhalos):
+            ids = self._read_halo_particle_ids(halo_id)
+            pieces.append(ids.astype("int64"))
+            counts[halo_id] = ids.size
+        ids = np.concatenate(pieces)
+        owners = np.repeat(np.arange(nhalos, dtype="int64"), counts)
+        order = np.lexsort((owners, ids))
+        ids, owners = ids[order], owners[order]
+        unique = np.ones(ids.size, dtype="bool")
+        unique[1:] = (ids[1:] != ids[:-1]) | (owners[1:] != owners[:-1])
+        self._sorted_particle_ids = (ids[unique], owners[unique], counts)
+        return self._sorted_particle_ids
+
     def calculate_parentage_fractions(self, other_catalog, radius = 0.10):
         parentage_fractions = {}
-        if self.halo_positions == None or other_catalog.halo_positions == None:
+        if self.halo_positions is None or other_catalog.halo_positions is None:
             return parentage_fractions
-        mylog.debug("Ball-tree query with radius %0.3e", radius)
-        all_nearest = self.halo_kdtree.query_ball_tree(
-            other_catalog.halo_kdtree, radius)
-        pbar = get_pbar("Halo Mergers", self.halo_positions.shape[0])
-        for hid1, nearest in enumerate(all_nearest):
-            pbar.update(hid1)
-            parentage_fractions[hid1] = {}
-            HPL1 = self.read_particle_ids(hid1)
-            for hid2 in sorted(nearest):
-                HPL2 = other_catalog.read_particle_ids(hid2)
-                p1, p2 = HPL1.find_relative_parentage(HPL2)
-                parentage_fractions[hid1][hid2] = (p1, p2, HPL2.number_of_particles)
-            parentage_fractions[hid1]["NumberOfParticles"] = HPL1.number_of_particles
-        pbar.finish()
+        mylog.debug("kD-tree query with radius %0.3e", radius)
+        hid1, hid2 = find_neighboring_halos(other_catalog.halo_kdtree,
+                                            self.halo_positions, radius)
+        ids1, owners1, npart1 = self.read_all_particle_ids()
+        ids2, owners2, npart2 = other_catalog.read_all_particle_ids()
+        shared = count_shared_particles(ids1, owners1, ids2, owners2,
+                                        hid1, hid2)
+        for h1 in range(self.halo_positions.shape[0]):
+            parentage_fractions[h1] = \
+              {"NumberOfParticles": int(npart1[h1])}
+        for h1, h2, overlap in zip(hid1.tolist(), hid2.tolist(),
+                                   shared.tolist()):
+            parentage_fractions[h1][h2] = (float(overlap)/npart2[h2],
+                                           float(overlap)/npart1[h1],
+                                           int(npart2[h2]))
         return parentage_fractions
 
 class HaloParticleList(object):
@@ -205,7 +236,10 @@ class HaloParticleList(object):
         self.number_of_particles = particle_ids.size
 
     def find_nearest(self, other_tree, radius = 0.10):
-        return other_tree.query_ball_point(self.position, radius)
+        hid1, hid2 = find_neighboring_halos(other_tree,
+                                            self.position[np.newaxis,:],
+                                            radius)
+        return hid2.tolist()
 
     def find_relative_parentage(self, child):
         # Return two values: percent this halo gave to the other, and percent
@@ -215,6 +249,63 @@ class HaloParticleList(object):
         of_mine_from_me = float(overlap)/self.particle_ids.size
         return of_child_from_me, of_mine_from_me
 
+def find_neighboring_halos(tree, positions, radius):
+    r"""Find every pair of a halo at one of *positions* and a halo in the
+    cKDTree *tree* that are no more than *radius* apart.
+
+    Returns two arrays, the indices into *positions* and into the data of
+    *tree* of each pair, sorted by the first and then by the second.  Our
+    compiled kD-tree only answers k-nearest-neighbor queries, so we ask for
+    more neighbors of the halos whose k-th nearest is still within the radius
+    until every halo has them all.  The distances it returns are squared.
+    """
+    radius2 = radius**2
+    pairs1 = [np.array([], dtype="int64")]
+    pairs2 = [np.array([], dtype="int64")]
+    todo = np.arange(positions.shape[0])
+    k = min(16, tree.n)
+    while todo.size > 0 and k > 0:
+        dist, ind = tree.query(positions[todo], k=k)
+        dist = dist.reshape(todo.size, k)
+        ind = ind.reshape(todo.size, k)
+        if k < tree.n:
+            more = dist[:,-1] <= radius2
+        else:
+            more = np.zeros(todo.size, dtype="bool")
+        close = dist[~more] <= radius2
+        pairs1.append(np.repeat(todo[~more], k).reshape(-1, k)[close])
+        pairs2.append(ind[~more][close])
+        todo = todo[more]
+        k = min(2 * k, tree.n)
+    pairs1 = np.concatenate(pairs1)
+    pairs2 = np.concatenate(pairs2)
+    order = np.lexsort((pairs2, pairs1))
+    return pairs1[order], pairs2[order]
+
+def count_shared_particles(ids1, owners1, ids2, owners2, hid1, hid2):
+    r"""Count the particles shared by each pair of halos (hid1, hid2).
+
+    *ids1* and *ids2* are the sorted particle IDs of two catalogs, and
+    *owners1* and *owners2* the halos they belong to, as returned by
+    HaloCatalog.read_all_particle_ids.  Every particle of the first catalog
+    is looked up in the second at once, which gives the pair of halos it
+    links, and the pairs are then counted together.
+    """
+    left = np.searchsorted(ids2, ids1, side="left")
+    right = np.searchsorted(ids2, ids1, side="right")
+    nmatch = right - left
+    # A particle may be in more than one halo of the second catalog, so each
+    # one links its halo to a contiguous run of matches.
+    first = np.cumsum(nmatch) - nmatch
+    matches = np.repeat(left - first, nmatch) + np.arange(nmatch.sum())
+    nhalos2 = max(owners2.max() + 1 if owners2.size > 0 else 0,
+                  hid2.max() + 1 if hid2.size > 0 else 0)
+    links = np.repeat(owners1, nmatch) * nhalos2 + owners2[matches]
+    links.sort()
+    wanted = hid1.astype("int64") * nhalos2 + hid2
+    return np.searchsorted(links, wanted, side="right") - \
+           np.searchsorted(links, wanted, side="left")
+
 class EnzoFOFMergerBranch(object):
     def __init__(self, tree, output_num, halo_id, max_children,
                  min_relation=0.25):
@@ -265,6 +356,12 @@ class EnzoFOFMergerTree(object):
         internal yt outputs, and groups_DDDDD.dat for external FOF outputs.
         where DDDDD are digits representing the equivalent cycle number.
         e.g. groups_00000.txt
+    reuse_saved : bool, optional
+        If save_filename already exists, take the relationships between
+        any pair of outputs already in it from there, rather than
+        calculating them again, so that only new outputs are matched.
+        Relationships are only reused if neither catalog has been
+        modified since they were saved.
     
     Examples
     --------
@@ -279,14 +376,16 @@ class EnzoFOFMergerTree(object):
     """    
     def __init__(self, zrange=None, cycle_range=None, output=False,
                  load_saved=False, save_filename="merger_tree.cpkl",
-                 external_FOF=True, FOF_directory="FOF"):
+                 external_FOF=True, FOF_directory="FOF", reuse_saved=True):
 
         self.relationships = {}
         self.redshifts = {}
+        self.sources = {}
         self.external_FOF = external_FOF
         self.FOF_directory = FOF_directory
+        save_filename = "%s/%s" % (self.FOF_directory, save_filename)
         if load_saved:
-            self.load_tree("%s/%s" % (self.FOF_directory, save_filename))
+            self.load_tree(save_filename)
             # make merger tree work within specified cycle/z limits
             # on preloaded halos
             if zrange is not None:
@@ -294,9 +393,11 @@ class EnzoFOFMergerTree(object):
             if cycle_range is not None:
                 self.select_cycles(cycle_range)
         else:
+            if reuse_saved and os.path.exists(save_filename):
+                self.load_tree(save_filename)
             self.find_outputs(zrange, cycle_range, output)
             self.run_merger_tree(output)
-            self.save_tree("%s/%s" % (self.FOF_directory, save_filename))
+            self.save_tree(save_filename)
         
     def select_cycles(self, cycle_range):
         """
@@ -324,12 +425,16 @@ class EnzoFOFMergerTree(object):
                 del self.redshifts[cycle]
 
     def save_tree(self, filename):
-        cPickle.dump((self.redshifts, self.relationships),
+        cPickle.dump((self.redshifts, self.relationships, self.sources),
                      open(filename, "wb"))
 
     def load_tree(self, filename):
-        self.redshifts, self.relationships = \
-                        cPickle.load(open(filename, "rb"))
+        saved = cPickle.load(open(filename, "rb"))
+        # Trees saved before the sources of each relationship were recorded
+        # only hold the first two.
+        if len(saved) == 2:
+            saved = saved + ({},)
+        self.redshifts, self.relationships, self.sources = saved
 
     def clear_data(self):
         r"""Deletes previous merger tree, but keeps parentage
@@ -364,21 +469,56 @@ class EnzoFOFMergerTree(object):
                 self.numbers.append(num)
         self.numbers.sort()
 
+    def _catalog_source(self, num):
+        # The files a catalog is read from, and when they were last changed.
+        if self.external_FOF:
+            groups = "%s/groups_%05i.dat" % (self.FOF_directory, num)
+        else:
+            groups = "%s/groups_%05i.txt" % (self.FOF_directory, num)
+        particles = "%s/particles_%05i.h5" % (self.FOF_directory, num)
+        return tuple((fn, os.path.getmtime(fn)) for fn in [groups, particles])
+
     def run_merger_tree(self, output):
-        # Run merger tree for all outputs, starting with the last output
+        # Run merger tree for all outputs, starting with the last output.
+        # Each catalog is compared with the outputs on either side of it, so
+        # it is kept for the next pair rather than read and sorted again.
+        # Relationships already held are reused if they were found from the
+        # same pair of catalogs.
+        saved_redshifts, saved_relationships, saved_sources = \
+          self.redshifts, self.relationships, self.sources
+        self.redshifts, self.relationships, self.sources = {}, {}, {}
+        HC2 = None
         for i in range(len(self.numbers)-1, 0, -1):
             if output:
                 output = "%s/tree-%5.5d-%5.5d" % \
                          (self.FOF_directory, self.numbers[i], self.numbers[i-1])
             else:
                 output = None
-            z0, z1, fr = find_halo_relationships(self.numbers[i], \
-                                                 self.numbers[i-1], \
-                                                 output_basename=output, \
-                                                 external_FOF=self.external_FOF,
-                                                 FOF_directory=self.FOF_directory)
+            source = (self.numbers[i-1], self._catalog_source(self.numbers[i]),
+                      self._catalog_source(self.numbers[i-1]))
+            if saved_sources.get(self.numbers[i]) == source:
+                mylog.info("Using saved relationships for %04i",
+                           self.numbers[i])
+                fr = saved_relationships[self.numbers[i]]
+                z0 = saved_redshifts[self.numbers[i]]
+                z1 = saved_redshifts[self.numbers[i-1]]
+                HC2 = None
+            else:
+                if HC2 is None:
+                    mylog.info("Parsing Halo Catalog %04i", self.numbers[i])
+                    HC2 = HaloCatalog(self.numbers[i], False,
+                                      external_FOF=self.external_FOF,
+                                      FOF_directory=self.FOF_directory)
+                HC1 = HC2
+                mylog.info("Parsing Halo Catalog %04i", self.numbers[i-1])
+                HC2 = HaloCatalog(self.numbers[i-1], False,
+                                  external_FOF=self.external_FOF,
+                                  FOF_directory=self.FOF_directory)
+                fr = _catalog_relationships(HC1, HC2, output)
+                z0, z1 = HC1.redshift, HC2.redshift
             self.relationships[self.numbers[i]] = fr
             self.redshifts[self.numbers[i]] = z0
+            self.sources[self.numbers[i]] = source
         # Fill in last redshift
         self.redshifts[self.numbers[0]] = z1
 
@@ -667,10 +807,15 @@ def find_halo_relationships(output1_id, output2_id, output_basename = None,
     HC1 = HaloCatalog(output1_id, False, external_FOF=external_FOF, \
                       FOF_directory=FOF_directory)
     mylog.info("Parsing Halo Catalog %04i", output2_id)
-    HC2 = HaloCatalog(output2_id, True, external_FOF=external_FOF, \
+    HC2 = HaloCatalog(output2_id, False, external_FOF=external_FOF, \
                       FOF_directory=FOF_directory)
+    pfrac = _catalog_relationships(HC1, HC2, output_basename, radius)
+    return HC1.redshift, HC2.redshift, pfrac
+
+def _catalog_relationships(HC1, HC2, output_basename = None, radius = 0.10):
     mylog.info("Calculating fractions")
-    pfrac = HC1.calculate_parentage_fractions(HC2)
+    pfrac = HC1.calculate_parentage_fractions(HC2, radius)
+    output1_id, output2_id = HC1.output_id, HC2.output_id
 
     if output_basename is not None and pfrac != {}:
         f = open("%s.txt" % (output_basename), "w")
@@ -685,7 +830,7 @@ def find_halo_relationships(output1_id, output2_id, output_basename = None,
 
         cPickle.dump(pfrac, open("%s.cpkl" % (output_basename), "wb"))
 
-    return HC1.redshift, HC2.redshift, pfrac
+    return pfrac
 
 def grab_FOF_halo_info_internal(filename, halo_id):
     """
@@ -13,6 +13,7 @@ HaloCatalog object
 # The full license is in the file COPYING.txt, distributed with this software.
 #-----------------------------------------------------------------------------
 
+import glob
 import h5py
 import numpy as np
 import os
@@ -20,10 +21,17 @@ import os
 from yt.funcs import \
      ensure_dir, \
      mylog
+from yt.utilities.lib.geometry_utils import \
+     compute_morton
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
      ParallelAnalysisInterface, \
      parallel_blocking_call, \
-     parallel_objects
+     parallel_objects, \
+     using_process_pool
+from yt.utilities.parallel_tools.process_pool import \
+     at_worker_exit, \
+     get_worker_id, \
+     remove_worker_exit_callback
      
 from .halo_object import \
      Halo
@@ -261,7 +269,9 @@ class HaloCatalog(ParallelAnalysisInterface):
         halo_filter = filter_registry.find(halo_filter, *args, **kwargs)
         self.actions.append(("filter", halo_filter))
 
-    def create(self, save_halos=False, save_catalog=True, njobs=-1, dynamic=False):
+    def create(self, save_halos=False, save_catalog=True, njobs=-1, dynamic=False,
+               batch_size=0, cache_bytes=None, checkpoint_interval=0,
+               resume=False):
         r"""
         Create the halo catalog given the callbacks, quantities, and filters that 
         have been provided.
@@ -288,15 +298,46 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If greater than zero, halos are ordered along a space-filling curve
+            and handed out in batches of this many neighboring halos, and
+            fluid fields of the data_ds are read through a cache of grid data
+            shared by all halos, so that grids overlapping several halos are
+            only read once.  Parallelism is then over batches rather than
+            halos.
+            Default: 0
+        cache_bytes : int
+            The budget, in bytes, for the grid data cache used when batch_size
+            is greater than zero.  If None, the chunk_cache_bytes
+            configuration option is used.
+            Default: None
+        checkpoint_interval : int
+            If greater than zero, the catalog is written to disk as the
+            analysis proceeds, appending the rows of every checkpoint_interval
+            halos processed, rather than all at once at the end.  Rows are
+            then not kept in the "catalog" attribute, and are written in the
+            order the halos are processed.  Requires save_catalog.
+            Default: 0
+        resume : bool
+            If True, halos already processed by an earlier run writing to the
+            same output_dir, as recorded in its catalog files, are skipped and
+            the new rows are appended to those files.  The remaining halos are
+            divided among the available processors, as given by njobs and
+            dynamic, regardless of how many ran before.  Requires save_catalog.
+            Default: False
 
         See Also
         --------
         load
         
         """
-        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic)
+        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic,
+                  batch_size=batch_size, cache_bytes=cache_bytes,
+                  checkpoint_interval=checkpoint_interval, resume=resume)
 
-    def load(self, save_halos=True, save_catalog=False, njobs=-1, dynamic=False):
+    def load(self, save_halos=True, save_catalog=False, njobs=-1, dynamic=False,
+             batch_size=0, cache_bytes=None, checkpoint_interval=0,
+             resume=False):
         r"""
         Load a previously created halo catalog.
 
@@ -323,16 +364,47 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If greater than zero, halos are ordered along a space-filling curve
+            and handed out in batches of this many neighboring halos, and
+            fluid fields of the data_ds are read through a cache of grid data
+            shared by all halos, so that grids overlapping several halos are
+            only read once.  Parallelism is then over batches rather than
+            halos.
+            Default: 0
+        cache_bytes : int
+            The budget, in bytes, for the grid data cache used when batch_size
+            is greater than zero.  If None, the chunk_cache_bytes
+            configuration option is used.
+            Default: None
+        checkpoint_interval : int
+            If greater than zero, the catalog is written to disk as the
+            analysis proceeds, appending the rows of every checkpoint_interval
+            halos processed, rather than all at once at the end.  Rows are
+            then not kept in the "catalog" attribute, and are written in the
+            order the halos are processed.  Requires save_catalog.
+            Default: 0
+        resume : bool
+            If True, halos already processed by an earlier run writing to the
+            same output_dir, as recorded in its catalog files, are skipped and
+            the new rows are appended to those files.  The remaining halos are
+            divided among the available processors, as given by njobs and
+            dynamic, regardless of how many ran before.  Requires save_catalog.
+            Default: False
 
         See Also
         --------
         create
         
         """
-        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic)
+        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic,
+                  batch_size=batch_size, cache_bytes=cache_bytes,
+                  checkpoint_interval=checkpoint_interval, resume=resume)
         
     @parallel_blocking_call
-    def _run(self, save_halos, save_catalog, njobs=-1, dynamic=False):
+    def _run(self, save_halos, save_catalog, njobs=-1, dynamic=False,
+             batch_size=0, cache_bytes=None, checkpoint_interval=0,
+             resume=False):
         r"""
         Run the requested halo analysis.
 
@@ -352,6 +424,33 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If greater than zero, halos are ordered along a space-filling curve
+            and handed out in batches of this many neighboring halos, and
+            fluid fields of the data_ds are read through a cache of grid data
+            shared by all halos, so that grids overlapping several halos are
+            only read once.  Parallelism is then over batches rather than
+            halos.
+            Default: 0
+        cache_bytes : int
+            The budget, in bytes, for the grid data cache used when batch_size
+            is greater than zero.  If None, the chunk_cache_bytes
+            configuration option is used.
+            Default: None
+        checkpoint_interval : int
+            If greater than zero, the catalog is written to disk as the
+            analysis proceeds, appending the rows of every checkpoint_interval
+            halos processed, rather than all at once at the end.  Rows are
+            then not kept in the "catalog" attribute, and are written in the
+            order the halos are processed.  Requires save_catalog.
+            Default: 0
+        resume : bool
+            If True, halos already processed by an earlier run writing to the
+            same output_dir, as recorded in its catalog files, are skipped and
+            the new rows are appended to those files.  The remaining halos are
+            divided among the available processors, as given by njobs and
+            dynamic, regardless of how many ran before.  Requires save_catalog.
+            Default: False
 
         See Also
         --------
@@ -359,6 +458,7 @@ class HaloCatalog(ParallelAnalysisInterface):
         
         """
         self.catalog = []
+        self.io_stats = {}
         if save_halos: self.halo_list = []
 
         if self.halos_ds is None:
@@ -380,8 +480,27 @@ class HaloCatalog(ParallelAnalysisInterface):
             # Add all of the default quantities that all halos must have
             self.add_default_quantities('all')
 
-        my_index = np.argsort(self.data_source["particle_identifier"])
-        for i in parallel_objects(my_index, njobs=njobs, dynamic=dynamic):
+        identifiers = self.data_source["particle_identifier"].d
+        my_index = np.argsort(identifiers)
+        stream_catalog = checkpoint_interval > 0 or resume
+        if stream_catalog and not save_catalog:
+            raise RuntimeError("Writing the catalog as we go requires save_catalog.")
+        if resume:
+            processed = self._find_processed_halos()
+            my_index = my_index[~np.in1d(identifiers[my_index], processed)]
+            mylog.info("Resuming with %d of %d halos left to process.",
+                       my_index.size, identifiers.size)
+        if stream_catalog:
+            # Everyone has to be done reading the old catalog files before
+            # anyone starts appending to them.
+            self.comm.barrier()
+            self._start_catalog_output(resume)
+        if batch_size > 0:
+            halo_iter = self._batched_halos(my_index, batch_size, cache_bytes,
+                                            njobs=njobs, dynamic=dynamic)
+        else:
+            halo_iter = parallel_objects(my_index, njobs=njobs, dynamic=dynamic)
+        for i in halo_iter:
             new_halo = Halo(self)
             halo_filter = True
             for action_type, action in self.actions:
@@ -408,10 +527,176 @@ class HaloCatalog(ParallelAnalysisInterface):
             else:
                 del new_halo
 
+            if stream_catalog:
+                self._processed_halos.append(identifiers[i])
+                if checkpoint_interval > 0 and \
+                  len(self._processed_halos) >= checkpoint_interval:
+                    self._write_catalog_rows()
+
+        if stream_catalog:
+            self._finish_catalog_output()
+            return
+
         self.catalog.sort(key=lambda a:a['particle_identifier'].to_ndarray())
         if save_catalog:
             self.save_catalog()
 
+    def _catalog_filename(self, file_id):
+        return os.path.join(self.output_dir, "%s.%d.h5" %
+                            (self.output_prefix, file_id))
+
+    def _catalog_file_id(self):
+        # Each forked worker of the process backend writes its own file, as
+        # each MPI task does.
+        if using_process_pool():
+            return get_worker_id()
+        return self.comm.rank
+
+    def _find_processed_halos(self):
+        r"""
+        Return the identifiers of all halos recorded in the catalog files in
+        the output directory, including those that did not pass the filters.
+        """
+        processed = [np.array([])]
+        for filename in glob.glob(os.path.join(
+                self.output_dir, "%s.*.h5" % self.output_prefix)):
+            with h5py.File(filename, "r") as f:
+                if "checkpoint" in f:
+                    n = f.attrs["num_processed"]
+                    processed.append(f["checkpoint/particle_identifier"][:n])
+                elif "particle_identifier" in f:
+                    # A catalog written all at once is complete.
+                    n = f.attrs["num_halos"]
+                    processed.append(f["particle_identifier"][:n])
+        return np.unique(np.concatenate(processed))
+
+    def _start_catalog_output(self, resume):
+        self._processed_halos = []
+        self._catalog_file = None
+        self._resume_catalog = resume
+        if using_process_pool():
+            at_worker_exit(self._finish_catalog_output)
+
+    def _open_catalog_file(self):
+        filename = self._catalog_filename(self._catalog_file_id())
+        if self._resume_catalog and os.path.exists(filename):
+            with h5py.File(filename, "a") as f:
+                if "checkpoint" not in f:
+                    # This was written all at once, so its fields have to be
+                    # made growable before we can append to them.
+                    for key in list(f.keys()):
+                        data = f[key][:]
+                        units = f[key].attrs["units"]
+                        del f[key]
+                        dataset = self._create_growable(f, key, data)
+                        dataset.attrs["units"] = units
+                    n = f.attrs["num_halos"]
+                    self._create_growable(f, "checkpoint/particle_identifier",
+                                          f["particle_identifier"][:n])
+                    f.attrs["num_processed"] = n
+                # Anything written after the last complete checkpoint, if we
+                # were stopped halfway through one, is dropped.
+                n = f.attrs["num_halos"]
+                for key in self.quantities:
+                    if key in f: f[key].resize((n,))
+                f["checkpoint/particle_identifier"].resize(
+                    (f.attrs["num_processed"],))
+        else:
+            with h5py.File(filename, "w") as f:
+                self._write_catalog_header(f)
+                f.attrs["num_halos"] = 0
+                f.attrs["num_processed"] = 0
+                self._create_growable(f, "checkpoint/particle_identifier",
+                                      np.array([]))
+        self._catalog_file = filename
+
+    def _create_growable(self, f, name, data):
+        return f.create_dataset(name, data=data.astype("float64"),
+                                maxshape=(None,), chunks=(1024,))
+
+    def _write_catalog_rows(self):
+        r"""
+        Append the rows of the halos processed since the last call, and the
+        identifiers of all of them, to this processor's catalog file.
+        """
+        if self._catalog_file is None:
+            self._open_catalog_file()
+        with h5py.File(self._catalog_file, "a") as f:
+            n_old = f.attrs["num_halos"]
+            n_new = n_old + len(self.catalog)
+            if len(self.catalog) > 0:
+                field_data = np.empty(len(self.catalog))
+                for key in self.quantities:
+                    for i, row in enumerate(self.catalog):
+                        field_data[i] = row[key]
+                    if key not in f:
+                        units = ""
+                        if hasattr(self.catalog[0][key], "units"):
+                            units = str(self.catalog[0][key].units)
+                        dataset = self._create_growable(f, str(key),
+                                                        np.empty(n_old))
+                        dataset.attrs["units"] = units
+                    dataset = f[key]
+                    dataset.resize((n_new,))
+                    dataset[n_old:] = field_data
+            p_old = f.attrs["num_processed"]
+            p_new = p_old + len(self._processed_halos)
+            dataset = f["checkpoint/particle_identifier"]
+            dataset.resize((p_new,))
+            dataset[p_old:] = self._processed_halos
+            # The counts go last, so that they only ever cover rows that
+            # have been written in full.
+            f.attrs["num_halos"] = n_new
+            f.attrs["num_processed"] = p_new
+        mylog.info("Wrote %d halos to %s, %d processed so far.",
+                   n_new - n_old, self._catalog_file, p_new)
+        self.catalog = []
+        self._processed_halos = []
+
+    def _finish_catalog_output(self):
+        if using_process_pool():
+            remove_worker_exit_callback(self._finish_catalog_output)
+        self._write_catalog_rows()
+        with h5py.File(self._catalog_file, "a") as f:
+            for key, val in sorted(self.io_stats.items()):
+                f.attrs["io_%s" % key] = val
+
+    def _batched_halos(self, halo_index, batch_size, cache_bytes,
+                       njobs=-1, dynamic=False):
+        r"""
+        Iterate over the halos in halo_index in batches of neighboring halos.
+
+        Halos are sorted by the Morton index of their positions and split into
+        batches of batch_size, which are distributed with parallel_objects.
+        While the halos are processed, fluid fields of the data_ds are read
+        through a grid data cache of at most cache_bytes, whose hits, misses
+        and bytes read end up in the "io_stats" attribute.
+        """
+        x, y, z = (self.data_source["particle_position_%s" % ax].in_units(
+            "code_length").d.astype("float64") for ax in "xyz")
+        morton = compute_morton(x, y, z,
+            self.halos_ds.domain_left_edge.in_units("code_length").d,
+            self.halos_ds.domain_right_edge.in_units("code_length").d)
+        halo_index = halo_index[np.argsort(morton[halo_index], kind="mergesort")]
+        batches = [halo_index[start:start+batch_size] for start in
+                   xrange(0, halo_index.size, batch_size)]
+
+        index = getattr(self.data_ds, "index", None)
+        if not hasattr(index, "cached_grid_data"):
+            for batch in parallel_objects(batches, njobs=njobs, dynamic=dynamic):
+                for i in batch:
+                    yield i
+            return
+        with index.cached_grid_data(cache_bytes) as cache:
+            self.io_stats = cache.stats
+            for batch in parallel_objects(batches, njobs=njobs, dynamic=dynamic):
+                for i in batch:
+                    yield i
+        mylog.info("Read %d grid fields (%0.3e bytes) for %d halos in %d batches, "
+                   "with %d reads served from the cache.",
+                   cache.stats["misses"], cache.stats["bytes_read"],
+                   halo_index.size, len(batches), cache.stats["hits"])
+
     def save_catalog(self):
         "Write out hdf5 file with all halo quantities."
 
@@ -422,15 +707,10 @@ class HaloCatalog(ParallelAnalysisInterface):
                    (n_halos, os.path.join(self.output_dir, 
                                          self.output_prefix)))
         out_file = h5py.File(filename, 'w')
-        for attr in ["current_redshift", "current_time",
-                     "domain_dimensions",
-                     "cosmological_simulation", "omega_lambda",
-                     "omega_matter", "hubble_constant"]:
-            out_file.attrs[attr] = getattr(self.halos_ds, attr)
-        for attr in ["domain_left_edge", "domain_right_edge"]:
-            out_file.attrs[attr] = getattr(self.halos_ds, attr).in_cgs()
-        out_file.attrs["data_type"] = "halo_catalog"
+        self._write_catalog_header(out_file)
         out_file.attrs["num_halos"] = n_halos
+        for key, val in sorted(getattr(self, "io_stats", {}).items()):
+            out_file.attrs["io_%s" % key] = val
         if n_halos > 0:
             field_data = np.empty(n_halos)
             for key in self.quantities:
@@ -443,6 +723,16 @@ class HaloCatalog(ParallelAnalysisInterface):
                 dataset.attrs["units"] = units
         out_file.close()
 
+    def _write_catalog_header(self, out_file):
+        for attr in ["current_redshift", "current_time",
+                     "domain_dimensions",
+                     "cosmological_simulation", "omega_lambda",
+                     "omega_matter", "hubble_constant"]:
+            out_file.attrs[attr] = getattr(self.halos_ds, attr)
+        for attr in ["domain_left_edge", "domain_right_edge"]:
+            out_file.attrs[attr] = getattr(self.halos_ds, attr).in_cgs()
+        out_file.attrs["data_type"] = "halo_catalog"
+
     def add_default_quantities(self, field_type='halos'):
         self.add_quantity("particle_identifier", field_type=field_type,prepend=True)
         self.add_quantity("particle_mass", field_type=field_type,prepend=True)
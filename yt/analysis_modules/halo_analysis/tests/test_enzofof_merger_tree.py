@@ -0,0 +1,131 @@
+"""
+Unit test the EnzoFOF merger tree.
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+
+from yt.testing import *
+from yt.utilities.spatial import cKDTree
+from yt.analysis_modules.halo_analysis.enzofof_merger_tree import \
+    HaloCatalog, EnzoFOFMergerTree, find_halo_relationships, \
+    find_neighboring_halos
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _write_outputs(FOF_directory, noutputs, nhalos, npart):
+    # Halos drift and trade particles from one output to the next, and a few
+    # particles belong to more than one halo.
+    np.random.seed(0x4d3d3d3)
+    pos = np.random.uniform(size=(nhalos, 3))
+    owners = np.random.randint(nhalos, size=npart)
+    for num in range(noutputs):
+        f = open(os.path.join(FOF_directory, "groups_%05i.dat" % num), "w")
+        f.write("# Redshift = %0.6f\n" % (noutputs - num))
+        f.write("# x y z mass\n")
+        for x, y, z in pos:
+            f.write("%0.8f %0.8f %0.8f 1.0\n" % (x, y, z))
+        f.close()
+        f = h5py.File(os.path.join(FOF_directory,
+                                   "particles_%05i.h5" % num), "w")
+        for hid in range(nhalos):
+            ids = np.where(owners == hid)[0]
+            extra = np.random.randint(npart, size=2)
+            f.create_dataset("Halo%08i/Particle ID" % hid,
+                             data=np.concatenate([ids, extra]))
+        f.close()
+        pos = (pos + np.random.normal(scale=0.01, size=pos.shape)) % 1.0
+        moving = np.random.uniform(size=npart) < 0.1
+        owners[moving] = np.random.randint(nhalos, size=moving.sum())
+
+def _reference_fractions(HC1, HC2, radius):
+    # One pair of halos at a time, as in the original implementation.
+    pfrac = {}
+    for hid1 in range(HC1.halo_positions.shape[0]):
+        pfrac[hid1] = {}
+        HPL1 = HC1.read_particle_ids(hid1)
+        dist = np.sqrt(((HC2.halo_positions -
+                         HC1.halo_positions[hid1])**2).sum(axis=1))
+        for hid2 in np.where(dist <= radius)[0].tolist():
+            HPL2 = HC2.read_particle_ids(hid2)
+            p1, p2 = HPL1.find_relative_parentage(HPL2)
+            pfrac[hid1][hid2] = (p1, p2, HPL2.number_of_particles)
+        pfrac[hid1]["NumberOfParticles"] = HPL1.number_of_particles
+    return pfrac
+
+def test_neighboring_halos():
+    np.random.seed(0x4d3d3d3)
+    pos1 = np.random.uniform(size=(200, 3))
+    pos2 = np.random.uniform(size=(300, 3))
+    for radius in [0.0, 0.05, 0.3, 2.0]:
+        hid1, hid2 = find_neighboring_halos(cKDTree(pos2), pos1, radius)
+        dist = np.sqrt(((pos1[:,None,:] - pos2[None,:,:])**2).sum(axis=2))
+        ref1, ref2 = np.where(dist <= radius)
+        yield assert_equal, hid1, ref1
+        yield assert_equal, hid2, ref2
+
+def test_halo_relationships():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        _write_outputs(tmpdir, 3, 150, 20000)
+        HC1 = HaloCatalog(0, FOF_directory=tmpdir)
+        HC2 = HaloCatalog(1, FOF_directory=tmpdir)
+        for radius in [0.05, 0.10, 0.5]:
+            pfrac = HC1.calculate_parentage_fractions(HC2, radius)
+            answer = _reference_fractions(HC1, HC2, radius)
+            yield assert_equal, pfrac, answer
+        z0, z1, pfrac = find_halo_relationships(
+            0, 1, output_basename=os.path.join(tmpdir, "tree"),
+            FOF_directory=tmpdir)
+        yield assert_equal, (z0, z1), (3.0, 2.0)
+        yield assert_equal, pfrac, _reference_fractions(HC1, HC2, 0.10)
+        yield assert_equal, \
+            os.path.exists(os.path.join(tmpdir, "tree.txt")), True
+        HPL = HC1.read_particle_ids(0)
+        yield assert_equal, HPL.find_nearest(HC2.halo_kdtree, 0.10), \
+            sorted(pfrac[0].keys())[:-1]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_incremental_merger_tree():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        _write_outputs(tmpdir, 4, 50, 5000)
+        mt = EnzoFOFMergerTree(cycle_range=(0, 2), FOF_directory=tmpdir)
+        yield assert_equal, sorted(mt.relationships), [1, 2]
+        answer = EnzoFOFMergerTree(FOF_directory=tmpdir, reuse_saved=False,
+                                   save_filename="answer.cpkl")
+        # Only the pair of outputs that is new has to be matched.
+        found = []
+        calculate = HaloCatalog.calculate_parentage_fractions
+        def _counted(self, other, radius=0.10):
+            found.append((self.output_id, other.output_id))
+            return calculate(self, other, radius)
+        HaloCatalog.calculate_parentage_fractions = _counted
+        try:
+            mt = EnzoFOFMergerTree(FOF_directory=tmpdir)
+        finally:
+            HaloCatalog.calculate_parentage_fractions = calculate
+        yield assert_equal, found, [(3, 2)]
+        yield assert_equal, mt.relationships, answer.relationships
+        yield assert_equal, mt.redshifts, answer.redshifts
+        mt = EnzoFOFMergerTree(load_saved=True, FOF_directory=tmpdir)
+        yield assert_equal, mt.relationships, answer.relationships
+        mt.build_tree(0)
+        yield assert_equal, sorted(mt.levels), [1, 2, 3]
+    finally:
+        shutil.rmtree(tmpdir)
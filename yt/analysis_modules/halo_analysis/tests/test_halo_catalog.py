@@ -0,0 +1,203 @@
+"""
+Unit test the halo_analysis analysis module.
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import glob
+import os
+import h5py
+import numpy as np
+
+from yt.testing import *
+from yt.mods import load
+from yt.frontends.stream.api import load_uniform_grid
+from yt.analysis_modules.halo_analysis.halo_catalog import \
+    HaloCatalog
+from yt.analysis_modules.halo_analysis.halo_quantities import \
+    add_quantity
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _sphere_density(halo):
+    if halo.data_object is None:
+        return halo.halo_catalog.data_ds.quan(0.0, "g/cm**3")
+    return halo.data_object["density"].sum()
+
+add_quantity("sphere_density", _sphere_density)
+
+# The number of halos counted so far, and how many to count before giving
+# up, as if the job had run out of time.
+_halo_count = [0, None]
+
+def _count_halo(halo):
+    _halo_count[0] += 1
+    if _halo_count[1] is not None and _halo_count[0] > _halo_count[1]:
+        raise RuntimeError("Out of time.")
+    return halo.quantities["particle_identifier"]
+
+add_quantity("halo_count", _count_halo)
+
+def _fake_ds(n, nprocs):
+    np.random.seed(0x4d3d3d3)
+    data = {"density": (np.random.uniform(size=(n,n,n)), "g/cm**3")}
+    return load_uniform_grid(data, (n,n,n), nprocs=nprocs)
+
+def _write_halos(filename, nhalos, radius):
+    # Halos come in clumps, so that the spheres of neighbors overlap.
+    np.random.seed(0x4d3d3d3)
+    centers = np.random.uniform(0.2, 0.8, size=(8, 3))
+    pos = centers[np.random.randint(8, size=nhalos)] + \
+        np.random.normal(scale=radius, size=(nhalos, 3))
+    pos = np.clip(pos, 0.01, 0.99)
+    f = h5py.File(filename, "w")
+    for attr in ["current_redshift", "current_time", "omega_lambda",
+                 "omega_matter", "hubble_constant"]:
+        f.attrs[attr] = 0.0
+    f.attrs["cosmological_simulation"] = 0
+    f.attrs["domain_dimensions"] = np.ones(3, dtype="int32")
+    f.attrs["domain_left_edge"] = np.zeros(3)
+    f.attrs["domain_right_edge"] = np.ones(3)
+    f.attrs["data_type"] = "halo_catalog"
+    f.attrs["num_halos"] = nhalos
+    fields = {"particle_identifier": (np.arange(nhalos), ""),
+              "particle_mass": (1.0 + np.arange(nhalos) % 3, "g"),
+              "particle_position_x": (pos[:,0], "cm"),
+              "particle_position_y": (pos[:,1], "cm"),
+              "particle_position_z": (pos[:,2], "cm"),
+              "virial_radius": (np.ones(nhalos) * radius, "cm")}
+    for field, (data, units) in fields.items():
+        d = f.create_dataset(field, data=data.astype("float64"))
+        d.attrs["units"] = units
+    f.close()
+
+def _halo_catalog(halos_ds, data_ds, output_dir):
+    hc = HaloCatalog(halos_ds=halos_ds, data_ds=data_ds,
+                     output_dir=output_dir)
+    hc.add_callback("sphere", factor=2.0)
+    hc.add_quantity("sphere_density")
+    return hc
+
+def test_batched_halo_catalog():
+    with process_pool_test_dir():
+        _write_halos("halos.0.h5", 100, 0.04)
+        halos_ds = load("halos.0.h5")
+        data_ds = _fake_ds(32, 64)
+        hc = _halo_catalog(halos_ds, data_ds, "unbatched")
+        hc.create(save_catalog=False)
+        answer = [h["sphere_density"] for h in hc.catalog]
+        yield assert_equal, hc.io_stats, {}
+        for batch_size in [1, 8, 1000]:
+            hc = _halo_catalog(halos_ds, data_ds, "batched_%d" % batch_size)
+            hc.create(batch_size=batch_size)
+            yield assert_equal, len(hc.catalog), len(answer)
+            yield assert_rel_equal, \
+                np.array([h["sphere_density"] for h in hc.catalog]), \
+                np.array(answer), 12
+            yield assert_equal, hc.io_stats["hits"] > hc.io_stats["misses"], \
+                True
+            f = h5py.File(os.path.join("batched_%d" % batch_size,
+                                       "batched_%d.0.h5" % batch_size), "r")
+            yield assert_equal, f.attrs["io_misses"], hc.io_stats["misses"]
+            f.close()
+        # With room for a single grid, every grid is read again, but the
+        # halos still come out right.
+        hc = _halo_catalog(halos_ds, data_ds, "small_cache")
+        hc.create(save_catalog=False, batch_size=8,
+                  cache_bytes=16**3 * 8)
+        yield assert_rel_equal, \
+            np.array([h["sphere_density"] for h in hc.catalog]), \
+            np.array(answer), 12
+        yield assert_equal, hc.io_stats["evictions"] > 0, True
+
+def _checkpointed_catalog(halos_ds, data_ds, output_dir):
+    hc = HaloCatalog(halos_ds=halos_ds, data_ds=data_ds,
+                     output_dir=output_dir)
+    hc.add_filter("quantity_value", "particle_mass", ">", 1.5, "g")
+    hc.add_callback("sphere")
+    hc.add_quantity("sphere_density")
+    hc.add_quantity("halo_count")
+    return hc
+
+def _read_catalog(output_dir):
+    fields = {}
+    for fn in glob.glob(os.path.join(output_dir, "%s.*.h5" % output_dir)):
+        f = h5py.File(fn, "r")
+        n = f.attrs["num_halos"]
+        for field in f:
+            if not isinstance(f[field], h5py.Dataset): continue
+            fields.setdefault(field, []).append(f[field][:n])
+        f.close()
+    fields = dict((field, np.concatenate(vals))
+                  for field, vals in fields.items())
+    order = np.argsort(fields["particle_identifier"])
+    return dict((field, vals[order]) for field, vals in fields.items())
+
+def test_halo_catalog_checkpoints():
+    with process_pool_test_dir() as use_processes:
+        try:
+            _write_halos("halos.0.h5", 100, 0.04)
+            halos_ds = load("halos.0.h5")
+            data_ds = _fake_ds(16, 8)
+            hc = _checkpointed_catalog(halos_ds, data_ds, "whole")
+            hc.create()
+            answer = _read_catalog("whole")
+            nrows = answer["particle_identifier"].size
+            yield assert_equal, nrows, 66
+            # Rows written as we go come out the same, and are not kept.
+            hc = _checkpointed_catalog(halos_ds, data_ds, "streamed")
+            hc.create(checkpoint_interval=7)
+            yield assert_equal, len(hc.catalog), 0
+            streamed = _read_catalog("streamed")
+            for field in answer:
+                yield assert_equal, streamed[field], answer[field]
+            # Stop halfway through, then pick up where we left off.
+            _halo_count[:] = [0, 45]
+            hc = _checkpointed_catalog(halos_ds, data_ds, "resumed")
+            assert_raises(RuntimeError, hc.create, checkpoint_interval=10)
+            written = _read_catalog("resumed")["particle_identifier"].size
+            yield assert_equal, 0 < written < nrows, True
+            _halo_count[:] = [0, None]
+            hc = _checkpointed_catalog(halos_ds, data_ds, "resumed")
+            hc.create(checkpoint_interval=10, resume=True)
+            yield assert_equal, _halo_count[0], nrows - written
+            resumed = _read_catalog("resumed")
+            for field in answer:
+                yield assert_equal, resumed[field], answer[field]
+            ds = load("resumed/resumed.0.h5")
+            yield assert_equal, \
+                np.sort(ds.all_data()["halos", "particle_identifier"].d), \
+                answer["particle_identifier"]
+            # There is nothing left to do for a finished catalog.
+            _halo_count[:] = [0, None]
+            hc = _checkpointed_catalog(halos_ds, data_ds, "whole")
+            hc.create(resume=True)
+            yield assert_equal, _halo_count[0], 0
+            whole = _read_catalog("whole")
+            for field in answer:
+                yield assert_equal, whole[field], answer[field]
+            # The halos left over are shared out among worker processes, each of
+            # which writes its own file.
+            _halo_count[:] = [0, 30]
+            hc = _checkpointed_catalog(halos_ds, data_ds, "workers")
+            assert_raises(RuntimeError, hc.create, checkpoint_interval=5)
+            _halo_count[:] = [0, None]
+            use_processes(3)
+            hc = _checkpointed_catalog(halos_ds, data_ds, "workers")
+            hc.create(checkpoint_interval=5, resume=True, dynamic=True,
+                      njobs=3)
+            yield assert_equal, len(glob.glob("workers/workers.*.h5")), 3
+            workers = _read_catalog("workers")
+            for field in answer:
+                yield assert_equal, workers[field], answer[field]
+        finally:
+            _halo_count[:] = [0, None]
@@ -12,9 +12,8 @@ Particle trajectories
 
 from yt.data_objects.data_containers import YTFieldData
 from yt.data_objects.time_series import DatasetSeries
-from yt.utilities.lib.CICDeposit import CICSample_3
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
-    parallel_root_only
+    parallel_root_only, communication_system, using_process_pool
 from yt.funcs import *
 from yt.units.yt_array import array_like_field
 from yt.config import ytcfg
@@ -47,6 +46,15 @@ class ParticleTrajectories(object):
         Suppress yt's logging when iterating over the simulation time
         series.
         Default : False
+    filename : string, optional
+        If given, the trajectories are kept in this HDF5 file rather than
+        in memory.  It holds the particle indices, the times and one
+        dataset for each field, and every field of the collection is a
+        memory-mapped view of its dataset, so the trajectories are written
+        to disk as the datasets are read and never need to fit in memory.
+        The datasets are stored with one row per output, so that each
+        output is written contiguously.
+        Default : None
 
     Examples
     ________
@@ -63,7 +71,8 @@ class ParticleTrajectories(object):
     >>> for t in trajs :
     >>>     print t["particle_velocity_x"].max(), t["particle_velocity_x"].min()
     """
-    def __init__(self, outputs, indices, fields=None, suppress_logging=False):
+    def __init__(self, outputs, indices, fields=None, suppress_logging=False,
+                 filename=None):
 
         indices.sort() # Just in case the caller wasn't careful
         self.field_data = YTFieldData()
@@ -71,14 +80,13 @@ class ParticleTrajectories(object):
             self.data_series = outputs
         else:
             self.data_series = DatasetSeries(outputs)
-        self.masks = []
-        self.sorts = []
-        self.array_indices = []
         self.indices = indices
         self.num_indices = len(indices)
         self.num_steps = len(outputs)
         self.times = []
         self.suppress_logging = suppress_logging
+        self.filename = filename
+        self.comm = communication_system.communicators[-1]
 
         # Default fields 
         
@@ -88,40 +96,18 @@ class ParticleTrajectories(object):
         fields.append("particle_position_z")
         fields = list(OrderedDict.fromkeys(fields))
 
-        if self.suppress_logging:
-            old_level = int(ytcfg.get("yt","loglevel"))
-            mylog.setLevel(40)
-        my_storage = {}
-        pbar = get_pbar("Constructing trajectory information", len(self.data_series))
-        for i, (sto, ds) in enumerate(self.data_series.piter(storage=my_storage)):
-            dd = ds.all_data()
-            idx_field = dd._determine_fields("particle_index")[0]
-            newtags = dd[idx_field].ndarray_view().astype("int64")
-            mask = np.in1d(newtags, indices, assume_unique=True)
-            sorts = np.argsort(newtags[mask])
-            self.array_indices.append(np.where(np.in1d(indices, newtags, assume_unique=True))[0])
-            self.masks.append(mask)
-            self.sorts.append(sorts)
-            sto.result_id = ds.parameter_filename
-            sto.result = ds.current_time
-            pbar.update(i)
-        pbar.finish()
-
-        if self.suppress_logging:
-            mylog.setLevel(old_level)
-
-        times = []
-        for fn, time in sorted(my_storage.items()):
-            times.append(time)
-
-        self.times = self.data_series[0].arr([time for time in times], times[0].units)
+        if self.filename is not None and self.comm.rank == 0:
+            fid = h5py.File(self.filename, "w")
+            fid.create_dataset("particle_indices", dtype=np.int64,
+                               data=self.indices)
+            fid.close()
 
         self.particle_fields = []
 
-        # Instantiate fields the caller requested
+        # Instantiate fields the caller requested, reading the times along
+        # with them
 
-        for field in fields:
-            self._get_data(field)
+        self._get_data(fields)
 
     def has_key(self, key):
         return (key in self.field_data)
@@ -136,7 +122,7 @@ class ParticleTrajectories(object):
         if key == "particle_time":
             return self.times
         if not self.field_data.has_key(key):
-            self._get_data(key)
+            self._get_data([key])
         return self.field_data[key]
     
     def __setitem__(self, key, val):
@@ -173,7 +159,8 @@ class ParticleTrajectories(object):
 
     def add_fields(self, fields):
         """
-        Add a list of fields to an existing trajectory
+        Add a list of fields to an existing trajectory.  All of the new
+        fields are read from each dataset in a single pass.
 
         Parameters
         ----------
@@ -187,65 +174,151 @@ class ParticleTrajectories(object):
         >>> trajs = ParticleTrajectories(my_fns, indices)
         >>> trajs.add_fields(["particle_mass", "particle_gpot"])
         """
-        for field in fields:
-            if not self.field_data.has_key(field):
-                self._get_data(field)
-                
-    def _get_data(self, field):
+        self._get_data(fields)
+
+
+    def _get_data(self, fields):
         """
-        Get a field to include in the trajectory collection.
-        The trajectory collection itself is a dict of 2D numpy arrays,
-        with shape (num_indices, num_steps)
+        Get fields to include in the trajectory collection.
+        The trajectory collection itself is a dict of 2D arrays,
+        with shape (num_indices, num_steps).  Each dataset is read once
+        for all of the fields, and the particles are picked out by a
+        search of the sorted indices.
         """
-        if not self.field_data.has_key(field):
-            if self.suppress_logging:
-                old_level = int(ytcfg.get("yt","loglevel"))
-                mylog.setLevel(40)
-            ds_first = self.data_series[0]
-            dd_first = ds_first.all_data()
+        fields = [field for field in OrderedDict.fromkeys(fields)
+                  if not self.field_data.has_key(field)]
+        if len(fields) == 0 and len(self.times) > 0:
+            return
+        if self.suppress_logging:
+            old_level = int(ytcfg.get("yt","loglevel"))
+            mylog.setLevel(40)
+        ds_first = self.data_series[0]
+        dd_first = ds_first.all_data()
+        fds = {}
+        for field in fields:
             fd = dd_first._determine_fields(field)[0]
+            fds[field] = fd
             if field not in self.particle_fields:
-                if self.data_series[0].field_info[fd].particle_type:
+                if ds_first.field_info[fd].particle_type:
                     self.particle_fields.append(field)
-            particles = np.empty((self.num_indices,self.num_steps))
-            particles[:] = np.nan
-            step = int(0)
-            pbar = get_pbar("Generating field %s in trajectories." % (field), self.num_steps)
-            my_storage={}
-            for i, (sto, ds) in enumerate(self.data_series.piter(storage=my_storage)):
-                mask = self.masks[i]
-                sort = self.sorts[i]
-                if field in self.particle_fields:
-                    # This is easy... just get the particle fields
-                    dd = ds.all_data()
-                    pfield = dd[fd].ndarray_view()[mask][sort]
-                else:
-                    # This is hard... must loop over grids
-                    pfield = np.zeros((self.num_indices))
-                    x = self["particle_position_x"][:,step].ndarray_view()
-                    y = self["particle_position_y"][:,step].ndarray_view()
-                    z = self["particle_position_z"][:,step].ndarray_view()
-                    # This will fail for non-grid index objects
-                    particle_grids, particle_grid_inds = ds.index._find_points(x,y,z)
-                    for grid in particle_grids:
-                        cube = grid.retrieve_ghost_zones(1, [fd])
-                        CICSample_3(x,y,z,pfield,
-                                    self.num_indices,
-                                    cube[fd],
-                                    np.array(grid.LeftEdge).astype(np.float64),
-                                    np.array(grid.ActiveDimensions).astype(np.int32),
-                                    grid.dds[0])
-                sto.result_id = ds.parameter_filename
-                sto.result = (self.array_indices[i], pfield)
-                pbar.update(step)
-                step += 1
-            pbar.finish()
-            for i, (fn, (indices, pfield)) in enumerate(sorted(my_storage.items())):
-                particles[indices,i] = pfield
-            self.field_data[field] = array_like_field(dd_first, particles, fd)
-            if self.suppress_logging:
-                mylog.setLevel(old_level)
-        return self.field_data[field]
+        grid_fields = [field for field in fields
+                       if field not in self.particle_fields]
+        pos_fields = ["particle_position_%s" % ax for ax in "xyz"]
+        read_fields = [field for field in fields
+                       if field in self.particle_fields]
+        # Non-particle fields are sampled at the particle positions
+        if len(grid_fields) > 0:
+            read_fields += [field for field in pos_fields
+                            if field not in read_fields]
+        # Only the root process writes to the trajectory file.
+        writable = self.filename is None or self.comm.rank == 0
+        if writable:
+            particles = self._allocate_fields(fields)
+        # Without parallelism each dataset is written out as soon as it has
+        # been read; otherwise the results are collected first.
+        stream = not (ytcfg.getboolean("yt", "__parallel") or
+                      using_process_pool())
+        my_storage = {}
+        pbar = get_pbar("Constructing trajectory information", self.num_steps)
+        for i, (sto, ds) in enumerate(self.data_series.piter(storage=my_storage)):
+            dd = ds.all_data()
+            idx_field = dd._determine_fields("particle_index")[0]
+            dd.get_data([idx_field] +
+                        [dd._determine_fields(field)[0] for field in read_fields])
+            newtags = dd[idx_field].ndarray_view().astype("int64")
+            array_indices = np.searchsorted(self.indices, newtags)
+            selected = np.where(self.indices[array_indices.clip(
+                max=self.num_indices - 1)] == newtags)[0]
+            array_indices = array_indices[selected]
+            values = {}
+            for field in read_fields:
+                values[field] = \
+                    dd[dd._determine_fields(field)[0]].ndarray_view()[selected]
+            if len(grid_fields) > 0:
+                # This will fail for non-grid index objects
+                pos = np.column_stack([values[field] for field in pos_fields])
+                samples = ds.index.sample_field_values_at_points(
+                    [fds[field] for field in grid_fields], pos)
+                for field, pfield in zip(grid_fields, samples):
+                    values[field] = pfield
+            if stream:
+                for field in fields:
+                    particles[field][array_indices,i] = values[field]
+                sto.result = (ds.current_time, None, None)
+            else:
+                sto.result = (ds.current_time, array_indices, values)
+            pbar.update(i)
+        pbar.finish()
+        # The storage is keyed by position in the series
+        times = []
+        for step, (result_id, (time, array_indices, values)) in \
+                enumerate(sorted(my_storage.items())):
+            times.append(time)
+            if writable and not stream:
+                for field in fields:
+                    particles[field][array_indices,step] = values[field]
+        if len(self.times) == 0:
+            self.times = ds_first.arr([time for time in times], times[0].units)
+        if self.filename is not None:
+            if writable:
+                for field in fields:
+                    particles[field].flush()
+                fid = h5py.File(self.filename, "a")
+                if "particle_time" not in fid:
+                    fid.create_dataset("particle_time", data=self.times)
+                fid.close()
+            self.comm.barrier()
+            if not writable:
+                particles = self._open_fields(fields, "r")
+        for field in fields:
+            self.field_data[field] = array_like_field(dd_first,
+                                                      particles[field],
+                                                      fds[field])
+        if self.suppress_logging:
+            mylog.setLevel(old_level)
+
+    def _allocate_fields(self, fields):
+        """
+        Create the arrays for new fields, filled with NaN for the outputs
+        in which a particle is missing.  With a trajectory file, these are
+        contiguous datasets in the file, mapped into memory.
+        """
+        if self.filename is None:
+            particles = {}
+            for field in fields:
+                particles[field] = np.empty((self.num_indices,self.num_steps))
+                particles[field][:] = np.nan
+            return particles
+        fid = h5py.File(self.filename, "a")
+        for field in fields:
+            if field in fid: del fid[field]
+            # Allocate the dataset up front, so that it has a fixed place in
+            # the file that can be mapped.
+            dcpl = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+            dcpl.set_alloc_time(h5py.h5d.ALLOC_TIME_EARLY)
+            dcpl.set_fill_time(h5py.h5d.FILL_TIME_ALLOC)
+            dcpl.set_fill_value(np.array(np.nan))
+            space = h5py.h5s.create_simple((self.num_steps, self.num_indices))
+            h5py.h5d.create(fid.id, field, h5py.h5t.NATIVE_DOUBLE, space,
+                            dcpl=dcpl)
+        fid.close()
+        return self._open_fields(fields, "r+")
+
+    def _open_fields(self, fields, mode):
+        """
+        Map the datasets of *fields* in the trajectory file into memory,
+        transposed to shape (num_indices, num_steps).
+        """
+        fid = h5py.File(self.filename, "r")
+        offsets = dict((field, fid[field].id.get_offset()) for field in fields)
+        fid.close()
+        particles = {}
+        for field in fields:
+            particles[field] = np.memmap(self.filename, dtype="float64",
+                                         mode=mode, offset=offsets[field],
+                                         shape=(self.num_steps,
+                                                self.num_indices)).T
+        return particles
 
     def trajectory_from_index(self, index):
         """
@@ -338,7 +411,7 @@ class ParticleTrajectories(object):
         """
         fid = h5py.File(filename, "w")
         fields = [field for field in sorted(self.field_data.keys())]
-        fid.create_dataset("particle_indices", dtype=np.int32,
+        fid.create_dataset("particle_indices", dtype=np.int64,
                            data=self.indices)
         fid.create_dataset("particle_time", data=self.times)
         for field in fields:
@@ -0,0 +1,115 @@
+"""
+Unit test the particle_trajectories analysis module.
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+
+from yt.testing import *
+from yt.frontends.stream.api import load_uniform_grid
+from yt.data_objects.time_series import DatasetSeries
+from yt.analysis_modules.particle_trajectories.api import \
+    ParticleTrajectories
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _fake_series(n_particles, n_steps, n_missing=0, dims=16, first_index=0):
+    # Particles move along x and come out in a different order in each
+    # output; the last n_missing are absent from the second output.
+    np.random.seed(0x4d3d3d3)
+    index = np.arange(n_particles, dtype="int64") + first_index
+    x0 = np.random.uniform(0.2, 0.6, n_particles)
+    y = np.random.uniform(0.2, 0.8, n_particles)
+    z = np.random.uniform(0.2, 0.8, n_particles)
+    outputs = []
+    for step in range(n_steps):
+        order = np.random.permutation(n_particles)
+        if step == 1 and n_missing > 0:
+            order = order[order < n_particles - n_missing]
+        data = {"density": np.ones((dims, dims, dims)),
+                "number_of_particles": order.size,
+                "particle_index": index[order],
+                "particle_position_x": x0[order] + 0.01 * step,
+                "particle_position_y": y[order],
+                "particle_position_z": z[order],
+                "particle_mass": index[order] + 1000.0 * step}
+        ds = load_uniform_grid(data, (dims, dims, dims), 1.0)
+        ds.current_time = ds.quan(float(step), "code_time")
+        outputs.append(ds)
+    return DatasetSeries(outputs), x0
+
+def test_particle_trajectories():
+    n_particles, n_steps = 100, 4
+    ts, x0 = _fake_series(n_particles, n_steps, n_missing=5)
+    indices = np.arange(0, n_particles, 3)[::-1].copy()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for filename in (None, os.path.join(tmpdir, "trajectories.h5")):
+            trajs = ParticleTrajectories(ts, indices,
+                                         fields=["particle_mass"],
+                                         filename=filename)
+            yield assert_equal, trajs.indices, np.sort(indices)
+            yield assert_equal, trajs["particle_time"].d, np.arange(n_steps)
+            x = trajs["particle_position_x"].d
+            mass = trajs["particle_mass"].d
+            missing = trajs.indices >= n_particles - 5
+            for step in range(n_steps):
+                answer = x0[trajs.indices] + 0.01 * step
+                if step == 1:
+                    yield assert_equal, np.isnan(x[:,step]), missing
+                    yield assert_equal, x[~missing,step], answer[~missing]
+                else:
+                    yield assert_equal, x[:,step], answer
+                    yield assert_equal, mass[:,step], \
+                        trajs.indices + 1000.0 * step
+            # Grid fields are sampled at the particle positions.
+            trajs.add_fields(["density"])
+            yield assert_almost_equal, trajs["density"][~missing,:].d, 1.0
+            if filename is not None:
+                base = mass
+                while not isinstance(base, np.memmap) and \
+                  base.base is not None:
+                    base = base.base
+                yield assert_equal, isinstance(base, np.memmap), True
+                del trajs, x, mass, base
+                f = h5py.File(filename, "r")
+                yield assert_equal, f["particle_indices"][:], np.sort(indices)
+                yield assert_equal, f["particle_mass"].shape, \
+                    (n_steps, indices.size)
+                yield assert_equal, f["particle_mass"][0,:], np.sort(indices)
+                yield assert_almost_equal, f["density"][0,:], 1.0
+                f.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_particle_trajectories_large_indices():
+    # Particle indices beyond the range of an int32 are stored as they are.
+    first = 2**40
+    ts, x0 = _fake_series(20, 2, first_index=first)
+    indices = np.arange(first, first + 20, 2)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "trajectories.h5")
+        trajs = ParticleTrajectories(ts, indices, filename=filename)
+        yield assert_equal, trajs["particle_position_x"][:,0].d, \
+            x0[indices - first]
+        del trajs
+        f = h5py.File(filename, "r")
+        yield assert_equal, f["particle_indices"][:], indices
+        f.close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -10,12 +10,15 @@ Generating PPV FITS cubes
 # The full license is in the file COPYING.txt, distributed with this software.
 #-----------------------------------------------------------------------------
 
+import os
 import numpy as np
 from yt.utilities.on_demand_imports import _astropy
 from yt.utilities.orientation import Orientation
-from yt.utilities.fits_image import FITSImageBuffer
-from yt.visualization.volume_rendering.camera import off_axis_projection
-from yt.funcs import get_pbar
+from yt.units.yt_array import YTQuantity
+from yt.utilities.parallel_tools.parallel_analysis_interface import \
+    using_process_pool
+from yt.utilities.parallel_tools.process_pool import process_map
+from yt.funcs import iterable
 
 def create_vlos(z_hat):
     def _v_los(field, data):
@@ -25,9 +28,18 @@ def create_vlos(z_hat):
         return -vz
     return _v_los
 
+def _sum_by_key(keys, values):
+    # Add up the values that share a key; returns the distinct keys and
+    # their sums.
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=values, minlength=keys.size)
+
 class PPVCube(object):
+    _max_subsamples = 8
+    _fits_slab_size = 1 << 24
+
     def __init__(self, ds, normal, field, width=(1.0,"unitary"),
-                 dims=(100,100,100), velocity_bounds=None):
+                 dims=(100,100,100), velocity_bounds=None, filename=None):
         r""" Initialize a PPVCube object.
 
         Parameters
@@ -47,6 +59,17 @@ class PPVCube(object):
             A 3-tuple of (vmin, vmax, units) for the velocity bounds to
             integrate over. If None, the largest velocity of the
             dataset will be used, e.g. velocity_bounds = (-v.max(), v.max())
+        filename : string, optional
+            If supplied, the cube is built in a NumPy ``.npy`` file of this
+            name, memory-mapped as *data*, rather than in memory.
+
+        Notes
+        -----
+        The cube is made in a single pass over the data, with each cell
+        depositing its intensity into the pixels it covers and the two
+        velocity channels on either side of its line-of-sight velocity.
+        If parallelism has been enabled with the multiprocessing backend,
+        the chunks of the data are spread over the worker processes.
 
         Examples
         --------
@@ -91,18 +114,104 @@ class PPVCube(object):
         _vlos = create_vlos(orient.unit_vectors[2])
         ds.field_info.add_field(("gas","v_los"), function=_vlos, units="cm/s")
 
-        self.data = ds.arr(np.zeros((self.nx,self.ny,self.nv)), self.field_units)
-        pbar = get_pbar("Generating cube.", self.nv)
-        for i in xrange(self.nv):
-            _intensity = self._create_intensity(i)
-            ds.add_field(("gas","intensity"), function=_intensity, units=self.field_units)
-            prj = off_axis_projection(ds, ds.domain_center, normal, width,
-                                      (self.nx, self.ny), "intensity")
-            self.data[:,:,i] = prj[:,:]
-            ds.field_info.pop(("gas","intensity"))
-            pbar.update(i)
+        # The image plane is laid out as it is by off_axis_projection.
+        self._unit_vectors = Orientation(normal).unit_vectors.d
+        if iterable(width):
+            width = ds.quan(width[0], width[1])
+        elif not isinstance(width, YTQuantity):
+            width = ds.quan(width, "code_length")
+        self._width = width.in_units("code_length").d
+
+        if filename is None:
+            data = np.zeros((self.nx,self.ny,self.nv))
+        else:
+            data = np.lib.format.open_memmap(filename, mode="w+",
+                                             dtype="float64",
+                                             shape=(self.nx,self.ny,self.nv))
+        self.data = ds.arr(data, self.field_units)
+        self._make_cube(data)
+        if filename is not None:
+            data.flush()
+
+    def _make_cube(self, cube):
+        r"""Deposit the intensity of every cell in the region seen by the
+        cube into all of its velocity channels at once, as a histogram
+        over (x, y, v_los), reading each chunk of the region a single time.
+        """
+        c = self.ds.domain_center.in_units("code_length").d
+        hw = 0.5*self._width*np.abs(self._unit_vectors).sum(axis=0)
+        reg = self.ds.region(self.ds.domain_center, c-hw, c+hw)
+        flat = cube.reshape(-1)
+        if using_process_pool():
+            # Each worker adds up the deposits of its share of the chunks
+            # and hands back the elements of the cube it touched, to be
+            # added in here.
+            def _deposit(worker_id, nworkers):
+                keys, values = np.zeros(0, "int64"), np.zeros(0)
+                chunks = reg.chunks([], "io")
+                for i, chunk in enumerate(chunks):
+                    if i % nworkers != worker_id: continue
+                    ckeys, cvalues = self._deposit_chunk(chunk)
+                    keys, values = _sum_by_key(
+                        np.concatenate([keys, ckeys]),
+                        np.concatenate([values, cvalues]))
+                return keys, values
+            for keys, values in process_map(_deposit):
+                np.add.at(flat, keys, values)
+            return
+        for chunk in reg.chunks([], "io"):
+            keys, values = self._deposit_chunk(chunk)
+            np.add.at(flat, keys, values)
 
-        pbar.finish()
+    def _deposit_chunk(self, chunk):
+        # Each cell contributes its intensity times its volume, spread over
+        # the area of a pixel, which is the integral of the intensity along
+        # the line of sight through that pixel.  Cells that are wider than
+        # a pixel are split into subcells so that they cover the pixels
+        # behind them.  Returns the indices into the flattened cube of
+        # the elements the deposit touches, and what it adds to each.
+        pos = np.array([chunk["index", ax].in_units("code_length").d
+                        for ax in "xyz"]).T
+        pos -= self.ds.domain_center.in_units("code_length").d
+        dx = chunk["index", "dx"].in_units("code_length").d
+        intensity = chunk[self.field].in_units(self.field_units).d
+        vlos = -sum(chunk["gas", "velocity_%s" % ax].in_units(self.dv.units).d*z
+                    for ax, z in zip("xyz", self._unit_vectors[2]))
+        if dx.size == 0:
+            return np.zeros(0, "int64"), np.zeros(0)
+        width = self._width
+        pw = width/self.nx, width/self.ny
+        weight = intensity*dx**3/(pw[0]*pw[1])
+        # The triangular velocity kernel of each channel overlaps the two
+        # channels whose centers bracket v_los.
+        u = (vlos - self.vmid[0].in_units(self.dv.units).d)/self.dv.d
+        iv = np.floor(u).astype("int64")
+        frac = u - iv
+        proj = np.dot(pos, self._unit_vectors.T)
+        nsub = np.ceil(dx/min(pw)).astype("int64")
+        np.clip(nsub, 1, self._max_subsamples, nsub)
+        keys, weights = [], []
+        for n in np.unique(nsub):
+            sel = nsub == n
+            offsets = (np.arange(n) + 0.5)/n - 0.5
+            offsets = np.array(np.meshgrid(offsets, offsets, offsets,
+                                           indexing="ij")).reshape(3, -1)
+            offsets = np.dot(self._unit_vectors, offsets)
+            sw = weight[sel]/n**3
+            for i in xrange(offsets.shape[1]):
+                p = proj[sel] + dx[sel,None]*offsets[:,i]
+                ix = np.floor((p[:,0] + 0.5*width)/pw[0]).astype("int64")
+                iy = np.floor((p[:,1] + 0.5*width)/pw[1]).astype("int64")
+                inside = (ix >= 0) & (ix < self.nx) & \
+                         (iy >= 0) & (iy < self.ny) & \
+                         (np.abs(p[:,2]) < 0.5*width)
+                pix = (ix*self.ny + iy)[inside]*self.nv
+                for j, w in ((iv[sel], 1.0 - frac[sel]),
+                             (iv[sel] + 1, frac[sel])):
+                    ok = (j[inside] >= 0) & (j[inside] < self.nv)
+                    keys.append(pix[ok] + j[inside][ok])
+                    weights.append((sw*w)[inside][ok])
+        return _sum_by_key(np.concatenate(keys), np.concatenate(weights))
 
     def write_fits(self, filename, clobber=True, length_unit=(10.0, "kpc"),
                    sky_center=(30.,45.)):
@@ -148,17 +257,25 @@ class PPVCube(object):
         w.wcs.cunit = [length_unit[1],length_unit[1],"m/s"]
         w.wcs.ctype = [types[0],types[1],"VELO-LSR"]
 
-        fib = FITSImageBuffer(self.data.transpose(), fields=self.field, wcs=w)
-        fib[0].header["bunit"] = self.field_units
-        fib[0].header["btype"] = self.field
-
-        fib.writeto(filename, clobber=clobber)
+        # Write the header and then the cube a slab of channels at a time,
+        # so that a cube kept on disk is never read into memory at once.
+        if os.path.exists(filename):
+            if not clobber:
+                raise IOError("File %s already exists." % filename)
+            os.remove(filename)
+        pyfits = _astropy.pyfits
+        header = pyfits.PrimaryHDU(np.zeros((1,1,1))).header
+        header["naxis1"] = self.nx
+        header["naxis2"] = self.ny
+        header["naxis3"] = self.nv
+        for k, v in w.to_header().items():
+            header[k] = v
+        header["bunit"] = self.field_units
+        header["btype"] = self.field
 
-    def _create_intensity(self, i):
-        def _intensity(field, data):
-            vlos = data["v_los"]
-            w = np.abs(vlos-self.vmid[i])/self.dv.in_units(vlos.units)
-            w = 1.-w
-            w[w < 0.0] = 0.0
-            return data[self.field]*w
-        return _intensity
+        fits = pyfits.StreamingHDU(filename, header)
+        nslab = max(self._fits_slab_size//(self.nx*self.ny), 1)
+        for i in xrange(0, self.nv, nslab):
+            slab = self.data.d[:,:,i:i+nslab].transpose()
+            fits.write(np.ascontiguousarray(slab, dtype=">f8"))
+        fits.close()
@@ -0,0 +1,109 @@
+"""
+Unit test the ppv_cube analysis module.
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+from yt.testing import *
+from yt.frontends.stream.api import load_uniform_grid
+from yt.analysis_modules.ppv_cube.api import PPVCube
+from yt.visualization.volume_rendering.camera import off_axis_projection
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _fake_ds(n, density=None):
+    np.random.seed(0x4d3d3d3)
+    if density is None:
+        density = np.random.uniform(size=(n,n,n))
+    data = {"density": (density, "g/cm**3"),
+            "velocity_x": (np.random.normal(size=(n,n,n)), "km/s"),
+            "velocity_y": (np.random.normal(size=(n,n,n)), "km/s"),
+            "velocity_z": (np.random.normal(size=(n,n,n)), "km/s")}
+    return load_uniform_grid(data, (n,n,n), nprocs=8)
+
+def _expected_cube(ds, n, nv, vmax):
+    # Looking down z, the image is laid out along -y and x, and with one
+    # pixel per cell each column of cells lands in a single pixel.
+    dens = ds.all_data()
+    ind = np.lexsort((dens["index","z"], dens["index","y"],
+                      dens["index","x"]))
+    rho = dens["density"].d[ind].reshape(n,n,n)
+    vlos = -dens["velocity_z"].in_units("km/s").d[ind].reshape(n,n,n)
+    vmid = np.linspace(-vmax, vmax, nv+1)
+    dv = vmid[1] - vmid[0]
+    vmid = 0.5*(vmid[1:] + vmid[:-1])
+    w = 1.0 - np.abs(vlos[...,None] - vmid)/dv
+    w[w < 0.0] = 0.0
+    cube = (rho[...,None]*w).sum(axis=2)/n
+    return cube.transpose(1,0,2)[::-1]
+
+def test_ppv_cube():
+    with process_pool_test_dir() as use_processes:
+        ds = _fake_ds(16)
+        answer = _expected_cube(ds, 16, 12, 2.0)
+        cube = PPVCube(ds, [0.0, 0.0, 1.0], "density", dims=(16,16,12),
+                       velocity_bounds=(-2.0, 2.0, "km/s"))
+        yield assert_equal, cube.data.shape, (16,16,12)
+        yield assert_equal, str(cube.data.units), "g/cm**3"
+        yield assert_allclose, cube.data.d, answer, 1e-12
+        # Cells wider than a pixel are split over the pixels they cover.
+        cube = PPVCube(ds, [0.0, 0.0, 1.0], "density", dims=(32,32,12),
+                       velocity_bounds=(-2.0, 2.0, "km/s"))
+        fine = cube.data.d.reshape(16,2,16,2,12).sum(axis=(1,3))/4
+        yield assert_allclose, fine, answer, 1e-12
+        # The cube can be kept on disk rather than in memory.
+        cube = PPVCube(ds, [0.0, 0.0, 1.0], "density", dims=(16,16,12),
+                       velocity_bounds=(-2.0, 2.0, "km/s"),
+                       filename="cube.npy")
+        yield assert_allclose, np.load("cube.npy"), answer, 1e-12
+        # Spreading the chunks over worker processes gives the same cube.
+        use_processes(2)
+        cube = PPVCube(ds, [0.0, 0.0, 1.0], "density", dims=(16,16,12),
+                       velocity_bounds=(-2.0, 2.0, "km/s"))
+        yield assert_allclose, cube.data.d, answer, 1e-12
+
+def test_ppv_cube_off_axis():
+    # A smooth blob away from the center, so that the cube summed over its
+    # channels can be held against a ray-cast projection and so that a
+    # mirrored or transposed image would not pass.
+    n = 32
+    x, y, z = (np.mgrid[0:n,0:n,0:n] + 0.5)/n - 0.5
+    ds = _fake_ds(n, np.exp(-((x-0.1)**2 + (y+0.05)**2 + (z-0.05)**2)/0.02))
+    L = np.array([0.3, 0.5, 0.8])
+    cube = PPVCube(ds, L, "density", dims=(n,n,12),
+                   velocity_bounds=(-20.0, 20.0, "km/s"))
+    image = cube.data.d.sum(axis=2)
+    answer = np.asarray(off_axis_projection(ds, ds.domain_center, L, 1.0,
+                                            (n,n), "density"))
+    yield assert_rel_equal, image.sum(), answer.sum(), 1
+    yield assert_equal, np.abs(image - answer).sum() < 0.15*answer.sum(), \
+        True
+
+@requires_module("astropy")
+def test_ppv_cube_fits():
+    from yt.utilities.on_demand_imports import _astropy
+    with process_pool_test_dir():
+        ds = _fake_ds(16)
+        cube = PPVCube(ds, [0.0, 0.0, 1.0], "density", dims=(16,8,12),
+                       velocity_bounds=(-2.0, 2.0, "km/s"))
+        # Five channels to a slab, so the last slab is a partial one.
+        cube._fits_slab_size = 16*8*5
+        cube.write_fits("cube.fits", length_unit=(5.0, "kpc"))
+        f = _astropy.pyfits.open("cube.fits")
+        yield assert_equal, f[0].data.shape, (12,8,16)
+        yield assert_equal, f[0].data.transpose(), cube.data.d
+        yield assert_equal, f[0].header["naxis3"], 12
+        yield assert_equal, f[0].header["bunit"], "g/cm**3"
+        f.close()
+        yield assert_raises, IOError, cube.write_fits, "cube.fits", False
@@ -42,6 +42,8 @@ ytcfg_defaults = dict(
     loadfieldplugins = 'True',
     pluginfilename = 'my_plugins.py',
     parallel_traceback = 'False',
+    parallel_backend = 'mpi',
+    parallel_processes = '0',
     pasteboard_repo = '',
     reconstruct_index = 'False',
     test_storage_dir = '/does/not/exist',
@@ -57,7 +59,18 @@ ytcfg_defaults = dict(
     answer_tests_url = 'http://answers.yt-project.org/%s_%s',
     sketchfab_api_key = 'None',
     thread_field_detection = 'False',
-    ignore_invalid_unit_operation_errors = 'False'
+    ignore_invalid_unit_operation_errors = 'False',
+    selection_cache_size = '65536',
+    selection_cache_masks = 'False',
+    chunk_cache_bytes = '268435456',
+    chunk_cache_prefetch = 'True',
+    io_threads = '1',
+    index_cache = 'False',
+    lazy_grids = 'False',
+    particle_chunk_size = '16777216',
+    ramses_max_open_files = '32',
+    brick_cache_bytes = '1073741824',
+    render_workers = '1',
     )
 # Here is the upgrade.  We're actually going to parse the file in its entirety
 # here.  Then, if it has any of the Forbidden Sections, it will be rewritten
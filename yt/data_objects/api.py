@@ -48,6 +48,8 @@ from .data_containers import \
     data_object_registry
 
 from . import construction_data_containers as __cdc
+from .construction_data_containers import \
+    project_axes
 from . import selection_data_containers as __sdc
 
 from .image_array import \
@@ -206,6 +206,7 @@ class YTQuadTreeProjBase(YTSelectionContainer2D):
     _type_name = "proj"
     _con_args = ('axis', 'field', 'weight_field')
     _container_fields = ('px', 'py', 'pdx', 'pdy', 'weight_field')
+    _tree_structure = None
     def __init__(self, field, axis, weight_field = None,
                  center = None, ds = None, data_source = None,
                  style = "integrate", field_parameters = None):
@@ -259,28 +260,59 @@ class YTQuadTreeProjBase(YTSelectionContainer2D):
                   self.ds.domain_right_edge[yax],
                   self.ds.domain_left_edge[xax],
                   self.ds.domain_right_edge[yax])
-        return QuadTree(np.array([xd,yd], dtype='int64'), nvals,
+        tree = QuadTree(np.array([xd,yd], dtype='int64'), nvals,
                         bounds, style = self.proj_style)
+        # Once we have projected some fields, we know how the tree is refined
+        # and can rebuild it empty for the next ones.
+        refined = self._tree_structure
+        if refined is not None:
+            tree.frombuffer(refined,
+                            np.zeros((refined.size, nvals), dtype="float64"),
+                            np.zeros(refined.size, dtype="float64"),
+                            self.proj_style)
+        return tree
 
     def get_data(self, fields = None):
         fields = fields or []
         fields = self._determine_fields(ensure_list(fields))
-        # We need a new tree for every single set of fields we add
         if len(fields) == 0: return
+        tree = self._get_tree(len(fields))
+        self._project_chunks([(self, tree)], fields)
+        self._finalize_projection(tree, fields)
+
+    def _project_chunks(self, projections, fields):
+        # This accumulates the chunks of our data source into the trees of one
+        # or more (projection, tree) pairs that share it, reading each chunk
+        # only once.
         chunk_fields = fields[:]
         if self.weight_field is not None:
             chunk_fields.append(self.weight_field)
-        tree = self._get_tree(len(fields))
-        # We do this once
-        for chunk in self.data_source.chunks([], "io", local_only = False):
-            self._initialize_chunk(chunk, tree)
+        # Adding values refines the trees as needed, but with more than one
+        # processor every tree has to be refined the same way before the
+        # values can be combined, so unless we already know the structure of
+        # a tree we first pass over the geometry of all of the chunks.
+        to_initialize = [(proj, tree) for proj, tree in projections
+                         if proj._tree_structure is None]
+        if self.comm.size > 1 and len(to_initialize) > 0:
+            for chunk in self.data_source.chunks([], "io", local_only = False):
+                icoords = chunk.icoords
+                ilevel = chunk.ires * self.ds.ires_factor
+                for proj, tree in to_initialize:
+                    proj._initialize_chunk(tree, icoords, ilevel)
         # This needs to be parallel_objects-ified
         with self.data_source._field_parameter_state(self.field_parameters):
             for chunk in parallel_objects(self.data_source.chunks(
                                           chunk_fields, "io", local_only = True)): 
                 mylog.debug("Adding chunk (%s) to tree (%0.3e GB RAM)", chunk.ires.size,
                     get_memory_usage()/1024.)
-                self._handle_chunk(chunk, fields, tree)
+                icoords = chunk.icoords
+                ilevel = chunk.ires * self.ds.ires_factor
+                for proj, tree in projections:
+                    proj._handle_chunk(chunk, fields, tree, icoords, ilevel)
+        for proj, tree in to_initialize:
+            proj._tree_structure = tree.tobuffer()[0]
+
+    def _finalize_projection(self, tree, fields):
         # Note that this will briefly double RAM usage
         if self.proj_style == "mip":
             merge_style = -1
@@ -345,16 +377,14 @@ class YTQuadTreeProjBase(YTSelectionContainer2D):
         for i in data.keys(): self[i] = data.pop(i)
         mylog.info("Projection completed")
 
-    def _initialize_chunk(self, chunk, tree):
-        icoords = chunk.icoords
+    def _initialize_chunk(self, tree, icoords, ilevel):
         xax = self.ds.coordinates.x_axis[self.axis]
         yax = self.ds.coordinates.y_axis[self.axis]
         i1 = icoords[:,xax]
         i2 = icoords[:,yax]
-        ilevel = chunk.ires * self.ds.ires_factor
         tree.initialize_chunk(i1, i2, ilevel)
 
-    def _handle_chunk(self, chunk, fields, tree):
+    def _handle_chunk(self, chunk, fields, tree, icoords, ilevel):
         if self.proj_style == "mip" or self._sum_only:
             dl = 1.0
         else:
@@ -367,15 +397,14 @@ class YTQuadTreeProjBase(YTSelectionContainer2D):
         if self.weight_field is not None:
             w = chunk[self.weight_field]
             np.multiply(v, w[:,None], v)
-            np.multiply(w, dl, w)
+            # Not in place, as the chunk may be shared with other projections
+            w = w * dl
         else:
             w = np.ones(chunk.ires.size, dtype="float64")
-        icoords = chunk.icoords
         xax = self.ds.coordinates.x_axis[self.axis]
         yax = self.ds.coordinates.y_axis[self.axis]
         i1 = icoords[:,xax]
         i2 = icoords[:,yax]
-        ilevel = chunk.ires * self.ds.ires_factor
         tree.add_chunk_to_tree(i1, i2, ilevel, v, w)
 
     def to_pw(self, fields=None, center='c', width=None, origin='center-window'):
@@ -389,6 +418,36 @@ class YTQuadTreeProjBase(YTSelectionContainer2D):
         pw = self._get_pw(fields, center, width, origin, 'Projection')
         return pw
 
+def project_axes(ds, fields, axes = (0, 1, 2), weight_field = None,
+                 center = None, data_source = None, style = "integrate",
+                 field_parameters = None):
+    r"""Project fields along several axes with a single pass over the data.
+
+    This returns one projection object, as created by ``ds.proj``, for each
+    of *axes*, but reads every chunk of *data_source* only once and
+    accumulates it into the quadtrees of all of the projections at the same
+    time.  The remaining arguments are as for ``ds.proj``.
+
+    Examples
+    --------
+
+    >>> ds = load("RedshiftOutput0005")
+    >>> px, py, pz = project_axes(ds, "density", weight_field="density")
+    >>> print pz["density"]
+    """
+    if data_source is None: data_source = ds.all_data()
+    projs = [ds.proj([], axis, weight_field = weight_field, center = center,
+                     data_source = data_source, style = style,
+                     field_parameters = field_parameters)
+             for axis in axes]
+    fields = projs[0]._determine_fields(ensure_list(fields))
+    if len(fields) == 0: return projs
+    trees = [proj._get_tree(len(fields)) for proj in projs]
+    projs[0]._project_chunks(zip(projs, trees), fields)
+    for proj, tree in zip(projs, trees):
+        proj._finalize_projection(tree, fields)
+    return projs
+
 class YTCoveringGridBase(YTSelectionContainer3D):
     """A 3D region with all data extracted to a single, specified
     resolution.  Left edge should align with a cell boundary, but 
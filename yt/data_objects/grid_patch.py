@@ -355,14 +355,27 @@ class AMRGridPatch(YTSelectionContainer):
         if self._cache_mask and hash(selector) == self._last_selector_id:
             mask = self._last_mask
         else:
-            mask = selector.fill_mask(self)
+            # The index holds on to masks and counts for many selectors at
+            # once, so we check there before re-evaluating the selector.
+            cache = self._index._selection_cache
+            key = (hash(selector), self.id)
+            cached = None
+            if cache is not None:
+                try:
+                    cached = cache.get_mask(key, self.ActiveDimensions)
+                except KeyError:
+                    pass
+            if cached is not None:
+                mask, count = cached
+            else:
+                mask = selector.fill_mask(self)
+                count = 0 if mask is None else mask.sum()
+                if cache is not None:
+                    cache.store(key, mask, count)
             if self._cache_mask:
                 self._last_mask = mask
             self._last_selector_id = hash(selector)
-            if mask is None:
-                self._last_count = 0
-            else:
-                self._last_count = mask.sum()
+            self._last_count = count
         return mask
 
     def select(self, selector, source, dest, offset):
@@ -373,6 +386,13 @@ class AMRGridPatch(YTSelectionContainer):
         return count
 
     def count(self, selector):
+        if not (self._cache_mask and hash(selector) == self._last_selector_id):
+            cache = self._index._selection_cache
+            if cache is not None:
+                try:
+                    return cache.get_count((hash(selector), self.id))
+                except KeyError:
+                    pass
         mask = self._get_selector_mask(selector)
         if mask is None: return 0
         return self._last_count
@@ -111,6 +111,12 @@ class OctreeSubset(YTSelectionContainer):
 
     _domain_ind = None
 
+    @property
+    def _particle_domain_id(self):
+        # Particles in octs of any domain other than this one are skipped
+        # when depositing and smoothing.
+        return self.domain_id
+
     def mask_refinement(self, selector):
         mask = self.oct_handler.mask(selector, domain_id = self.domain_id)
         return mask
@@ -158,7 +164,7 @@ class OctreeSubset(YTSelectionContainer):
         # need no casting.
         fields = [np.asarray(f, dtype="float64") for f in fields]
         op.process_octree(self.oct_handler, self.domain_ind, pos, fields,
-            self.domain_id, self._domain_offset)
+            self._particle_domain_id, self._domain_offset)
         vals = op.finalize()
         if vals is None: return
         return np.asfortranarray(vals)
@@ -198,7 +204,7 @@ class OctreeSubset(YTSelectionContainer):
             positions.shape[0], nvals[-1])
         op.process_octree(self.oct_handler, mdom_ind, positions, 
             self.fcoords, fields,
-            self.domain_id, self._domain_offset, self.ds.periodicity,
+            self._particle_domain_id, self._domain_offset, self.ds.periodicity,
             index_fields, particle_octree, pdom_ind, self.ds.geometry)
         vals = op.finalize()
         if vals is None: return
@@ -253,8 +259,12 @@ class ParticleOctreeSubset(OctreeSubset):
     _type_name = 'indexed_octree_subset'
     _con_args = ('data_files', 'ds', 'min_ind', 'max_ind')
     domain_id = -1
+    # Only the mesh is restricted to our domain, through domain_ind;
+    # smoothing needs the particles of the neighbouring domains too.
+    _particle_domain_id = -1
     def __init__(self, base_region, data_files, ds, min_ind = 0, max_ind = 0,
-                 over_refine_factor = 1):
+                 over_refine_factor = 1, domain_id = -1,
+                 particle_count = None):
         # The first attempt at this will not work in parallel.
         self._num_zones = 1 << (over_refine_factor)
         self._oref = over_refine_factor
@@ -273,6 +283,21 @@ class ParticleOctreeSubset(OctreeSubset):
         self._current_fluid_type = self.ds.default_fluid_type
         self.base_region = base_region
         self.base_selector = base_region.selector
+        self.domain_id = domain_id
+        # An estimate of how many particles reading this subset brings in,
+        # before any selection.
+        if particle_count is None:
+            particle_count = sum(sum(data_file.total_particles.values())
+                                 for data_file in data_files)
+        self.particle_count = particle_count
+
+    @property
+    def domain_ind(self):
+        if self._domain_ind is None:
+            di = self.oct_handler.domain_ind(self.selector,
+                                             domain_id = self.domain_id)
+            self._domain_ind = di
+        return self._domain_ind
 
 class OctreeSubsetBlockSlice(object):
     def __init__(self, octree_subset):
@@ -14,6 +14,7 @@ Profile classes, to deal with generating and obtaining profiles
 #-----------------------------------------------------------------------------
 
 import h5py
+import itertools
 import numpy as np
 
 from yt.funcs import *
@@ -26,7 +27,7 @@ from yt.utilities.lib.misc_utilities import \
     new_bin_profile1d, new_bin_profile2d, \
     new_bin_profile3d
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
-    ParallelAnalysisInterface, parallel_objects
+    ParallelAnalysisInterface, parallel_objects, using_process_pool
 from yt.utilities.exceptions import YTEmptyProfileData
 
 def preserve_source_parameters(func):
@@ -775,13 +776,29 @@ class ProfileND(ParallelAnalysisInterface):
         
         """
         fields = ensure_list(fields)
-        temp_storage = ProfileFieldAccumulator(len(fields), self.size)
         cfields = fields + list(self.bin_fields)
-        citer = self.data_source.chunks(cfields, "io")
-        for chunk in parallel_objects(citer):
-            self._bin_chunk(chunk, fields, temp_storage)
+        if using_process_pool():
+            from yt.utilities.parallel_tools.process_pool import process_map
+            temp_storage = process_map(
+                lambda worker_id, nworkers:
+                    self._bin_chunk_share(fields, cfields, worker_id, nworkers))
+        else:
+            temp_storage = ProfileFieldAccumulator(len(fields), self.size)
+            citer = self.data_source.chunks(cfields, "io")
+            for chunk in parallel_objects(citer):
+                self._bin_chunk(chunk, fields, temp_storage)
         self._finalize_storage(fields, temp_storage)
 
+    def _bin_chunk_share(self, fields, cfields, worker_id, nworkers):
+        # Bin every nworkers-th IO chunk into storage private to this worker.
+        # Fields are only read for the chunks that this worker bins.
+        temp_storage = ProfileFieldAccumulator(len(fields), self.size)
+        citer = self.data_source.chunks([], "io")
+        for chunk in itertools.islice(citer, worker_id, None, nworkers):
+            chunk.get_data(cfields)
+            self._bin_chunk(chunk, fields, temp_storage)
+        return temp_storage
+
     def set_field_unit(self, field, new_unit):
         """Sets a new unit for the requested field
 
@@ -807,16 +824,24 @@ class ProfileND(ParallelAnalysisInterface):
     def _finalize_storage(self, fields, temp_storage):
         # We use our main comm here
         # This also will fill _field_data
+        # temp_storage is either our own storage or a list of the storage
+        # filled by each worker process.
 
-        for i, field in enumerate(fields):
-            # q values are returned as q * weight but we want just q
-            temp_storage.qvalues[..., i][temp_storage.used] /= \
-              temp_storage.weight_values[temp_storage.used]
+        local_store = ensure_list(temp_storage)
+        for store in local_store:
+            for i, field in enumerate(fields):
+                # q values are returned as q * weight but we want just q
+                store.qvalues[..., i][store.used] /= \
+                  store.weight_values[store.used]
 
         # get the profile data from all procs
-        all_store = {self.comm.rank: temp_storage}
-        all_store = self.comm.par_combine_object(all_store,
-                                                 "join", datatype="dict")
+        if isinstance(temp_storage, list):
+            all_store = dict(enumerate(local_store))
+        else:
+            all_store = {self.comm.rank: temp_storage}
+            all_store = self.comm.par_combine_object(all_store,
+                                                     "join", datatype="dict")
+        temp_storage = local_store[0]
 
         all_val = np.zeros_like(temp_storage.values)
         all_mean = np.zeros_like(temp_storage.mvalues)
@@ -824,7 +849,8 @@ class ProfileND(ParallelAnalysisInterface):
         all_weight = np.zeros_like(temp_storage.weight_values)
         all_used = np.zeros_like(temp_storage.used, dtype="bool")
 
-        # Combine the weighted mean and variance from each processor.
+        # Combine the weighted mean and variance from each processor
+        # or worker process.
         # For two samples with total weight, mean, and variance 
         # given by w, m, and s, their combined mean and variance are:
         # m12 = (m1 * w1 + m2 * w2) / (w1 + w2)
@@ -555,9 +555,10 @@ class Dataset(object):
         [(x1, y1, z2), (x2, y2, z2),...] points.  Returns a list of field 
         values in the same order as the input *fields*.
 
-        This is quite slow right now as it creates a new data object for each
-        point.  If an optimized version exists on the Index object we'll use
-        that instead.
+        Grid and octree indexes look up all of the points together, reading
+        the fields once for each grid or chunk that holds any of them.
+        Otherwise this creates a new data object for each point, which is
+        quite slow.
         """
         if hasattr(self,"index") and \
                 hasattr(self.index,"_find_field_values_at_points"):
@@ -34,3 +34,57 @@ def test_chunking():
             yield assert_equal, coords['f']['io'], coords['f']['spatial']
             yield assert_equal, coords['i']['io'], coords['i']['all']
             yield assert_equal, coords['i']['io'], coords['i']['spatial']
+
+def test_selection_cache():
+    from yt.config import ytcfg
+    for masks in ["False", "True"]:
+        ytcfg["yt", "selection_cache_masks"] = masks
+        ds = fake_random_ds(32, nprocs = 8)
+        ds.index
+        ytcfg["yt", "selection_cache_masks"] = "False"
+        sp1 = ds.sphere("c", (0.25, "unitary"))
+        dens1 = sp1["density"]
+        ng1 = len(sp1._chunk_info)
+        stats = ds.index.selection_cache_stats
+        yield assert_equal, stats["count_hits"], 0
+        yield assert_equal, stats["count_misses"], ng1
+        sp2 = ds.sphere([0.1, 0.1, 0.1], (0.05, "unitary"))
+        dens2 = sp2["density"]
+        ng2 = len(sp2._chunk_info)
+        # Going back to the first selector shouldn't re-count any grids
+        sp3 = ds.sphere("c", (0.25, "unitary"))
+        dens3 = sp3["density"]
+        stats = ds.index.selection_cache_stats
+        yield assert_equal, stats["count_misses"], ng1 + ng2
+        # Grids still holding their own mask for the first selector don't
+        # ask the index; the ones the second sphere touched are counted from
+        # the cache once when chunking and once when selecting, and their
+        # masks come from it if they were stored.
+        yield assert_equal, stats["count_hits"], 2 * ng2
+        yield assert_equal, stats["mask_hits"], ng2 * (masks == "True")
+        yield assert_equal, stats["size"], ng1 + ng2
+        yield assert_equal, dens1, dens3
+        ds.index.clear_all_data()
+        yield assert_equal, ds.index.selection_cache_stats["size"], 0
+
+def test_chunk_data_cache():
+    from yt.geometry.geometry_handler import ChunkDataCache
+    ds = fake_random_ds(32, nprocs = 8)
+    grids = list(ds.index.grids)
+    batches = []
+    def _read_chunk_data(chunk, fields):
+        batches.append([g.id for g in chunk.objs])
+        return dict((g.id, {fields[0]: g.id}) for g in chunk.objs)
+    ds.index.io._read_chunk_data = _read_chunk_data
+    gbytes = grids[0].ActiveDimensions.prod() * 8
+    for prefetch in [True, False]:
+        del batches[:]
+        cache = ChunkDataCache(grids, [("stream", "density")], ds.index,
+                               max_bytes = 3 * gbytes, prefetch = prefetch)
+        seen = []
+        for g in cache:
+            seen.append(g.id)
+            yield assert_equal, g._field_cache[("stream", "density")], g.id
+        yield assert_equal, seen, [g.id for g in grids]
+        yield assert_equal, [len(b) for b in batches], [3, 3, 2]
+        yield assert_equal, cache.nbatches, 3
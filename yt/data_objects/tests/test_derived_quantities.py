@@ -51,6 +51,27 @@ def test_variance():
                         ad["cell_mass"].sum())
         yield assert_rel_equal, my_std, a_std, 12
 
+def test_process_pool():
+    import yt.utilities.parallel_tools.parallel_analysis_interface as pai
+    from yt.config import ytcfg
+    ds = fake_random_ds(16, nprocs = 8, fields = ("density", ))
+    # Split the grids into several IO chunks to share between workers.
+    ds.index._grid_chunksize = 2
+    ad = ds.all_data()
+    old_size = ytcfg.get("yt", "parallel_processes")
+    ytcfg["yt", "parallel_processes"] = "3"
+    pai.process_parallel = True
+    try:
+        my_std, my_mean = ad.quantities["WeightedVariance"]("density", "ones")
+        mi, ma = ad.quantities["Extrema"]("density")
+    finally:
+        pai.process_parallel = False
+        ytcfg["yt", "parallel_processes"] = old_size
+    yield assert_rel_equal, my_mean, ad["density"].mean(), 12
+    yield assert_rel_equal, my_std, ad["density"].std(), 12
+    yield assert_equal, mi, ad["density"].min()
+    yield assert_equal, ma, ad["density"].max()
+
 if __name__ == "__main__":
     for i in test_extrema():
         i[0](*i[1:])
@@ -1,4 +1,5 @@
 from yt.testing import *
+from yt.frontends.stream.api import load_octree
 import numpy as np
 
 def setup():
@@ -8,3 +9,66 @@ def setup():
 def test_domain_point():
     ds = fake_random_ds(16, fields = ("density"))
     p = ds.point(ds.domain_center)
+
+def test_sample_field_values_at_points():
+    np.random.seed(0x4d3d3d3)
+    pos = np.random.random((1000, 3))
+    for ds in [fake_random_ds(16, nprocs = 8), fake_amr_ds()]:
+        vals = ds.index.sample_field_values_at_points(["x", "y", "z"], pos)
+        # Linear fields are interpolated exactly.
+        for i in range(3):
+            yield assert_almost_equal, vals[i], pos[:,i]
+        vals = ds.index.sample_field_values_at_points(
+            "x", ds.arr(pos * 2.0 - 0.5, "code_length"))
+        outside = ((pos < 0.25) | (pos >= 0.75)).any(axis=1)
+        yield assert_equal, np.isnan(vals[0]), outside
+        yield assert_almost_equal, vals[0,~outside], \
+            pos[~outside,0] * 2.0 - 0.5
+
+def test_find_field_values_at_points():
+    np.random.seed(0x4d3d3d3)
+    pos = np.random.random((1000, 3))
+    for ds in [fake_random_ds(16, nprocs = 8),
+               fake_amr_ds(fields = ("density",))]:
+        vals = ds.find_field_values_at_points(["x", "dx", "density"], pos)
+        # The values are those of the cells containing the points.
+        yield assert_equal, (np.abs(vals[0] - pos[:,0]) <= vals[1] / 2).all(), \
+            True
+        for i in range(0, 1000, 100):
+            p = ds.point(pos[i])
+            yield assert_equal, vals[2,i], p["density"][0]
+            yield assert_equal, vals[1,i], p["dx"][0]
+    # Octree datasets find their cells through the oct container.
+    mask = np.array([1, 1] + [0] * 15, dtype="uint8")
+    ds = load_octree(mask, {"density": np.zeros(120)})
+    vals = ds.find_field_values_at_points([("index", "x"), ("index", "dx")],
+                                          pos * 2.0 - 0.5)
+    outside = ((pos < 0.25) | (pos >= 0.75)).any(axis=1)
+    yield assert_equal, np.isnan(vals[0]), outside
+    dx = vals[1,~outside]
+    yield assert_equal, np.unique(dx), [0.125, 0.25]
+    # Only the first oct is refined
+    yield assert_equal, dx == 0.125, (pos[~outside] * 2.0 - 0.5 < 0.5).all(axis=1)
+    yield assert_almost_equal, vals[0,~outside], \
+        (np.floor((pos[~outside,0] * 2.0 - 0.5) / dx) + 0.5) * dx
+
+def test_find_field_values_at_points_deep():
+    # A chain of octs refined 22 times towards the domain center, so deep
+    # that the cells of the finest level cannot be numbered in an int64.
+    depth = 22
+    mask = np.array([1] + ([1] + [0] * 7) * depth + [0] * 8, dtype="uint8")
+    ds = load_octree(mask, {"density": np.zeros((mask == 0).sum() * 8)})
+    dx_min = ds.all_data()["index", "dx"].min().d
+    yield assert_equal, dx_min, 2.0**-(depth + 2)
+    pos = 0.5 - 0.5**np.arange(3, depth + 4)[:,None] * np.ones(3)
+    # With the cells numbered modulo 2**64, this point, which is not in
+    # any cell of the chain, would be taken to lie in the finest one.
+    pos = np.concatenate([pos, pos[-1:] + [2.0**-8, 0.0, 0.0]])
+    vals = ds.find_field_values_at_points(
+        [("index", ax) for ax in "xyz"] + [("index", "dx")], pos)
+    yield assert_equal, np.isnan(vals[3,:-1]).any(), False
+    yield assert_equal, vals[3,-2], dx_min
+    found = ~np.isnan(vals[3])
+    for i in range(3):
+        yield assert_equal, (np.abs(vals[i,found] - pos[found,i]) <=
+                             vals[3,found] / 2).all(), True
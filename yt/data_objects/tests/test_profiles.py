@@ -1,4 +1,5 @@
 from yt.testing import *
+from yt.config import ytcfg
 from yt.data_objects.profiles import \
     BinnedProfile1D, BinnedProfile2D, BinnedProfile3D, \
     Profile1D, Profile2D, Profile3D
@@ -154,6 +155,39 @@ def test_profiles():
         p3d.add_fields(["ones"])
         yield assert_equal, p3d["ones"], np.ones((nb,nb,nb))
 
+def test_process_pool_profiles():
+    import yt.utilities.parallel_tools.parallel_analysis_interface as pai
+    ds = fake_random_ds(32, nprocs = 8, fields = _fields, units = _units)
+    # Split the grids into several IO chunks to share between workers.
+    ds.index._grid_chunksize = 2
+    dd = ds.all_data()
+
+    def make_profiles():
+        p1d = Profile1D(dd, "x", 8, 0.0, 1.0, False,
+                        weight_field = "temperature")
+        p1d.add_fields(["density", "dinosaurs"])
+        p2d = Profile2D(dd, "x", 8, 0.0, 1.0, False,
+                            "y", 8, 0.0, 1.0, False,
+                            weight_field = None)
+        p2d.add_fields(["density"])
+        return p1d, p2d
+
+    serial = make_profiles()
+    old_size = ytcfg.get("yt", "parallel_processes")
+    ytcfg["yt", "parallel_processes"] = "3"
+    pai.process_parallel = True
+    try:
+        parallel = make_profiles()
+    finally:
+        pai.process_parallel = False
+        ytcfg["yt", "parallel_processes"] = old_size
+    for field in ["density", "dinosaurs"]:
+        yield assert_rel_equal, serial[0][field], parallel[0][field], 12
+        yield assert_rel_equal, serial[0].variance[field], \
+            parallel[0].variance[field], 10
+    yield assert_rel_equal, serial[0].weight, parallel[0].weight, 12
+    yield assert_rel_equal, serial[1]["density"], parallel[1]["density"], 12
+
 def test_particle_profiles():
     for nproc in [1, 2, 4, 8]:
         ds = fake_random_ds(32, nprocs=nproc, particles = 32**3)
@@ -1,6 +1,6 @@
 import numpy as np
 from yt.testing import \
-    fake_random_ds, assert_equal, assert_rel_equal
+    fake_random_ds, fake_amr_ds, assert_equal, assert_rel_equal
 from yt.units.unit_object import Unit
 import os
 import tempfile
@@ -102,3 +102,54 @@ def test_projection():
             v2 = (dd["density"] * dd["d%s" % an]).sum()
             yield assert_rel_equal, v1, v2, 10
     teardown_func(fns)
+
+
+def test_project_axes():
+    from yt.data_objects.api import project_axes
+    ds = fake_amr_ds(fields=("Density",))
+    for style in ["integrate", "mip"]:
+        for wf in [None, "Density"]:
+            if style == "mip" and wf is not None: continue
+            # One projection per axis, each making its own pass.
+            refs = [ds.proj("Density", ax, weight_field=wf, style=style)
+                    for ax in range(3)]
+            projs = project_axes(ds, "Density", weight_field=wf, style=style)
+            for ax, (proj, ref) in enumerate(zip(projs, refs)):
+                yield assert_equal, proj.axis, ax
+                for f in ["px", "py", "pdx", "pdy"]:
+                    yield assert_equal, proj[f], ref[f]
+                yield assert_rel_equal, proj["Density"], ref["Density"], 12
+    # On a uniform grid, every pixel is a column of cells we can add up.
+    n = 16
+    ds = fake_random_ds(n, nprocs=8)
+    cube = ds.covering_grid(0, ds.domain_left_edge, [n] * 3)["density"].d
+    dl = ds.domain_width.in_cgs().d / n
+    answers = {("integrate", None): lambda ax: cube.sum(axis=ax) * dl[ax],
+               ("integrate", "density"):
+                   lambda ax: (cube**2).sum(axis=ax) / cube.sum(axis=ax),
+               ("mip", None): lambda ax: cube.max(axis=ax)}
+    for (style, wf), answer in sorted(answers.items()):
+        projs = project_axes(ds, "density", weight_field=wf, style=style)
+        for ax, proj in enumerate(projs):
+            xax = ds.coordinates.x_axis[ax]
+            yax = ds.coordinates.y_axis[ax]
+            ix = (proj["px"].d * n).astype("int64")
+            iy = (proj["py"].d * n).astype("int64")
+            image = answer(ax)
+            if xax > yax: image = image.T
+            yield assert_rel_equal, proj["density"].in_cgs().d, \
+                image[ix, iy], 12
+
+
+def test_projection_tree_reuse():
+    ds = fake_amr_ds(fields=("Density",))
+    proj = ds.proj("Density", 2, weight_field="Density")
+    structure = proj._tree_structure
+    yield assert_equal, structure is None, False
+    # Adding a field reuses the refinement of the first pass.
+    proj.get_data("ones")
+    yield assert_equal, proj._tree_structure is structure, True
+    yield assert_equal, proj["ones"], np.ones(proj["px"].size)
+    ref = ds.proj(["Density", "ones"], 2, weight_field="Density")
+    yield assert_equal, proj["px"], ref["px"]
+    yield assert_rel_equal, proj["Density"], ref["Density"], 12
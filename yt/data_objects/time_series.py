@@ -182,7 +182,7 @@ class DatasetSeries(object):
     def outputs(self):
         return self._pre_outputs
 
-    def piter(self, storage = None):
+    def piter(self, storage = None, dynamic = False):
         r"""Iterate over time series components in parallel.
 
         This allows you to iterate over a time series while dispatching
@@ -210,6 +210,10 @@ class DatasetSeries(object):
             course of the iteration.  The keys will be the dataset
             indices and the values will be whatever is assigned to the *result*
             attribute on the storage during iteration.
+        dynamic : bool
+            This governs whether or not dynamic load balancing will be
+            enabled; see
+            :func:`~yt.utilities.parallel_tools.parallel_analysis_interface.parallel_objects`.
 
         Examples
         --------
@@ -247,7 +251,6 @@ class DatasetSeries(object):
         ...
 
         """
-        dynamic = False
         if self.parallel == False:
             njobs = 1
         else:
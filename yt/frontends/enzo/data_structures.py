@@ -194,6 +194,7 @@ class EnzoHierarchy(GridIndex):
     _strip_path = False
     grid = EnzoGrid
     _preload_implemented = True
+    _lazy_grids_implemented = True
 
     def __init__(self, ds, dataset_type):
 
@@ -265,69 +266,190 @@ class EnzoHierarchy(GridIndex):
 
     # Sets are sorted, so that won't work!
     def _parse_index(self):
-        def _next_token_line(token, f):
-            for line in f:
-                if line.startswith(token):
-                    return line.split()[2:]
         t1 = time.time()
-        pattern = r"Pointer: Grid\[(\d*)\]->NextGrid(Next|This)Level = (\d*)\s+$"
-        patt = re.compile(pattern)
+        index = None
+        if ytcfg.getboolean("yt", "index_cache"):
+            index = self._load_index_cache()
+        if index is None:
+            index = self._parse_index_text()
+            if ytcfg.getboolean("yt", "index_cache"):
+                self._save_index_cache(index)
+        self._fill_arrays(index["end_index"], index["start_index"],
+                          index["left_edge"], index["right_edge"],
+                          index["particle_count"],
+                          index["active_particle_count"])
+        self.grid_levels.flat[:] = index["levels"]
+        if self._lazy_grids:
+            self._setup_lazy_grids(index["parent_ids"])
+        else:
+            self._setup_grid_tree(index["parent_ids"], index["levels"])
+        names = index["filenames"]
+        self.filenames = [[None] if fi == -1 else [names[fi]]
+                          for fi in index["filename_ids"].tolist()]
+        t2 = time.time()
+        mylog.debug("Parsed index of %s grids in %0.3e s", self.num_grids,
+                    t2 - t1)
+
+    def _parse_index_text(self):
+        # We read the whole file in at once, pull out each set of values
+        # with a single regular expression and convert them in bulk.
         f = open(self.index_filename, "rt")
-        self.grids = [self.grid(1, self)]
-        self.grids[0].Level = 0
-        si, ei, LE, RE, fn, npart = [], [], [], [], [], []
-        all = [si, ei, LE, RE, fn]
-        pbar = get_pbar("Parsing Hierarchy ", self.num_grids)
+        text = f.read()
+        f.close()
+        rank = self.dataset.dimensionality
+        def _values(token, dtype, count):
+            lines = re.findall(r"^%s\s*=(.*)$" % token, text, re.M)
+            vals = np.fromstring(" ".join(lines), dtype=dtype, sep=" ")
+            if vals.size != self.num_grids * count:
+                raise RuntimeError("Found %s values of %s for %s grids" %
+                                   (vals.size, token, self.num_grids))
+            if count == 1: return vals
+            return vals.reshape((self.num_grids, count))
+        index = {}
+        index["start_index"] = _values("GridStartIndex", "int64", rank)
+        index["end_index"] = _values("GridEndIndex", "int64", rank)
+        index["left_edge"] = _values("GridLeftEdge", "float64", rank)
+        index["right_edge"] = _values("GridRightEdge", "float64", rank)
+        index["particle_count"] = _values("NumberOfParticles", "int64", 1)
+        # The tree is described by pointers, in the order the grids were
+        # written.  Each one points at the next grid, either on this level or
+        # on the next one, and grids are numbered in that same order.
+        pattern = r"^Pointer: Grid\[(\d*)\]->NextGrid(Next|This)Level = (\d*)\s*$"
+        parent_ids = np.empty(self.num_grids, dtype="int64")
+        parent_ids[:] = -1
+        levels = np.zeros(self.num_grids, dtype="int64")
+        for first, ptype, second in re.findall(pattern, text, re.M):
+            sgi = int(second) - 1
+            if sgi == -1: continue
+            fgi = int(first) - 1
+            if ptype == "Next":
+                parent_ids[sgi] = fgi + 1
+                levels[sgi] = levels[fgi] + 1
+            else:
+                parent_ids[sgi] = parent_ids[fgi]
+                levels[sgi] = levels[fgi]
+        index["parent_ids"] = parent_ids
+        index["levels"] = levels
+        # Grids with baryon fields refer to their BaryonFileName, and those
+        # with only particles to their ParticleFileName.
         version = self.dataset.parameters.get("VersionNumber", None)
         params = self.dataset.parameters
         if version is None and "Internal" in params:
             version = float(params["Internal"]["Provenance"]["VersionNumber"])
         if version >= 3.0:
             active_particles = True
-            nap = dict((ap_type, []) for ap_type in 
+            nap = dict((ap_type, np.zeros(self.num_grids, dtype="int64"))
+                for ap_type in
                 params["Physics"]["ActiveParticles"]["ActiveParticlesEnabled"])
         elif version == 2.2:
             active_particles = True
             nap = {}
             for type in self.parameters.get("AppendActiveParticleType", []):
-                nap[type] = []
+                nap[type] = np.zeros(self.num_grids, dtype="int64")
         else:
             active_particles = False
             nap = None
-        for grid_id in xrange(self.num_grids):
-            pbar.update(grid_id)
-            # We will unroll this list
-            si.append(_next_token_line("GridStartIndex", f))
-            ei.append(_next_token_line("GridEndIndex", f))
-            LE.append(_next_token_line("GridLeftEdge", f))
-            RE.append(_next_token_line("GridRightEdge", f))
-            nb = int(_next_token_line("NumberOfBaryonFields", f)[0])
-            fn.append([None])
-            if nb > 0: fn[-1] = _next_token_line("BaryonFileName", f)
-            npart.append(int(_next_token_line("NumberOfParticles", f)[0]))
-            # Below we find out what active particles exist in this grid,
-            # and add their counts individually.
-            if active_particles:
-                ptypes = _next_token_line("PresentParticleTypes", f)
-                counts = [int(c) for c in _next_token_line("ParticleTypeCounts", f)]
+        filename_ids = np.empty(self.num_grids, dtype="int64")
+        filename_ids[:] = -1
+        filenames = {}
+        pattern = r"^(Grid|BaryonFileName|ParticleFileName|" + \
+                  r"PresentParticleTypes|ParticleTypeCounts)\s*=(.*)$"
+        gi = -1
+        for token, value in re.findall(pattern, text, re.M):
+            if token == "Grid":
+                gi += 1
+                ptypes = None
+            elif token == "BaryonFileName" or \
+                 (token == "ParticleFileName" and filename_ids[gi] == -1 and
+                  index["particle_count"][gi] > 0):
+                fn = value.split()[0]
+                filename_ids[gi] = filenames.setdefault(fn, len(filenames))
+            elif active_particles and token == "PresentParticleTypes":
+                ptypes = value.split()
+            elif active_particles and token == "ParticleTypeCounts":
+                counts = [int(c) for c in value.split()]
                 for ptype in self.parameters.get("AppendActiveParticleType", []):
                     if ptype in ptypes:
-                        nap[ptype].append(counts[ptypes.index(ptype)])
-                    else:
-                        nap[ptype].append(0)
-            if nb == 0 and npart[-1] > 0: fn[-1] = _next_token_line("ParticleFileName", f)
-            for line in f:
-                if len(line) < 2: break
-                if line.startswith("Pointer:"):
-                    vv = patt.findall(line)[0]
-                    self.__pointer_handler(vv)
-        pbar.finish()
-        self._fill_arrays(ei, si, LE, RE, npart, nap)
-        temp_grids = np.empty(self.num_grids, dtype='object')
-        temp_grids[:] = self.grids
-        self.grids = temp_grids
-        self.filenames = fn
-        t2 = time.time()
+                        nap[ptype][gi] = counts[ptypes.index(ptype)]
+        index["filename_ids"] = filename_ids
+        index["filenames"] = sorted(filenames, key = lambda fn: filenames[fn])
+        index["active_particle_count"] = nap
+        return index
+
+    @property
+    def _index_cache_filename(self):
+        return "%s.ytindex" % (self.index_filename)
+
+    def _load_index_cache(self):
+        fn = self._index_cache_filename
+        if not os.path.exists(fn): return None
+        st = os.stat(self.index_filename)
+        try:
+            f = h5py.File(fn, "r")
+        except IOError:
+            return None
+        try:
+            if f.attrs["hierarchy_size"] != st.st_size or \
+               f.attrs["hierarchy_mtime"] != st.st_mtime or \
+               f.attrs["num_grids"] != self.num_grids:
+                mylog.debug("Index cache %s is out of date", fn)
+                return None
+            index = {}
+            for name in ("start_index", "end_index", "left_edge",
+                         "right_edge", "particle_count", "parent_ids",
+                         "levels", "filename_ids"):
+                index[name] = f[name][:]
+            index["filenames"] = f["filenames"][:].tolist()
+            if "active_particle_count" in f:
+                g = f["active_particle_count"]
+                index["active_particle_count"] = \
+                    dict((str(ptype), g[ptype][:]) for ptype in g)
+            else:
+                index["active_particle_count"] = None
+        except KeyError:
+            return None
+        finally:
+            f.close()
+        mylog.debug("Loaded index from %s", fn)
+        return index
+
+    def _save_index_cache(self, index):
+        if self.comm.rank not in (0, None): return
+        fn = self._index_cache_filename
+        st = os.stat(self.index_filename)
+        # We write to a temporary file and then move it into place, so that
+        # nobody ever sees a partially written cache.
+        tfn = "%s.%s" % (fn, os.getpid())
+        try:
+            f = h5py.File(tfn, "w")
+        except IOError:
+            mylog.debug("Could not write index cache %s", fn)
+            return
+        f.attrs["hierarchy_size"] = st.st_size
+        f.attrs["hierarchy_mtime"] = st.st_mtime
+        f.attrs["num_grids"] = self.num_grids
+        for name in ("start_index", "end_index", "left_edge",
+                     "right_edge", "particle_count", "parent_ids",
+                     "levels", "filename_ids"):
+            f.create_dataset(name, data = index[name])
+        f.create_dataset("filenames", data = np.array(index["filenames"]))
+        if index["active_particle_count"] is not None:
+            g = f.create_group("active_particle_count")
+            for ptype, counts in index["active_particle_count"].items():
+                g.create_dataset(ptype, data = counts)
+        f.close()
+        os.rename(tfn, fn)
+
+    def _setup_grid_tree(self, parent_ids, levels):
+        self.grids = np.empty(self.num_grids, dtype='object')
+        for i, (pid, level) in enumerate(izip(parent_ids.tolist(),
+                                              levels.tolist())):
+            g = self.grids[i] = self.grid(i + 1, self)
+            g.Level = level
+            g._parent_id = pid
+            # Parents always come before their children
+            if pid != -1:
+                self.grids[pid - 1]._children_ids.append(g.id)
 
     def _initialize_grid_arrays(self):
         super(EnzoHierarchy, self)._initialize_grid_arrays()
@@ -339,7 +461,7 @@ class EnzoHierarchy(GridIndex):
 
     def _fill_arrays(self, ei, si, LE, RE, npart, nap):
         self.grid_dimensions.flat[:] = ei
-        self.grid_dimensions -= np.array(si, self.float_type)
+        self.grid_dimensions -= np.array(si, "int64")
         self.grid_dimensions += 1
         self.grid_left_edge.flat[:] = LE
         self.grid_right_edge.flat[:] = RE
@@ -348,26 +470,6 @@ class EnzoHierarchy(GridIndex):
             for ptype in nap:
                 self.grid_active_particle_count[ptype].flat[:] = nap[ptype]
 
-    def __pointer_handler(self, m):
-        sgi = int(m[2])-1
-        if sgi == -1: return # if it's 0, then we're done with that lineage
-        # Okay, so, we have a pointer.  We make a new grid, with an id of the length+1
-        # (recall, Enzo grids are 1-indexed)
-        self.grids.append(self.grid(len(self.grids)+1, self))
-        # We'll just go ahead and make a weakref to cache
-        second_grid = self.grids[sgi] # zero-indexed already
-        first_grid = self.grids[int(m[0])-1]
-        if m[1] == "Next":
-            first_grid._children_ids.append(second_grid.id)
-            second_grid._parent_id = first_grid.id
-            second_grid.Level = first_grid.Level + 1
-        elif m[1] == "This":
-            if first_grid.Parent is not None:
-                first_grid.Parent._children_ids.append(second_grid.id)
-                second_grid._parent_id = first_grid._parent_id
-            second_grid.Level = first_grid.Level
-        self.grid_levels[sgi] = second_grid.Level
-
     def _rebuild_top_grids(self, level = 0):
         #for level in xrange(self.max_level+1):
         mylog.info("Rebuilding grids on level %s", level)
@@ -389,6 +491,12 @@ class EnzoHierarchy(GridIndex):
         mylog.info("Finished rebuilding")
 
     def _populate_grid_objects(self):
+        if self._lazy_grids:
+            # Grids are set up as they are created, in _materialize_grid.
+            self._grid_filenames = [f[0] for f in self.filenames]
+            del self.filenames
+            self.max_level = self.grid_levels.max()
+            return
         reconstruct = ytcfg.getboolean("yt","reconstruct_index")
         for g,f in izip(self.grids, self.filenames):
             g._prepare_grid()
@@ -399,6 +507,18 @@ class EnzoHierarchy(GridIndex):
         del self.filenames # No longer needed.
         self.max_level = self.grid_levels.max()
 
+    def _materialize_grid(self, i):
+        g = self.grid(i + 1, self)
+        g.Level = int(self.grid_levels[i, 0])
+        g._parent_id = int(self.grid_parent_ids[i])
+        g._children_ids = self._get_grid_children_ids(i)
+        g._prepare_grid()
+        g._setup_dx()
+        g.set_filename(self._grid_filenames[i])
+        if ytcfg.getboolean("yt","reconstruct_index"):
+            if g.Parent is not None: g._guess_properties_from_parent()
+        return g
+
     def _detect_active_particle_fields(self):
         ap_list = self.dataset["AppendActiveParticleType"]
         _fields = dict((ap, []) for ap in ap_list)
@@ -530,6 +650,7 @@ class EnzoHierarchyInMemory(EnzoHierarchy):
 
     grid = EnzoGridInMemory
     _enzo = None
+    _lazy_grids_implemented = False
 
     @property
     def enzo(self):
@@ -628,7 +749,7 @@ class EnzoHierarchy1D(EnzoHierarchy):
 
     def _fill_arrays(self, ei, si, LE, RE, npart, nap):
         self.grid_dimensions[:,:1] = ei
-        self.grid_dimensions[:,:1] -= np.array(si, self.float_type)
+        self.grid_dimensions[:,:1] -= np.array(si, "int64")
         self.grid_dimensions += 1
         self.grid_left_edge[:,:1] = LE
         self.grid_right_edge[:,:1] = RE
@@ -643,7 +764,7 @@ class EnzoHierarchy2D(EnzoHierarchy):
 
     def _fill_arrays(self, ei, si, LE, RE, npart, nap):
         self.grid_dimensions[:,:2] = ei
-        self.grid_dimensions[:,:2] -= np.array(si, self.float_type)
+        self.grid_dimensions[:,:2] -= np.array(si, "int64")
         self.grid_dimensions += 1
         self.grid_left_edge[:,:2] = LE
         self.grid_right_edge[:,:2] = RE
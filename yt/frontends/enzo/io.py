@@ -14,7 +14,9 @@ Enzo-specific IO functions
 #-----------------------------------------------------------------------------
 
 import os
+from multiprocessing.pool import ThreadPool
 
+from yt.config import ytcfg
 from yt.utilities.io_handler import \
     BaseIOHandler, _axis_ids
 from yt.utilities.logger import ytLogger as mylog
@@ -142,6 +144,10 @@ class IOHandlerPackedHDF5(BaseIOHandler):
         ng = sum(len(c.objs) for c in chunks)
         mylog.debug("Reading %s cells of %s fields in %s grids",
                    size, [f2 for f1, f2 in fields], ng)
+        nthreads = ytcfg.getint("yt", "io_threads")
+        if nthreads > 1 and len(chunks) > 1:
+            return self._read_fluid_selection_threaded(
+                chunks, selector, fields, rv, nthreads)
         ind = 0
         for chunk in chunks:
             fid = None
@@ -149,23 +155,77 @@ class IOHandlerPackedHDF5(BaseIOHandler):
                 if g.filename is None: continue
                 if fid is None:
                     fid = h5py.h5f.open(g.filename.encode('ascii'), h5py.h5f.ACC_RDONLY)
-                data = np.empty(g.ActiveDimensions[::-1], dtype="float64")
-                data_view = data.swapaxes(0,2)
-                nd = 0
-                for field in fields:
-                    ftype, fname = field
-                    try:
-                        node = "/Grid%08i/%s" % (g.id, fname)
-                        dg = h5py.h5d.open(fid, node.encode('ascii'))
-                    except KeyError:
-                        if fname == "Dark_Matter_Density": continue
-                        raise
-                    dg.read(h5py.h5s.ALL, h5py.h5s.ALL, data)
-                    nd = g.select(selector, data_view, rv[field], ind) # caches
-                ind += nd
+                gf = self._read_grid(fid, g, fields)
+                ind += self._select_grid(g, gf, selector, fields, rv, ind)
             if fid: fid.close()
         return rv
 
+    def _read_fluid_selection_threaded(self, chunks, selector, fields, rv,
+                                       nthreads):
+        # Our chunks are grouped by file, so we read nthreads of them at a
+        # time on a pool of threads, while selecting from the ones that have
+        # already been read.  The selection itself happens in the same order
+        # as in the serial reader.
+        groups = [[g for g in chunk.objs if g.filename is not None]
+                  for chunk in chunks]
+        def _read(grids):
+            return self._read_grid_fields(grids, fields)
+        pool = ThreadPool(nthreads)
+        ind = 0
+        try:
+            pending = pool.map_async(_read, groups[:nthreads])
+            for start in range(0, len(groups), nthreads):
+                results = pending.get()
+                next_groups = groups[start + nthreads:start + 2*nthreads]
+                if len(next_groups) > 0:
+                    pending = pool.map_async(_read, next_groups)
+                for grids, data in zip(groups[start:start + nthreads],
+                                       results):
+                    for g in grids:
+                        ind += self._select_grid(g, data.pop(g.id), selector,
+                                                 fields, rv, ind)
+        finally:
+            pool.close()
+            pool.join()
+        return rv
+
+    def _read_grid_fields(self, grids, fields):
+        # Read all of the fields for a set of grids sharing a file.
+        rv = {}
+        if len(grids) == 0: return rv
+        fid = h5py.h5f.open(grids[0].filename.encode('ascii'),
+                            h5py.h5f.ACC_RDONLY)
+        for g in grids:
+            rv[g.id] = self._read_grid(fid, g, fields)
+        fid.close()
+        return rv
+
+    def _read_grid(self, fid, g, fields):
+        # Read the fields of one grid into newly allocated buffers, returning
+        # views in the order yt expects.
+        gf = {}
+        for field in fields:
+            ftype, fname = field
+            try:
+                node = "/Grid%08i/%s" % (g.id, fname)
+                dg = h5py.h5d.open(fid, node.encode('ascii'))
+            except KeyError:
+                if fname == "Dark_Matter_Density": continue
+                raise
+            data = np.empty(g.ActiveDimensions[::-1], dtype="float64")
+            dg.read(h5py.h5s.ALL, h5py.h5s.ALL, data)
+            gf[field] = data.swapaxes(0,2)
+        return gf
+
+    def _select_grid(self, g, gf, selector, fields, rv, ind):
+        # Select the fields of one grid into rv, starting at ind, returning
+        # the number of values selected.
+        nd = 0
+        for field in fields:
+            if field not in gf: continue
+            nd = g.select(selector, gf.pop(field), rv[field], ind) # caches
+        return nd
+
     def _read_chunk_data(self, chunk, fields):
         fid = fn = None
         rv = {}
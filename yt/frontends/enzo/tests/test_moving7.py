@@ -0,0 +1,181 @@
+"""
+Enzo frontend tests using the small output shipped with the source
+
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+import yt
+from yt.testing import *
+from yt.config import ytcfg
+from yt.geometry.geometry_handler import YTDataChunk
+from yt.data_objects.static_output import _cached_datasets
+from yt.frontends.enzo.api import EnzoDataset
+from yt.utilities.lib.GridTree import MatchPointsToGrids
+
+moving7 = os.path.join(os.path.dirname(yt.__file__), os.pardir,
+                       "tests", "DD0010", "moving7_0010")
+
+def setup():
+    """Test specific setup."""
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _load_copy(tmpdir):
+    # We work on a copy, so that nothing gets written next to the original.
+    data_dir = os.path.join(tmpdir, "DD0010")
+    shutil.copytree(os.path.dirname(moving7), data_dir)
+    return _reload(os.path.join(data_dir, os.path.basename(moving7)))
+
+def _reload(fn):
+    # Datasets are kept by filename, and we want a new index every time.
+    _cached_datasets.clear()
+    ds = EnzoDataset(fn)
+    ds.index
+    return ds
+
+def _hierarchy_values(fn, token):
+    # One grid at a time, the way the hierarchy used to be parsed.
+    vals = []
+    for line in open(fn):
+        if line.startswith(token):
+            vals.append([float(v) for v in line.split("=")[1].split()])
+    return np.array(vals)
+
+def _grid_arrays(ds):
+    index = ds.index
+    arrays = dict(left_edge = index.grid_left_edge.d,
+                  right_edge = index.grid_right_edge.d,
+                  dimensions = index.grid_dimensions,
+                  levels = index.grid_levels,
+                  particle_count = index.grid_particle_count,
+                  filenames = [g.filename for g in index.grids],
+                  parents = [-1 if g.Parent is None else g.Parent.id
+                             for g in index.grids],
+                  children = [[c.id for c in g.Children]
+                              for g in index.grids])
+    return arrays
+
+@requires_file(moving7)
+def test_index_cache():
+    tmpdir = tempfile.mkdtemp()
+    old_cache = ytcfg.get("yt", "index_cache")
+    try:
+        ds = _load_copy(tmpdir)
+        hierarchy = ds.index.index_filename
+        cache_fn = "%s.ytindex" % hierarchy
+        # Nothing is written next to the data unless we ask for it.
+        yield assert_equal, os.path.exists(cache_fn), False
+        answer = _grid_arrays(ds)
+        start = _hierarchy_values(hierarchy, "GridStartIndex")
+        end = _hierarchy_values(hierarchy, "GridEndIndex")
+        yield assert_equal, answer["dimensions"], end - start + 1
+        yield assert_equal, answer["left_edge"], \
+            _hierarchy_values(hierarchy, "GridLeftEdge")
+        yield assert_equal, answer["right_edge"], \
+            _hierarchy_values(hierarchy, "GridRightEdge")
+        yield assert_equal, answer["particle_count"], \
+            _hierarchy_values(hierarchy, "NumberOfParticles")
+        yield assert_equal, answer["levels"].max(), 7
+        # The first load writes the cache and the second one reads it back.
+        ytcfg["yt", "index_cache"] = "True"
+        for written in (False, True):
+            ds = _reload(ds.parameter_filename)
+            yield assert_equal, os.path.exists(cache_fn), True
+            arrays = _grid_arrays(ds)
+            for name in answer:
+                yield assert_equal, arrays[name], answer[name]
+        # Once the hierarchy changes, the cache is ignored and replaced.
+        text = open(hierarchy).read()
+        text = text.replace("NumberOfParticles   = 577",
+                            "NumberOfParticles   = 578")
+        open(hierarchy, "w").write(text)
+        st = os.stat(hierarchy)
+        os.utime(hierarchy, (st.st_atime, st.st_mtime + 10))
+        for written in (False, True):
+            ds = _reload(ds.parameter_filename)
+            yield assert_equal, ds.index.grid_particle_count[1], 578
+    finally:
+        ytcfg["yt", "index_cache"] = old_cache
+        shutil.rmtree(tmpdir)
+
+@requires_file(moving7)
+def test_lazy_grids():
+    tmpdir = tempfile.mkdtemp()
+    old_lazy = ytcfg.get("yt", "lazy_grids")
+    try:
+        ytcfg["yt", "lazy_grids"] = "False"
+        ds = _load_copy(tmpdir)
+        answer = _grid_arrays(ds)
+        answer_tree = ds.index._get_grid_tree()
+        np.random.seed(0x4d3d3d3)
+        points = [np.random.uniform(size=1000) for ax in "xyz"]
+        answer_points = MatchPointsToGrids(answer_tree, 1000,
+                                           *points).find_points_in_tree()
+        answer_density = ds.all_data()["density"]
+        ytcfg["yt", "lazy_grids"] = "True"
+        ds = _reload(ds.parameter_filename)
+        yield assert_equal, ds.index._lazy_grids, True
+        # Asking for the tree, or for data, creates only the grids we need.
+        tree = ds.index._get_grid_tree()
+        yield assert_equal, len(ds.index.grids.materialized()), 0
+        for a, b in zip(tree.return_tree_info(),
+                        answer_tree.return_tree_info()):
+            yield assert_equal, a, b
+        yield assert_equal, \
+            MatchPointsToGrids(tree, 1000, *points).find_points_in_tree(), \
+            answer_points
+        sp = ds.sphere([0.1, 0.1, 0.1], (0.05, "unitary"))
+        sp["density"]
+        yield assert_equal, \
+            0 < len(ds.index.grids.materialized()) < ds.index.num_grids, True
+        yield assert_equal, ds.all_data()["density"], answer_density
+        arrays = _grid_arrays(ds)
+        for name in answer:
+            yield assert_equal, arrays[name], answer[name]
+        for g in ds.index.grids:
+            yield assert_equal, g.Level, ds.index.grid_levels[g.id - 1, 0]
+    finally:
+        ytcfg["yt", "lazy_grids"] = old_lazy
+        shutil.rmtree(tmpdir)
+
+@requires_file(moving7)
+def test_io_threads():
+    tmpdir = tempfile.mkdtemp()
+    old_threads = ytcfg.get("yt", "io_threads")
+    try:
+        ds = _load_copy(tmpdir)
+        fields = [("enzo", "Density"), ("enzo", "Temperature")]
+        for dobj in [ds.all_data(), ds.sphere("max", (0.2, "unitary"))]:
+            # All the grids share one file, so we give each one its own chunk
+            # to have something to spread over the threads.
+            ds.index._identify_base_chunk(dobj)
+            chunks = [YTDataChunk(dobj, "io", [g], None)
+                      for g in dobj._chunk_info]
+            answer = None
+            for threads in ["1", "2", "4"]:
+                ytcfg["yt", "io_threads"] = threads
+                rv = ds.index.io._read_fluid_selection(
+                    chunks, dobj.selector, fields, None)
+                if answer is None:
+                    answer = rv
+                    continue
+                for field in fields:
+                    yield assert_equal, rv[field], answer[field]
+            yield assert_equal, answer[fields[0]].size, dobj["density"].size
+    finally:
+        ytcfg["yt", "io_threads"] = old_threads
+        shutil.rmtree(tmpdir)
@@ -113,7 +113,10 @@ class IOHandlerHaloCatalogHDF5(BaseIOHandler):
 
     def _identify_fields(self, data_file):
         with h5py.File(data_file.filename, "r") as f:
-            fields = [("halos", field) for field in f]
-            units = dict([(("halos", field), 
-                           f[field].attrs["units"]) for field in f])
+            # Groups, such as the checkpoint written by HaloCatalog while it
+            # is running, do not hold fields.
+            fields = [("halos", field) for field in f
+                      if isinstance(f[field], h5py.Dataset)]
+            units = dict([(("halos", field),
+                           f[field].attrs["units"]) for ptype, field in fields])
         return fields, units
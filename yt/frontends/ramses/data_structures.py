@@ -14,12 +14,15 @@ RAMSES-specific data structures
 #-----------------------------------------------------------------------------
 
 import os
+import mmap
 import numpy as np
 import stat
 import weakref
 import cStringIO
+from collections import OrderedDict
 
 from yt.funcs import *
+from yt.config import ytcfg
 from yt.geometry.oct_geometry_handler import \
     OctreeIndex
 from yt.geometry.geometry_handler import \
@@ -42,6 +45,35 @@ from yt.geometry.oct_container import \
 from yt.fields.particle_fields import \
     standard_particle_fields
 
+class RAMSESFileMapPool(object):
+    r"""A bounded pool of read-only memory maps of RAMSES output files.
+
+    Every domain subset in every chunk reads from the same handful of hydro
+    and particle files, so rather than re-reading them we keep the most
+    recently used ones mapped.  Data read out of the maps is always copied,
+    so maps can be closed as soon as they are evicted.
+    """
+    def __init__(self, max_open = None):
+        if max_open is None:
+            max_open = ytcfg.getint("yt", "ramses_max_open_files")
+        self.max_open = max_open
+        self._maps = OrderedDict()
+
+    def get(self, filename):
+        mm = self._maps.pop(filename, None)
+        if mm is None:
+            with open(filename, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[filename] = mm
+        while len(self._maps) > self.max_open:
+            self._maps.popitem(last = False)[1].close()
+        return mm
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+
 class RAMSESDomainFile(object):
     _last_mask = None
     _last_selector_id = None
@@ -69,6 +101,14 @@ class RAMSESDomainFile(object):
     def __repr__(self):
         return "RAMSESDomainFile: %i" % self.domain_id
 
+    @property
+    def hydro_map(self):
+        return self.ds._file_maps.get(self.hydro_fn)
+
+    @property
+    def part_map(self):
+        return self.ds._file_maps.get(self.part_fn)
+
     def _is_hydro(self):
         '''
         Does the output include hydro?
@@ -301,8 +341,8 @@ class RAMSESDomainSubset(OctreeSubset):
     _domain_offset = 1
 
     def fill(self, content, fields, selector):
-        # Here we get a copy of the file, which we skip through and read the
-        # bits we want.
+        # Here we get a buffer of the file (usually a memory map), from which
+        # we pick out only the records we want.
         oct_handler = self.oct_handler
         all_fields = self.domain.ds.index.fluid_field_list
         fields = [f for ft, f in fields]
@@ -314,17 +354,17 @@ class RAMSESDomainSubset(OctreeSubset):
             tr[field] = np.zeros(cell_count, 'float64')
         for level, offset in enumerate(self.domain.hydro_offset):
             if offset == -1: continue
-            content.seek(offset)
             nc = self.domain.level_count[level]
             temp = {}
-            for field in all_fields:
+            for field in fields:
                 temp[field] = np.empty((nc, 8), dtype="float64")
             for i in range(8):
                 for field in all_fields:
-                    if field not in fields:
-                        fpu.skip(content)
+                    if field in fields:
+                        temp[field][:,i], offset = fpu.read_vector_buffer(
+                            content, offset, 'd') # cell 1
                     else:
-                        temp[field][:,i] = fpu.read_vector(content, 'd') # cell 1
+                        offset = fpu.skip_buffer(content, offset)
             oct_handler.fill_level(level, levels, cell_inds, file_inds, tr, temp)
         return tr
 
@@ -340,8 +380,13 @@ class RAMSESIndex(OctreeIndex):
         self.max_level = None
 
         self.float_type = np.float64
+        self._file_maps = ds._file_maps
         super(RAMSESIndex, self).__init__(ds, dataset_type)
 
+    def __del__(self):
+        self._file_maps.close()
+        super(RAMSESIndex, self).__del__()
+
     def _initialize_oct_handler(self):
         self.domains = [RAMSESDomainFile(self.dataset, i + 1)
                         for i in range(self.dataset['ncpu'])]
@@ -472,6 +517,7 @@ class RAMSESDataset(Dataset):
         '''
         self.fluid_types += ("ramses",)
         self._fields_in_file = fields
+        self._file_maps = RAMSESFileMapPool()
         Dataset.__init__(self, filename, dataset_type)
         self.storage_filename = storage_filename
 
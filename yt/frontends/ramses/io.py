@@ -20,7 +20,6 @@ from yt.utilities.io_handler import \
     BaseIOHandler
 from yt.utilities.logger import ytLogger as mylog
 import yt.utilities.fortran_utils as fpu
-import cStringIO
 
 class IOHandlerRAMSES(BaseIOHandler):
     _dataset_type = "ramses"
@@ -33,11 +32,10 @@ class IOHandlerRAMSES(BaseIOHandler):
         cp = 0
         for chunk in chunks:
             for subset in chunk.objs:
-                # Now we read the entire thing
-                f = open(subset.domain.hydro_fn, "rb")
-                # This contains the boundary information, so we skim through
-                # and pick off the right vectors
-                content = cStringIO.StringIO(f.read())
+                # This is a shared, read-only map of the whole file, which
+                # contains the boundary information, so we skim through and
+                # pick off the right vectors
+                content = subset.domain.hydro_map
                 rv = subset.fill(content, fields, selector)
                 for ft, f in fields:
                     d = rv.pop(f)
@@ -83,16 +81,17 @@ class IOHandlerRAMSES(BaseIOHandler):
                         yield (ptype, field), data
 
     def _read_particle_subset(self, subset, fields):
-        f = open(subset.domain.part_fn, "rb")
+        content = subset.domain.part_map
         foffsets = subset.domain.particle_field_offsets
         tr = {}
         # We do *all* conversion into boxlen here.
         # This means that no other conversions need to be applied to convert
         # positions into the same domain as the octs themselves.
         for field in sorted(fields, key = lambda a: foffsets[a]):
-            f.seek(foffsets[field])
             dt = subset.domain.particle_field_types[field]
-            tr[field] = fpu.read_vector(f, dt)
+            # We copy out of the map, so that it can be closed.
+            vals, _ = fpu.read_vector_buffer(content, foffsets[field], dt)
+            tr[field] = vals.copy()
             if field[1].startswith("particle_position"):
-                np.divide(tr[field], subset.domain.ds["boxlen"], tr[field])
+                tr[field] = tr[field] / subset.domain.ds["boxlen"]
         return tr
@@ -0,0 +1,131 @@
+"""
+Unit test reading RAMSES records out of memory maps.
+
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+from yt.testing import *
+import yt.utilities.fortran_utils as fpu
+from yt.geometry.oct_container import RAMSESOctreeContainer
+from yt.geometry.selection_routines import AlwaysSelector
+from yt.frontends.ramses.data_structures import \
+    RAMSESDomainSubset, RAMSESFileMapPool
+
+def _write_record(f, vals):
+    vals = np.asarray(vals)
+    f.write(struct.pack("=I", vals.nbytes))
+    f.write(vals.tostring())
+    f.write(struct.pack("=I", vals.nbytes))
+
+def _hydro_value(level, cell, field, oct):
+    return 1000.0 * level + 100.0 * cell + 10.0 * field + oct
+
+class FakeObject(object):
+    pass
+
+def test_read_vector_buffer():
+    tmpdir = tempfile.mkdtemp()
+    pool = RAMSESFileMapPool(max_open = 1)
+    try:
+        fn1 = os.path.join(tmpdir, "records1")
+        f = open(fn1, "wb")
+        _write_record(f, np.arange(5, dtype="int32"))
+        _write_record(f, np.arange(3, dtype="float64"))
+        _write_record(f, np.arange(4, dtype="float32") * 0.5)
+        f.close()
+        mm = pool.get(fn1)
+        vals, offset = fpu.read_vector_buffer(mm, 0, "i")
+        yield assert_equal, vals, np.arange(5)
+        vals, offset = fpu.read_vector_buffer(mm, offset, "d")
+        yield assert_equal, vals, np.arange(3.0)
+        vals, offset = fpu.read_vector_buffer(mm, offset, "f")
+        yield assert_equal, vals, np.arange(4) * 0.5
+        yield assert_equal, offset, os.path.getsize(fn1)
+        # Skipping records of any size lands on the same offsets.
+        yield assert_equal, fpu.skip_buffer(mm, 0, 2), \
+            os.path.getsize(fn1) - (4 * 4 + 8)
+        yield assert_equal, fpu.skip_buffer(mm, 0, 3), os.path.getsize(fn1)
+        del vals
+        # Evicting a map closes it; asking again maps the file anew.
+        fn2 = os.path.join(tmpdir, "records2")
+        f = open(fn2, "wb")
+        f.write(struct.pack("=I", 8) + np.zeros(1).tostring() +
+                struct.pack("=I", 16))
+        f.close()
+        mm2 = pool.get(fn2)
+        yield assert_raises, ValueError, mm.read, 1
+        yield assert_raises, AssertionError, fpu.skip_buffer, mm2, 0
+        mm = pool.get(fn1)
+        yield assert_equal, fpu.skip_buffer(mm, 0, 3), os.path.getsize(fn1)
+        pool.close()
+        yield assert_raises, ValueError, mm.read, 1
+    finally:
+        pool.close()
+        shutil.rmtree(tmpdir)
+
+def test_fill():
+    # Eight root octs, two of which are refined once.
+    oct_handler = RAMSESOctreeContainer(np.array([2, 2, 2]),
+                                        np.zeros(3), np.ones(3))
+    oct_handler.allocate_domains([10], 8)
+    c = np.array([0.25, 0.75])
+    pos = np.array([[x, y, z] for x in c for y in c for z in c])
+    oct_handler.add(1, 0, pos)
+    oct_handler.add(1, 1, np.array([[0.125, 0.125, 0.125],
+                                    [0.875, 0.625, 0.375]]))
+    oct_handler.finalize()
+    all_fields = ["Density", "x-velocity", "y-velocity", "Pressure"]
+    level_count = np.array([8, 2])
+    tmpdir = tempfile.mkdtemp()
+    pool = RAMSESFileMapPool()
+    try:
+        fn = os.path.join(tmpdir, "hydro_00001.out00001")
+        f = open(fn, "wb")
+        _write_record(f, np.array([len(all_fields)], dtype="int32"))
+        hydro_offset = np.zeros(2, dtype="int64")
+        for level, nc in enumerate(level_count):
+            hydro_offset[level] = f.tell()
+            for cell in range(8):
+                for field in range(len(all_fields)):
+                    _write_record(f, [_hydro_value(level, cell, field, oct)
+                                      for oct in range(nc)])
+        f.close()
+        domain = FakeObject()
+        domain.hydro_offset = hydro_offset
+        domain.level_count = level_count
+        domain.ds = FakeObject()
+        domain.ds.index = FakeObject()
+        domain.ds.index.fluid_field_list = all_fields
+        subset = RAMSESDomainSubset.__new__(RAMSESDomainSubset)
+        subset.domain = domain
+        subset.domain_id = 1
+        subset.oct_handler = oct_handler
+        selector = AlwaysSelector(None)
+        fields = [("ramses", "Pressure"), ("ramses", "x-velocity")]
+        tr = subset.fill(pool.get(fn), fields, selector)
+        cell_count = selector.count_oct_cells(oct_handler, 1)
+        levels, cell_inds, file_inds = \
+            oct_handler.file_index_octs(selector, 1, cell_count)
+        for ft, field in fields:
+            answer = _hydro_value(levels, cell_inds,
+                                  all_fields.index(field), file_inds)
+            yield assert_equal, tr[field], answer
+    finally:
+        pool.close()
+        shutil.rmtree(tmpdir)
@@ -130,3 +130,31 @@ def test_stream_particles() :
     assert amr2._get_field_info("all", "particle_position_z").particle_type
     assert amr2._get_field_info("all", "particle_mass").particle_type
     assert not amr2._get_field_info("gas", "density").particle_type
+
+def test_particle_selection_single_pass():
+    # Particle selection should read the coordinates from each chunk only
+    # once, so we count the bytes the IO handler pulls in for coordinates
+    # on their own (the old counting pass) and make sure none get read.
+    num_particles = 10000
+    for nprocs in [1, 8]:
+        ds = fake_random_ds(16, nprocs=nprocs, particles=num_particles)
+        io = ds.index.io
+        bytes_read = {"count": 0}
+        read_particle_coords = io._read_particle_coords
+        def _counting_coords(chunks, ptf):
+            for ptype, (x, y, z) in read_particle_coords(chunks, ptf):
+                bytes_read["count"] += x.nbytes + y.nbytes + z.nbytes
+                yield ptype, (x, y, z)
+        io._read_particle_coords = _counting_coords
+        sp = ds.sphere("c", (0.25, "unitary"))
+        mass = sp["io", "particle_mass"]
+        px = sp["io", "particle_position_x"]
+        yield assert_equal, bytes_read["count"], 0
+        ad = ds.all_data()
+        x = ad["io", "particle_position_x"].ndarray_view()
+        y = ad["io", "particle_position_y"].ndarray_view()
+        z = ad["io", "particle_position_z"].ndarray_view()
+        r = np.sqrt((x - 0.5)**2 + (y - 0.5)**2 + (z - 0.5)**2)
+        yield assert_equal, mass.size, (r <= 0.25).sum()
+        yield assert_equal, px.size, mass.size
+        yield assert_equal, ad["io", "particle_mass"].size, num_particles
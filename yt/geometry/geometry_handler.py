@@ -21,6 +21,9 @@ import h5py
 import numpy as np
 import abc
 import copy
+import sys
+import threading
+import time
 
 from yt.funcs import *
 from yt.config import ytcfg
@@ -383,35 +386,148 @@ class YTDataChunk(object):
         return cdt
 
 class ChunkDataCache(object):
+    r"""Iterate over grids, preloading their data in batches.
+
+    Batches are sized so that the data for the preloaded fields fits inside
+    a byte budget, estimated from the grid dimensions and particle counts.
+    While the grids in one batch are being handed out, the next batch is
+    read on a background thread, so that processing and IO overlap.  The
+    total time spent waiting on IO is kept in ``io_wait_time``.
+
+    Parameters
+    ----------
+    base_iter : iterable of grids
+        The grids to iterate over.  Note that this never initializes the
+        iterator; it assumes the iterator is already created, and it calls
+        next() on it.
+    preload_fields : list of field tuples
+        The on-disk fields to read for every grid.
+    geometry_handler : Index
+        The index whose IO handler implements ``_read_chunk_data``.
+    max_length : int, optional
+        If supplied, no batch will contain more than this many grids.
+    max_bytes : int, optional
+        The budget, in bytes, for a single batch.  Defaults to the
+        ``chunk_cache_bytes`` configuration option.
+    prefetch : bool, optional
+        Whether to read the next batch on a background thread.  Defaults to
+        the ``chunk_cache_prefetch`` configuration option.
+    """
+    # The IO handlers always hand back native 64-bit floats.
+    _itemsize = np.dtype("float64").itemsize
+
     def __init__(self, base_iter, preload_fields, geometry_handler,
-                 max_length = 256):
-        # At some point, max_length should instead become a heuristic function,
-        # potentially looking at estimated memory usage.  Note that this never
-        # initializes the iterator; it assumes the iterator is already created,
-        # and it calls next() on it.
+                 max_length = None, max_bytes = None, prefetch = None):
         self.base_iter = base_iter.__iter__()
         self.queue = []
         self.max_length = max_length
+        if max_bytes is None:
+            max_bytes = ytcfg.getint("yt", "chunk_cache_bytes")
+        self.max_bytes = max_bytes
+        if prefetch is None:
+            prefetch = ytcfg.getboolean("yt", "chunk_cache_prefetch")
+        self.prefetch = prefetch
         self.preload_fields = preload_fields
         self.geometry_handler = geometry_handler
         self.cache = {}
+        self.io_wait_time = 0.0
+        self.nbatches = 0
+        self._particle_types = getattr(geometry_handler.ds,
+                                       "particle_types", ())
+        self._pending = None
+        self._exhausted = False
+        if self.prefetch:
+            self._pending = self._start_batch()
 
     def __iter__(self):
         return self
-    
+
+    def _grid_bytes(self, g):
+        nbytes = 0
+        for ftype, fname in self.preload_fields:
+            if ftype in self._particle_types:
+                count = getattr(g, "NumberOfParticles", 0)
+            else:
+                count = g.ActiveDimensions.prod()
+            nbytes += count * self._itemsize
+        return nbytes
+
+    def _next_batch(self):
+        batch = []
+        nbytes = 0
+        while not self._exhausted:
+            if self.max_length is not None and len(batch) >= self.max_length:
+                break
+            try:
+                g = self.base_iter.next()
+            except StopIteration:
+                self._exhausted = True
+                break
+            batch.append(g)
+            nbytes += self._grid_bytes(g)
+            if nbytes >= self.max_bytes:
+                break
+        return batch
+
+    def _read_batch(self, batch):
+        chunk = YTDataChunk(None, "cache", batch, cache=False)
+        return self.geometry_handler.io._read_chunk_data(
+            chunk, self.preload_fields) or {}
+
+    def _start_batch(self):
+        batch = self._next_batch()
+        if len(batch) == 0: return None
+        return _BatchReader(self._read_batch, batch)
+
+    def _load(self):
+        t1 = time.time()
+        if self.prefetch:
+            reader = self._pending
+            if reader is None: raise StopIteration
+            batch, cache = reader.result()
+            # Now that we have this batch, start reading the next one while
+            # this one is being processed.
+            self._pending = self._start_batch()
+        else:
+            batch = self._next_batch()
+            if len(batch) == 0: raise StopIteration
+            cache = self._read_batch(batch)
+        self.io_wait_time += time.time() - t1
+        self.nbatches += 1
+        self.queue = batch
+        self.cache = cache
+
     def next(self):
         if len(self.queue) == 0:
-            for i in range(self.max_length):
-                try:
-                    self.queue.append(self.base_iter.next())
-                except StopIteration:
-                    break
-            # If it's still zero ...
-            if len(self.queue) == 0: raise StopIteration
-            chunk = YTDataChunk(None, "cache", self.queue, cache=False)
-            self.cache = self.geometry_handler.io._read_chunk_data(
-                chunk, self.preload_fields) or {}
+            try:
+                self._load()
+            except StopIteration:
+                mylog.debug("Spent %0.3e s waiting on IO for %s batches",
+                            self.io_wait_time, self.nbatches)
+                raise
         g = self.queue.pop(0)
         g._initialize_cache(self.cache.pop(g.id, {}))
         return g
 
+class _BatchReader(object):
+    # This reads a batch of grids on a background thread, holding on to
+    # any exception so that it can be re-raised in the calling thread.
+    def __init__(self, func, batch):
+        self.batch = batch
+        self._func = func
+        self._value = self._error = None
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._value = self._func(self.batch)
+        except Exception:
+            self._error = sys.exc_info()
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self.batch, self._value
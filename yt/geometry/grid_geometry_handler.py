@@ -18,6 +18,8 @@ import numpy as np
 import string, re, gc, time, cPickle
 import weakref
 
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from itertools import chain, izip
 
 from yt.funcs import *
@@ -33,18 +35,257 @@ from yt.utilities.io_handler import io_registry
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     ParallelAnalysisInterface
 from yt.utilities.lib.GridTree import GridTree, MatchPointsToGrids
+from yt.utilities.lib.CICDeposit import CICSample_3
+from yt.units.yt_array import YTArray
 
 from yt.data_objects.data_containers import data_object_registry
 
+class GridSelectionCache(object):
+    r"""A bounded, least-recently-used cache of grid selections.
+
+    Entries are keyed by (selector hash, grid id) and hold the number of
+    cells the selector picks out of the grid and, optionally, the selection
+    mask packed into bits.  This lets us avoid re-evaluating the same
+    selector against the same grid every time a data object is chunked.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of (selector, grid) pairs to hold on to.
+    store_masks : bool
+        Whether to keep packed selection masks as well as counts.
+    """
+    def __init__(self, max_size = 65536, store_masks = False):
+        self.max_size = max_size
+        self.store_masks = store_masks
+        self._entries = OrderedDict()
+        self.stats = dict(count_hits = 0, count_misses = 0,
+                          mask_hits = 0, mask_misses = 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        # Move the entry to the most-recently-used end of the queue
+        entry = self._entries.pop(key)
+        self._entries[key] = entry
+        return entry
+
+    def get_count(self, key):
+        try:
+            count, packed = self._lookup(key)
+        except KeyError:
+            self.stats["count_misses"] += 1
+            raise
+        self.stats["count_hits"] += 1
+        return count
+
+    def get_mask(self, key, shape):
+        try:
+            count, packed = self._lookup(key)
+            if count > 0 and packed is None:
+                raise KeyError(key)
+        except KeyError:
+            self.stats["mask_misses"] += 1
+            raise
+        self.stats["mask_hits"] += 1
+        if count == 0:
+            return None, 0
+        size = np.prod(shape)
+        mask = np.unpackbits(packed)[:size].astype("bool").reshape(shape)
+        return mask, count
+
+    def store(self, key, mask, count):
+        if self.max_size <= 0: return
+        packed = None
+        if self.store_masks and mask is not None:
+            packed = np.packbits(mask.ravel().astype("uint8"))
+        self._entries.pop(key, None)
+        self._entries[key] = (count, packed)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last = False)
+
+    def clear(self):
+        self._entries.clear()
+
+class GridDataCache(object):
+    r"""A bounded, least-recently-used cache of whole-grid fluid data.
+
+    Entries are keyed by (grid id, field) and hold the full array of the
+    field on the grid.  While the cache is active on a GridIndex, fluid
+    fields read by data objects are selected out of cached grid data, and
+    the (grid, field) pairs that are missing are read from disk together.
+    This lets many overlapping data objects read one after another, such as
+    spheres around neighbouring halos, share the reads of their grids.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The budget, in bytes, for cached grid data.  Least recently used
+        entries are dropped once it is exceeded.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self.stats = dict(hits = 0, misses = 0, reads = 0,
+                          bytes_read = 0, evictions = 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        # Move the entry to the most-recently-used end of the queue
+        entry = self._entries.pop(key)
+        self._entries[key] = entry
+        return entry
+
+    def store(self, key, data):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self._entries[key] = data
+        self.nbytes += data.nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 0:
+            k, v = self._entries.popitem(last = False)
+            self.nbytes -= v.nbytes
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def fetch(self, index, grids, fields):
+        r"""Return a dict mapping the id of each grid to a dict of the full
+        arrays of *fields* on it, reading whatever is not already cached.
+        """
+        rv = {}
+        to_read = defaultdict(list)
+        for g in grids:
+            gf = rv[g.id] = {}
+            needed = []
+            for field in fields:
+                try:
+                    gf[field] = self._lookup((g.id, field))
+                except KeyError:
+                    needed.append(field)
+            self.stats["hits"] += len(fields) - len(needed)
+            self.stats["misses"] += len(needed)
+            if len(needed) > 0:
+                to_read[tuple(needed)].append(g)
+        # Grids missing the same fields are read in one go, which lets the
+        # IO handler open each file once.
+        for needed, gs in to_read.items():
+            data = self._read(index, gs, list(needed))
+            self.stats["reads"] += 1
+            for g in gs:
+                for field in needed:
+                    vals = data[g.id][field]
+                    self.stats["bytes_read"] += vals.nbytes
+                    self.store((g.id, field), vals)
+                    rv[g.id][field] = vals
+        return rv
+
+    def _read(self, index, grids, fields):
+        data = {}
+        if index._preload_implemented:
+            chunk = YTDataChunk(None, "cache", grids, cache = False)
+            data = index.io._read_chunk_data(chunk, fields) or {}
+        for g in grids:
+            gf = data.setdefault(g.id, {})
+            missing = [field for field in fields if field not in gf]
+            if len(missing) == 0: continue
+            if index._preload_implemented:
+                # As when a grid reads itself, fields that are not on disk
+                # for this grid are zero.
+                for field in missing:
+                    gf[field] = np.zeros(g.ActiveDimensions, dtype="float64")
+                continue
+            size = g.ActiveDimensions.prod()
+            chunk = YTDataChunk(g, "io", [g], size, cache = False)
+            vals = index.io._read_fluid_selection(
+                [chunk], g.selector, missing, size)
+            for field in missing:
+                gf[field] = np.asarray(vals[field], dtype="float64").reshape(
+                    g.ActiveDimensions, order="C")
+        return data
+
+class GridSequence(object):
+    r"""A sequence of grid objects that are only created when asked for.
+
+    This behaves like the object array of grids held by an index: it can be
+    indexed by integers, slices, boolean masks and integer arrays, and
+    iterated over.  Grid objects are built by the index's
+    ``_materialize_grid`` method the first time they are requested, and are
+    only held on to for as long as something else refers to them.
+
+    Parameters
+    ----------
+    index : GridIndex
+        The index whose grids we hand out.
+    num_grids : int
+        The number of grids in the index.
+    """
+    def __init__(self, index, num_grids):
+        self._index = weakref.proxy(index)
+        self.num_grids = num_grids
+        self._grids = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return self.num_grids
+
+    def __iter__(self):
+        for i in xrange(self.num_grids):
+            yield self._get(i)
+
+    def _get(self, i):
+        g = self._grids.get(i, None)
+        if g is None:
+            g = self._index._materialize_grid(i)
+            self._grids[i] = g
+        return g
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, np.integer)):
+            if key < 0: key += self.num_grids
+            if not 0 <= key < self.num_grids:
+                raise IndexError(key)
+            return self._get(int(key))
+        ind = np.arange(self.num_grids)[key]
+        if ind.ndim == 0:
+            return self._get(int(ind))
+        tr = np.empty(ind.size, dtype="object")
+        for i, gi in enumerate(ind.flat):
+            tr[i] = self._get(int(gi))
+        return tr.reshape(ind.shape)
+
+    def tolist(self):
+        return list(self)
+
+    def materialized(self):
+        """
+        Returns a list of the grid objects that currently exist.
+        """
+        return self._grids.values()
+
 class GridIndex(Index):
     """The index class for patch and block AMR datasets. """
     float_type = 'float64'
     _preload_implemented = False
+    _lazy_grids_implemented = False
+    _selection_cache = None
+    _data_cache = None
     _index_properties = ("grid_left_edge", "grid_right_edge",
                          "grid_levels", "grid_particle_count",
                          "grid_dimensions")
 
     def _setup_geometry(self):
+        self._selection_cache = GridSelectionCache(
+            ytcfg.getint("yt", "selection_cache_size"),
+            ytcfg.getboolean("yt", "selection_cache_masks"))
+        self._lazy_grids = self._lazy_grids_implemented and \
+            ytcfg.getboolean("yt", "lazy_grids")
+
         mylog.debug("Counting grids.")
         self._count_grids()
 
@@ -109,13 +350,121 @@ class GridIndex(Index):
         self.grid_levels = np.zeros((self.num_grids,1), 'int32')
         self.grid_particle_count = np.zeros((self.num_grids,1), 'int32')
 
+    def _setup_lazy_grids(self, parent_ids):
+        """
+        Sets up the grids to be created on demand, with the tree of grids
+        described by the array *parent_ids* of the id of each grid's parent
+        (or -1 for root grids).
+        """
+        offset = self.grid._id_offset
+        self.grid_parent_ids = parent_ids
+        has_parent = (parent_ids != -1)
+        pind = parent_ids[has_parent] - offset
+        # A stable sort keeps each grid's children in order of their ids
+        order = np.argsort(pind, kind="mergesort")
+        self._grid_child_ids = np.where(has_parent)[0][order] + offset
+        counts = np.bincount(pind, minlength=self.num_grids)
+        self._grid_child_offsets = np.zeros(self.num_grids + 1, dtype="int64")
+        np.cumsum(counts, out=self._grid_child_offsets[1:])
+        self.grids = GridSequence(self, self.num_grids)
+
+    def _get_grid_children_ids(self, i):
+        """
+        Returns a list of the ids of the children of the grid at position
+        *i*, for indexes with lazily-created grids.
+        """
+        start, end = self._grid_child_offsets[i:i+2]
+        return self._grid_child_ids[start:end].tolist()
+
+    def _materialize_grid(self, i):
+        """
+        Creates the grid object at position *i*.  Indexes that set
+        _lazy_grids_implemented must provide this.
+        """
+        raise NotImplementedError
+
     def clear_all_data(self):
         """
         This routine clears all the data currently being held onto by the grids
         and the data io handler.
         """
-        for g in self.grids: g.clear_data()
+        if self._lazy_grids:
+            grids = self.grids.materialized()
+        else:
+            grids = self.grids
+        for g in grids: g.clear_data()
         self.io.queue.clear()
+        self._selection_cache.clear()
+        if self._data_cache is not None:
+            self._data_cache.clear()
+
+    @property
+    def selection_cache_stats(self):
+        """
+        Returns a dict of the hits and misses of the (selector, grid) cache
+        of selection counts and masks, along with its current size.
+        """
+        stats = self._selection_cache.stats.copy()
+        stats["size"] = len(self._selection_cache)
+        stats["max_size"] = self._selection_cache.max_size
+        return stats
+
+    @contextmanager
+    def cached_grid_data(self, max_bytes = None):
+        r"""Read fluid fields through a bounded cache of whole-grid data.
+
+        Within this context, fluid fields read by any data object other than
+        a single grid are selected out of a
+        :class:`~yt.geometry.grid_geometry_handler.GridDataCache`, so that
+        every grid and field is read from disk only once for as long as it
+        stays in the cache.  Least recently used grids are dropped once the
+        cache holds more than *max_bytes*, which defaults to the
+        ``chunk_cache_bytes`` configuration option.  The cache is yielded, so
+        that its ``stats`` can be inspected.
+
+        Examples
+        --------
+
+        >>> with ds.index.cached_grid_data() as cache:
+        ...     for c in centers:
+        ...         print ds.sphere(c, (100, "kpc")).quantities.total_mass()
+        >>> print cache.stats
+        """
+        if max_bytes is None:
+            max_bytes = ytcfg.getint("yt", "chunk_cache_bytes")
+        old_cache, self._data_cache = self._data_cache, GridDataCache(max_bytes)
+        try:
+            yield self._data_cache
+        finally:
+            self._data_cache = old_cache
+
+    def _read_fluid_fields(self, fields, dobj, chunk = None):
+        if self._data_cache is None or dobj._type_name == "grid":
+            return super(GridIndex, self)._read_fluid_fields(
+                fields, dobj, chunk)
+        if len(fields) == 0: return {}, []
+        fields_to_read, fields_to_generate = self._split_fields(fields)
+        if len(fields_to_read) == 0:
+            return {}, fields_to_generate
+        selector = dobj.selector
+        if chunk is None:
+            self._identify_base_chunk(dobj)
+            size = dobj.size
+        else:
+            size = chunk.data_size
+        # We go through the grids in the same order as the IO handlers do.
+        grids = [g for io_chunk in self._chunk_io(dobj, cache = False)
+                 for g in io_chunk.objs]
+        if size is None:
+            size = sum(g.count(selector) for g in grids)
+        data = self._data_cache.fetch(self, grids, fields_to_read)
+        fields_to_return = {}
+        for field in fields_to_read:
+            rv = fields_to_return[field] = np.empty(size, dtype="float64")
+            ind = 0
+            for g in grids:
+                ind += g.select(selector, data[g.id][field], rv, ind)
+        return fields_to_return, fields_to_generate
 
     def get_smallest_dx(self):
         """
@@ -204,31 +553,90 @@ class GridIndex(Index):
     def _find_field_values_at_points(self, fields, coords):
         r"""Find the value of fields at a set of coordinates.
 
-        Returns the values [field1, field2,...] of the fields at the given
-        (x, y, z) points. Returns a numpy array of field values cross coords
+        Returns the values [field1, field2,...] of the fields in the cells
+        containing the given (x, y, z) points, as an array of shape
+        (len(fields), len(coords)) in the order of the points.  The points
+        are assigned to their finest grids through the grid tree, and each of
+        those grids is read once for all of the fields.  Points that are not
+        inside any grid are given NaN.
         """
-        coords = YTArray(ensure_numpy_array(coords),'code_length', registry=self.ds.unit_registry)
-        grids = self._find_points(coords[:,0], coords[:,1], coords[:,2])[0]
         fields = ensure_list(fields)
-        mark = np.zeros(3, dtype=np.int)
-        out = []
-
-        # create point -> grid mapping
-        grid_index = {}
-        for coord_index, grid in enumerate(grids):
-            if not grid_index.has_key(grid):
-                grid_index[grid] = []
-            grid_index[grid].append(coord_index)
-
-        out = np.zeros((len(fields),len(coords)), dtype=np.float64)
-        for grid in grid_index:
-            cellwidth = (grid.RightEdge - grid.LeftEdge) / grid.ActiveDimensions
-            for field in fields:
-                for coord_index in grid_index[grid]:
-                    mark = ((coords[coord_index,:] - grid.LeftEdge) / cellwidth).astype('int')
-                    out[:,coord_index] = grid[field][mark[0],mark[1],mark[2]]
+        if isinstance(coords, YTArray):
+            coords = coords.in_units("code_length")
+        coords = np.asarray(coords, dtype="float64").reshape(-1, 3)
+        x, y, z = [np.ascontiguousarray(coords[:,i]) for i in range(3)]
+        out = np.empty((len(fields), x.size), dtype="float64")
+        out[:] = np.nan
+        for grid, points in self._group_points_by_grid(x, y, z):
+            ind = ((coords[points] - np.array(grid.LeftEdge)) /
+                   np.array(grid.dds)).astype("int64")
+            ind = np.minimum(np.maximum(ind, 0), grid.ActiveDimensions - 1)
+            grid.get_data(fields)
+            for i, field in enumerate(fields):
+                out[i,points] = grid[field][ind[:,0], ind[:,1], ind[:,2]]
+        return out
+
+    def sample_field_values_at_points(self, fields, coords):
+        r"""Interpolate the values of fields to a set of points.
+
+        The points are sorted by the finest grid containing them.  Each grid
+        that holds any of the points is then read once, along with one layer
+        of ghost zones from its neighbors, and the fields are interpolated
+        trilinearly (cloud-in-cell) to the points inside it.  Points that are
+        not inside any grid are given NaN.
+
+        Parameters
+        ----------
+        fields : string or list of strings
+            The fields to sample.
+        coords : array_like
+            The (N, 3) positions of the points, in code units of length if
+            they do not carry units.
+
+        Returns
+        -------
+        An array of shape (len(fields), N) with the values of the fields at
+        the points, in the order the points were given.
+
+        Examples
+        --------
+        >>> pos = np.random.random((1000, 3))
+        >>> dens, temp = ds.index.sample_field_values_at_points(
+        ...     ["density", "temperature"], pos)
+        """
+        fields = ensure_list(fields)
+        if isinstance(coords, YTArray):
+            coords = coords.in_units("code_length")
+        coords = np.asarray(coords, dtype="float64").reshape(-1, 3)
+        x, y, z = [np.ascontiguousarray(coords[:,i]) for i in range(3)]
+        out = np.empty((len(fields), x.size), dtype="float64")
+        out[:] = np.nan
+        for grid, points in self._group_points_by_grid(x, y, z):
+            cube = grid.retrieve_ghost_zones(1, fields)
+            # The interpolation runs over the grid padded by its ghost zones
+            left_edge = np.array(grid.LeftEdge - grid.dds, dtype="float64")
+            dims = (grid.ActiveDimensions + 2).astype("int32")
+            px, py, pz = x[points], y[points], z[points]
+            for i, field in enumerate(fields):
+                sample = np.zeros(points.size, dtype="float64")
+                CICSample_3(px, py, pz, sample, points.size,
+                            np.asarray(cube[field], dtype="float64"),
+                            left_edge, dims, float(grid.dds[0]))
+                out[i,points] = sample
         return out
 
+    def _group_points_by_grid(self, x, y, z):
+        """
+        Sort points by the finest grid containing them, yielding each grid
+        that holds any of the points with the indices of those points.
+        """
+        ind = self._find_points(x, y, z)[1]
+        order = np.argsort(ind, kind="mergesort")
+        grid_ids, starts = np.unique(ind[order], return_index=True)
+        ends = np.append(starts[1:], order.size)
+        for grid_id, start, end in zip(grid_ids, starts, ends):
+            if grid_id < 0: continue
+            yield self.grids[grid_id], order[start:end]
 
     def _find_points(self, x, y, z) :
         """
@@ -247,10 +655,24 @@ class GridIndex(Index):
 
     def _get_grid_tree(self) :
 
-        left_edge = self.ds.arr(np.zeros((self.num_grids, 3)),
-                               'code_length')
-        right_edge = self.ds.arr(np.zeros((self.num_grids, 3)),
-                                'code_length')
+        if self._lazy_grids:
+            # We can build this directly from the index arrays without
+            # creating every grid object.
+            offset = self.grid._id_offset
+            parent_ind = self.grid_parent_ids.copy()
+            parent_ind[parent_ind != -1] -= offset
+            num_children = np.diff(self._grid_child_offsets)
+            return GridTree(self.num_grids,
+                            self.grid_left_edge.astype("float64"),
+                            self.grid_right_edge.astype("float64"),
+                            parent_ind.astype("int64"),
+                            self.grid_levels[:,0].astype("int64"),
+                            num_children)
+
+        # The edges are plain arrays in code units, as setting rows of a
+        # YTArray one grid at a time is slow.
+        left_edge = np.zeros((self.num_grids, 3), dtype='float64')
+        right_edge = np.zeros((self.num_grids, 3), dtype='float64')
         level = np.zeros((self.num_grids), dtype='int64')
         parent_ind = np.zeros((self.num_grids), dtype='int64')
         num_children = np.zeros((self.num_grids), dtype='int64')
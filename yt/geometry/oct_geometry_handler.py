@@ -31,6 +31,7 @@ from yt.utilities.definitions import MAXLEVEL
 from yt.utilities.io_handler import io_registry
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     ParallelAnalysisInterface
+from yt.units.yt_array import YTArray
 
 from yt.data_objects.data_containers import data_object_registry
 
@@ -49,3 +50,75 @@ class OctreeIndex(Index):
 
     def convert(self, unit):
         return self.dataset.conversion_factors[unit]
+
+    def _find_field_values_at_points(self, fields, coords):
+        r"""Find the value of fields at a set of coordinates.
+
+        Returns the values [field1, field2,...] of the fields in the cells
+        containing the given (x, y, z) points, as an array of shape
+        (len(fields), len(coords)) in the order of the points.  The cells of
+        each IO chunk covering the points are matched to the points through
+        the integer coordinates of the oct container, level by level, and
+        the fields are only read for chunks holding any of the points.
+        Points outside the domain are given NaN.
+        """
+        fields = ensure_list(fields)
+        if isinstance(coords, YTArray):
+            coords = coords.in_units("code_length")
+        coords = np.asarray(coords, dtype="float64").reshape(-1, 3)
+        out = np.empty((len(fields), coords.shape[0]), dtype="float64")
+        out[:] = np.nan
+        if coords.shape[0] == 0: return out
+        DLE = np.array(self.ds.domain_left_edge.in_units("code_length"))
+        DRE = np.array(self.ds.domain_right_edge.in_units("code_length"))
+        dims = self.ds.domain_dimensions.astype("int64")
+        # Only the chunks overlapping the points need to be looked at; the
+        # padding keeps the region from being empty for a single point.
+        pad = (DRE - DLE) * 1e-8
+        left = np.maximum(coords.min(axis=0) - pad, DLE)
+        right = np.minimum(coords.max(axis=0) + pad, DRE)
+        source = self.ds.region((left + right) / 2.0, left, right)
+        todo = np.arange(coords.shape[0])
+        for chunk in source.chunks([], "io"):
+            if todo.size == 0: break
+            icoords = chunk.icoords
+            ires = chunk.ires
+            cell_ind = np.empty(todo.size, dtype="int64")
+            cell_ind[:] = -1
+            for level in np.unique(ires):
+                cells = np.where(ires == level)[0]
+                nd = dims << level
+                ipos = np.floor((coords[todo] - DLE) / (DRE - DLE) *
+                                nd).astype("int64")
+                match = self._match_cells(icoords[cells], ipos)
+                found = match >= 0
+                cell_ind[found] = cells[match[found]]
+            hit = np.where(cell_ind >= 0)[0]
+            if hit.size == 0: continue
+            chunk.get_data(fields)
+            for i, field in enumerate(fields):
+                out[i,todo[hit]] = chunk[field][cell_ind[hit]]
+            todo = todo[cell_ind < 0]
+        return out
+
+    def _match_cells(self, icoords, ipos):
+        # The index into icoords of the cell at each of the integer positions
+        # ipos, or -1.  Packing the three coordinates into a single key would
+        # overflow on deep levels, so we sort cells and points together on
+        # the coordinate columns, cells ahead of points at the same place,
+        # and look back from each point to the last cell before it.
+        ncells = icoords.shape[0]
+        both = np.concatenate([icoords, ipos])
+        is_point = np.arange(both.shape[0]) >= ncells
+        order = np.lexsort((is_point, both[:,2], both[:,1], both[:,0]))
+        last = np.where(order < ncells, np.arange(order.size), -1)
+        last = np.maximum.accumulate(last)
+        points = np.where(order >= ncells)[0]
+        last = last[points]
+        match = np.empty(ipos.shape[0], dtype="int64")
+        match[:] = -1
+        ok = last >= 0
+        points, last = points[ok], last[ok]
+        same = (both[order[points]] == both[order[last]]).all(axis=1)
+        match[order[points[same]] - ncells] = order[last[same]]
+        return match
@@ -28,11 +28,14 @@ from yt.config import ytcfg
 from yt.fields.field_info_container import NullFunc
 from yt.geometry.geometry_handler import Index, YTDataChunk
 from yt.geometry.particle_oct_container import \
-    ParticleOctreeContainer, ParticleRegions
+    ParticleOctreeContainer, ParticleRegions, merge_sorted_indices
+from yt.geometry.selection_routines import ParticleDomainSelector
+from yt.utilities.lib.geometry_utils import compute_morton
 from yt.utilities.definitions import MAXLEVEL
 from yt.utilities.io_handler import io_registry
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
-    ParallelAnalysisInterface
+    ParallelAnalysisInterface, using_process_pool
+from yt.utilities.parallel_tools.process_pool import process_map
 
 from yt.data_objects.data_containers import data_object_registry
 from yt.data_objects.octree_subset import ParticleOctreeSubset
@@ -40,6 +43,8 @@ from yt.data_objects.octree_subset import ParticleOctreeSubset
 class ParticleIndex(Index):
     """The Index subclass for particle datasets"""
     _global_mesh = False
+    _domain_left_edges = None
+    _domain_right_edges = None
 
     def __init__(self, ds, dataset_type):
         self.dataset_type = dataset_type
@@ -86,33 +91,256 @@ class ParticleIndex(Index):
         self.regions = ParticleRegions(
                 ds.domain_left_edge, ds.domain_right_edge,
                 [N, N, N], len(self.data_files))
-        self._initialize_indices()
-        self.oct_handler.finalize()
+        cached = False
+        if ytcfg.getboolean("yt", "index_cache"):
+            cached = self._load_index_cache()
+        if not cached:
+            self._initialize_indices()
+            self.oct_handler.finalize()
+            if ytcfg.getboolean("yt", "index_cache"):
+                self._save_index_cache()
         self.max_level = self.oct_handler.max_level
         tot = sum(self.oct_handler.recursively_count().values())
         mylog.info("Identified %0.3e octs", tot)
+        self._setup_domains()
+
+    def _setup_domains(self):
+        # IO chunks are split up by spatial domains of the octree, each made
+        # of the leaves holding the particles of a group of data files with
+        # roughly particle_chunk_size particles between them, so that every
+        # file is read by a single domain.  Files are taken in the order of
+        # the Morton indices of their particles, and files whose ranges of
+        # indices overlap are kept in one group, as splitting them would
+        # mean reading them more than once.  We keep the range of Morton
+        # indices of every domain, its edges, the data files that overlap
+        # it and an estimate of how many particles it holds.
+        self._domain_left_edges = self._domain_right_edges = None
+        self._domain_data_files = []
+        self._domain_particle_counts = None
+        chunk_size = ytcfg.getint("yt", "particle_chunk_size")
+        if chunk_size <= 0 or self.total_particles <= chunk_size: return
+        counts = np.array([sum(data_file.total_particles.values())
+                           for data_file in self.data_files], dtype="float64")
+        first, last = self._file_morton_ranges.T
+        split_at = []
+        group_size = group_last = 0
+        for i in np.argsort(first, kind="mergesort"):
+            if counts[i] == 0: continue
+            if group_size > 0 and group_size + counts[i] > chunk_size \
+               and group_last < first[i]:
+                split_at.append(first[i])
+                group_size = 0
+            group_size += counts[i]
+            group_last = max(group_last, last[i])
+        if len(split_at) == 0: return
+        starts, LE, RE = self.oct_handler.assign_domains(0, split_at)
+        if starts.size <= 1: return
+        self._domain_indices = zip(starts, list(starts[1:]) + [0])
+        self._domain_left_edges = LE
+        self._domain_right_edges = RE
+        # Only the files whose particles fall in the range of indices of a
+        # domain need to be read for it.
+        ends = np.append(starts[1:], np.iinfo("uint64").max)
+        domain_files = self._identify_domain_data_files(starts)
+        self._domain_data_files = []
+        for i, (file_ids, neighbor_ids) in enumerate(domain_files):
+            in_range = (first < ends[i]) & (last >= starts[i])
+            file_ids = file_ids & set(np.flatnonzero(in_range).tolist())
+            self._domain_data_files.append((file_ids, neighbor_ids))
+        # The particles of each data file are counted as spread evenly over
+        # the domains it has particles in.
+        shares = np.zeros(len(self.data_files), dtype="int64")
+        for file_ids, neighbor_ids in self._domain_data_files:
+            shares[list(file_ids)] += 1
+        shares[shares == 0] = 1
+        self._domain_particle_counts = np.array(
+            [(counts[list(file_ids)] / shares[list(file_ids)]).sum()
+             for file_ids, neighbor_ids in self._domain_data_files])
+        mylog.debug("Split the octree into %s domains", LE.shape[0])
+
+    def _identify_domain_data_files(self, starts):
+        # Every cell of the region finder spans a range of Morton indices,
+        # and so of domains.  A domain holds particles from the data files
+        # of the cells whose range it is in, and for smoothing it also needs
+        # the particles just across its edges, from the files of the
+        # neighbours of those cells.
+        ds = self.dataset
+        DLE = ds.domain_left_edge.d
+        DRE = ds.domain_right_edge.d
+        dims = self.regions.masks[0].shape
+        edges = [np.linspace(DLE[i], DRE[i], dims[i] + 1) for i in range(3)]
+        dom_ranges = []
+        for corner in ("left", "right"):
+            # The bits of each axis are interleaved separately and then
+            # combined for every cell.
+            morton = np.zeros(dims, dtype="uint64")
+            for i in range(3):
+                e = edges[i]
+                if corner == "left":
+                    e = e[:-1]
+                else:
+                    e = np.nextafter(e[1:], e[:-1])
+                pos = [np.zeros(e.size) + DLE[j] for j in range(3)]
+                pos[i] = e
+                shape = [1, 1, 1]
+                shape[i] = e.size
+                morton |= compute_morton(pos[0], pos[1], pos[2],
+                                         DLE, DRE).reshape(shape)
+            dom = np.searchsorted(starts, morton.ravel(), side="right") - 1
+            dom_ranges.append(dom)
+        grown_masks = []
+        for mask in self.regions.masks:
+            for axis in range(3):
+                m = np.rollaxis(mask, axis)
+                grown = m.copy()
+                grown[1:] |= m[:-1]
+                grown[:-1] |= m[1:]
+                mask = np.rollaxis(grown, 0, axis + 1)
+            grown_masks.append(mask)
+        # Cells with the same range of domains are grouped together, so that
+        # we only have to combine their masks once.
+        ndomains = starts.size
+        groups = dom_ranges[0] * ndomains + dom_ranges[1]
+        order = np.argsort(groups, kind="mergesort")
+        groups = groups[order]
+        first = np.concatenate([[0], np.flatnonzero(np.diff(groups)) + 1])
+        file_ids = []
+        for masks in (self.regions.masks, grown_masks):
+            fmasks = [np.bitwise_or.reduceat(mask.ravel()[order], first)
+                      for mask in masks]
+            ids = [set() for i in range(ndomains)]
+            for g, group in enumerate(groups[first]):
+                gids = set(n * 64 + b for n, fmask in enumerate(fmasks)
+                           for b in range(64) if (int(fmask[g]) >> b) & 1)
+                for i in range(group // ndomains, group % ndomains + 1):
+                    ids[i].update(gids)
+            file_ids.append(ids)
+        return zip(*file_ids)
 
     def _initialize_indices(self):
-        # This will be replaced with a parallel-aware iteration step.
-        # Roughly outlined, what we will do is:
-        #   * Generate Morton indices on each set of files that belong to
-        #     an individual processor
-        #   * Create a global, accumulated histogram
-        #   * Cut based on estimated load balancing
-        #   * Pass particles to specific processors, along with NREF buffer
-        #   * Broadcast back a serialized octree to join
-        #
-        # For now we will do this in serial.
-        morton = np.empty(self.total_particles, dtype="uint64")
-        ind = 0
-        for data_file in self.data_files:
-            npart = sum(data_file.total_particles.values())
-            morton[ind:ind + npart] = \
-                self.io._initialize_index(data_file, self.regions)
-            ind += npart
-        morton.sort()
+        # Morton indices are generated and sorted one data file at a time,
+        # with the data files spread over worker processes if there are any,
+        # and the sorted runs are then merged before being added to the
+        # octree, which requires them in order.
+        # The range of Morton indices of the particles in each data file is
+        # kept for splitting the octree into domains.
+        if using_process_pool():
+            def _index_files(worker_id, nworkers):
+                runs = [self._initialize_data_file(data_file) for data_file
+                        in self.data_files[worker_id::nworkers]]
+                return runs, self.regions.masks
+            runs = [None] * len(self.data_files)
+            results = process_map(_index_files)
+            for worker_id, (my_runs, masks) in enumerate(results):
+                runs[worker_id::len(results)] = my_runs
+                for mask, my_mask in zip(self.regions.masks, masks):
+                    mask |= my_mask
+        else:
+            runs = [self._initialize_data_file(data_file)
+                    for data_file in self.data_files]
+        self._file_morton_ranges = np.array(
+            [(run[0], run[-1]) if run.size > 0
+             else (np.iinfo("uint64").max, 0) for run in runs],
+            dtype="uint64").reshape(-1, 2)
+        if len(runs) == 0:
+            runs = [np.empty(0, dtype="uint64")]
+        while len(runs) > 1:
+            merged = [merge_sorted_indices(runs[i], runs[i + 1])
+                      for i in range(0, len(runs) - 1, 2)]
+            if len(runs) % 2 == 1:
+                merged.append(runs[-1])
+            runs = merged
         # Now we add them all at once.
-        self.oct_handler.add(morton)
+        self.oct_handler.add(runs[0])
+
+    def _initialize_data_file(self, data_file):
+        morton = self.io._initialize_index(data_file, self.regions)
+        morton = np.ascontiguousarray(morton, dtype="uint64")
+        morton.sort()
+        return morton
+
+    @property
+    def _index_cache_filename(self):
+        return "%s.ytindex" % (self.index_filename)
+
+    def _data_file_stats(self):
+        # The sizes and modification times of the data files, against which
+        # a cached index is checked, or None if they are not all on disk.
+        try:
+            st = [os.stat(data_file.filename) for data_file in self.data_files]
+        except (OSError, TypeError):
+            return None
+        return (np.array([s.st_size for s in st], dtype="int64"),
+                np.array([s.st_mtime for s in st], dtype="float64"))
+
+    def _index_cache_attrs(self):
+        ds = self.dataset
+        return {"n_ref": ds.n_ref,
+                "over_refine_factor": ds.over_refine_factor,
+                "domain_left_edge": np.array(ds.domain_left_edge),
+                "domain_right_edge": np.array(ds.domain_right_edge),
+                "total_particles": self.total_particles}
+
+    def _load_index_cache(self):
+        fn = self._index_cache_filename
+        stats = self._data_file_stats()
+        if stats is None or not os.path.exists(fn): return False
+        try:
+            f = h5py.File(fn, "r")
+        except IOError:
+            return False
+        try:
+            valid = np.array_equal(f["file_sizes"][:], stats[0]) and \
+                    np.array_equal(f["file_mtimes"][:], stats[1])
+            for name, value in self._index_cache_attrs().items():
+                valid = valid and np.array_equal(f.attrs[name], value)
+            if not valid:
+                mylog.debug("Index cache %s is out of date", fn)
+                return False
+            masks = f["region_masks"][:]
+            flags = f["refined_flags"][:]
+            ranges = f["file_morton_ranges"][:]
+        except KeyError:
+            return False
+        finally:
+            f.close()
+        if masks.shape != (len(self.regions.masks),) + \
+                          self.regions.masks[0].shape or \
+           ranges.shape != (len(self.data_files), 2):
+            return False
+        for mask, cached in zip(self.regions.masks, masks):
+            mask[:] = cached
+        self.oct_handler.load_refined_flags(flags)
+        self._file_morton_ranges = ranges
+        mylog.debug("Loaded index from %s", fn)
+        return True
+
+    def _save_index_cache(self):
+        if self.comm.rank not in (0, None): return
+        stats = self._data_file_stats()
+        if stats is None: return
+        fn = self._index_cache_filename
+        # We write to a temporary file and then move it into place, so that
+        # nobody ever sees a partially written cache.
+        tfn = "%s.%s" % (fn, os.getpid())
+        try:
+            f = h5py.File(tfn, "w")
+        except IOError:
+            mylog.debug("Could not write index cache %s", fn)
+            return
+        for name, value in self._index_cache_attrs().items():
+            f.attrs[name] = value
+        f.create_dataset("file_sizes", data = stats[0])
+        f.create_dataset("file_mtimes", data = stats[1])
+        f.create_dataset("refined_flags",
+                         data = self.oct_handler.get_refined_flags(),
+                         compression = "gzip")
+        f.create_dataset("region_masks", data = np.array(self.regions.masks),
+                         compression = "gzip")
+        f.create_dataset("file_morton_ranges",
+                         data = self._file_morton_ranges)
+        f.close()
+        os.rename(tfn, fn)
 
     def _detect_output_fields(self):
         # TODO: Add additional fields
@@ -140,8 +368,10 @@ class ParticleIndex(Index):
                               self.regions.identify_data_files(dobj.selector)]
             base_region = getattr(dobj, "base_region", dobj)
             oref = self.dataset.over_refine_factor
+            domain_id = getattr(dobj, "domain_id", -1)
             subset = [ParticleOctreeSubset(base_region, data_files, 
-                        self.dataset, over_refine_factor = oref)]
+                        self.dataset, over_refine_factor = oref,
+                        domain_id = domain_id)]
             dobj._chunk_info = subset
         dobj._current_chunk = list(self._chunk_all(dobj))[0]
 
@@ -166,7 +396,62 @@ class ParticleIndex(Index):
     def _chunk_io(self, dobj, cache = True, local_only = False):
         oobjs = getattr(dobj._current_chunk, "objs", dobj._chunk_info)
         for subset in oobjs:
-            yield YTDataChunk(dobj, "io", [subset], None, cache = cache)
+            for dsubset in self._domain_subsets(dobj, subset):
+                yield YTDataChunk(dobj, "io", [dsubset], None, cache = cache)
+
+    def _domain_subsets(self, dobj, subset):
+        # Data objects are read one domain at a time, from the data files
+        # that overlap each domain, rather than all at once.  Subsets of the
+        # octree are left as they are.
+        if self._domain_left_edges is None or subset.domain_id > 0 or \
+           isinstance(dobj, ParticleOctreeSubset):
+            yield subset
+            return
+        LE, RE = self._domain_left_edges, self._domain_right_edges
+        levels = np.zeros((LE.shape[0], 1), dtype="int32")
+        selected = dobj.selector.select_grids(LE, RE, levels)
+        oref = self.dataset.over_refine_factor
+        for i in np.where(selected)[0]:
+            # Fields are generated on the subset from the particles of the
+            # files around the domain too, for the sake of smoothing.
+            file_ids = self._domain_data_files[i][1]
+            data_files = [data_file for data_file in subset.data_files
+                          if data_file.file_id in file_ids]
+            min_ind, max_ind = self._domain_indices[i]
+            yield ParticleOctreeSubset(subset.base_region, data_files,
+                self.dataset, min_ind, max_ind, over_refine_factor = oref,
+                domain_id = i + 1,
+                particle_count = self._domain_particle_counts[i])
+
+    def _read_particle_fields(self, fields, dobj, chunk = None):
+        if len(fields) == 0: return {}, []
+        fields_to_read, fields_to_generate = self._split_fields(fields)
+        if len(fields_to_read) == 0:
+            return {}, fields_to_generate
+        if chunk is None:
+            self._identify_base_chunk(dobj)
+        # Whatever makes up the current chunk is read in one go, without
+        # being split up into domains.
+        oobjs = getattr(dobj._current_chunk, "objs", dobj._chunk_info)
+        selector = dobj.selector
+        if len(oobjs) == 1 and oobjs[0].domain_id > 0 and \
+           not isinstance(dobj, ParticleOctreeSubset):
+            # Only the files with particles in the domain need to be read.
+            # Neighbouring domains share data files, so we only keep the
+            # particles that belong to this one.
+            subset = oobjs[0]
+            file_ids = self._domain_data_files[subset.domain_id - 1][0]
+            data_files = [data_file for data_file in subset.data_files
+                          if data_file.file_id in file_ids]
+            oobjs = [ParticleOctreeSubset(subset.base_region, data_files,
+                self.dataset, subset.min_ind, subset.max_ind,
+                over_refine_factor = self.dataset.over_refine_factor,
+                domain_id = subset.domain_id)]
+            selector = ParticleDomainSelector(oobjs[0])
+        fields_to_return = self.io._read_particle_selection(
+            [YTDataChunk(dobj, "io", oobjs, None, cache = False)],
+            selector, fields_to_read)
+        return fields_to_return, fields_to_generate
 
 class ParticleDataChunk(YTDataChunk):
     def __init__(self, oct_handler, regions, *args, **kwargs):
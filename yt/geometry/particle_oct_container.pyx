@@ -124,6 +124,149 @@ cdef class ParticleOctreeContainer(OctreeContainer):
             self.oct_list[i].file_ind = -1
         self.max_level = max_level
 
+    def get_refined_flags(self):
+        # One flag per oct, in the order finalize assigns them, saying
+        # whether that oct has been refined.  This is all that is needed
+        # to rebuild the octree with load_refined_flags.
+        cdef np.int64_t i
+        cdef np.ndarray[np.uint8_t, ndim=1] flags
+        flags = np.zeros(self.nocts, dtype="uint8")
+        for i in range(self.nocts):
+            if self.oct_list[i].children != NULL:
+                flags[i] = 1
+        return flags
+
+    def load_refined_flags(self, np.ndarray[np.uint8_t, ndim=1] flags):
+        # Rebuild and finalize an octree from the flags returned by
+        # get_refined_flags, instead of adding particles to it.
+        cdef np.int64_t pos = 0
+        cdef int i, j, k
+        if self.root_mesh[0][0][0] == NULL: self.allocate_root()
+        for i in range(self.nn[0]):
+            for j in range(self.nn[1]):
+                for k in range(self.nn[2]):
+                    self.visit_load(self.root_mesh[i][j][k], flags, &pos)
+        if pos != flags.shape[0]:
+            raise RuntimeError
+        self.finalize()
+
+    cdef visit_load(self, Oct *o, np.ndarray[np.uint8_t, ndim=1] flags,
+                    np.int64_t *pos):
+        cdef int i, j, k
+        cdef Oct *noct
+        if pos[0] >= flags.shape[0]:
+            raise RuntimeError
+        pos[0] += 1
+        if flags[pos[0] - 1] == 0: return
+        o.children = <Oct **> malloc(sizeof(Oct *)*8)
+        for i in range(2):
+            for j in range(2):
+                for k in range(2):
+                    noct = self.allocate_oct()
+                    noct.domain = o.domain
+                    o.children[cind(i,j,k)] = noct
+        for i in range(2):
+            for j in range(2):
+                for k in range(2):
+                    self.visit_load(o.children[cind(i,j,k)], flags, pos)
+
+    def assign_domains(self, int ndomains, split_at = None):
+        # Split the leaf octs into ndomains domains, numbered from one, of
+        # consecutive leaves in the order the visitors walk the octree.  That
+        # is Morton order, so each domain is compact in space and holds the
+        # particles with indices from the start of its first leaf up to the
+        # start of the next domain.  Refined octs are left in domain zero.
+        # With split_at, a sorted array of Morton indices, a new domain
+        # starts instead at the leaf holding each of them, or the first leaf
+        # after it, and split points with no leaves before the next one are
+        # dropped.
+        # This returns the Morton index each domain starts at, and the left
+        # and right edges of the box around its octs.
+        cdef np.int64_t i, nleaves = 0, ileaf = 0, isplit = 0, group = -1
+        cdef int dom = -1
+        cdef np.float64_t pos[3], dds[3]
+        cdef np.ndarray[np.uint64_t, ndim=1] splits
+        for i in range(self.nocts):
+            if self.oct_list[i].children == NULL:
+                nleaves += 1
+        if split_at is None:
+            splits = np.zeros(0, dtype="uint64")
+            ndomains = max(1, min(ndomains, nleaves))
+        else:
+            splits = np.ascontiguousarray(split_at, dtype="uint64")
+            ndomains = splits.size + 1
+        cdef np.ndarray[np.uint64_t, ndim=1] starts
+        cdef np.ndarray[np.float64_t, ndim=2] left_edges, right_edges
+        starts = np.zeros(ndomains, dtype="uint64")
+        left_edges = np.empty((ndomains, 3), dtype="float64")
+        right_edges = np.empty((ndomains, 3), dtype="float64")
+        left_edges[:] = np.inf
+        right_edges[:] = -np.inf
+        # Particle octrees have a single root oct, whose Morton bits are
+        # always zero.
+        for i in range(3):
+            pos[i] = self.DLE[i]
+            dds[i] = self.DRE[i] - self.DLE[i]
+        self.visit_domains(self.root_mesh[0][0][0], pos, dds, 0, 0,
+            &ileaf, nleaves, ndomains, <np.uint64_t *> splits.data,
+            splits.size, &isplit, &group, &dom,
+            <np.uint64_t *> starts.data,
+            <np.float64_t *> left_edges.data,
+            <np.float64_t *> right_edges.data)
+        ndomains = max(dom + 1, 1)
+        return starts[:ndomains], left_edges[:ndomains], \
+               right_edges[:ndomains]
+
+    cdef void visit_domains(self, Oct *o, np.float64_t pos[3],
+                            np.float64_t dds[3], np.uint64_t prefix,
+                            int level, np.int64_t *ileaf,
+                            np.int64_t nleaves, int ndomains,
+                            np.uint64_t *splits, np.int64_t nsplits,
+                            np.int64_t *isplit, np.int64_t *group, int *dom,
+                            np.uint64_t *starts, np.float64_t *left_edges,
+                            np.float64_t *right_edges):
+        # pos is the left edge of this oct, dds its width and prefix the
+        # Morton bits of the levels above it.  group is the share of the
+        # leaves the last leaf fell in, and dom the domain it went to.
+        cdef int i, j, k, d
+        cdef np.int64_t g
+        cdef np.uint64_t start, last
+        cdef np.float64_t cpos[3], cdds[3]
+        if o.children == NULL:
+            start = prefix << ((ORDER_MAX - level) * 3)
+            last = start + ((<np.uint64_t> 1) << ((ORDER_MAX - level) * 3)) - 1
+            if nsplits == 0:
+                g = (ileaf[0] * ndomains) / nleaves
+            else:
+                while isplit[0] < nsplits and splits[isplit[0]] <= last:
+                    isplit[0] += 1
+                g = isplit[0]
+            if g != group[0]:
+                group[0] = g
+                dom[0] += 1
+                starts[dom[0]] = start
+            ileaf[0] += 1
+            d = dom[0]
+            o.domain = d + 1
+            for i in range(3):
+                left_edges[d*3 + i] = fmin(left_edges[d*3 + i], pos[i])
+                right_edges[d*3 + i] = fmax(right_edges[d*3 + i],
+                                            pos[i] + dds[i])
+            return
+        o.domain = 0
+        for i in range(3):
+            cdds[i] = dds[i] / 2.0
+        for i in range(2):
+            cpos[0] = pos[0] + i * cdds[0]
+            for j in range(2):
+                cpos[1] = pos[1] + j * cdds[1]
+                for k in range(2):
+                    cpos[2] = pos[2] + k * cdds[2]
+                    self.visit_domains(o.children[cind(i,j,k)], cpos, cdds,
+                        (prefix << 3) + cind(i,j,k), level + 1, ileaf,
+                        nleaves, ndomains, splits, nsplits, isplit, group,
+                        dom, starts, left_edges, right_edges)
+
     cdef visit_assign(self, Oct *o, np.int64_t *lpos, int level, int *max_level):
         cdef int i, j, k
         self.oct_list[lpos[0]] = o
@@ -261,6 +404,33 @@ cdef class ParticleOctreeContainer(OctreeContainer):
                         self.visit(o.children[cind(i,j,k)], counts, level + 1)
         return
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def merge_sorted_indices(np.ndarray[np.uint64_t, ndim=1] a,
+                         np.ndarray[np.uint64_t, ndim=1] b):
+    # Merge two sorted arrays of Morton indices into one sorted array.
+    cdef np.int64_t na = a.shape[0], nb = b.shape[0]
+    cdef np.int64_t i = 0, j = 0, n = 0
+    cdef np.ndarray[np.uint64_t, ndim=1] merged
+    merged = np.empty(na + nb, dtype="uint64")
+    while i < na and j < nb:
+        if b[j] < a[i]:
+            merged[n] = b[j]
+            j += 1
+        else:
+            merged[n] = a[i]
+            i += 1
+        n += 1
+    while i < na:
+        merged[n] = a[i]
+        i += 1
+        n += 1
+    while j < nb:
+        merged[n] = b[j]
+        j += 1
+        n += 1
+    return merged
+
 ctypedef fused anyfloat:
     np.float32_t
     np.float64_t
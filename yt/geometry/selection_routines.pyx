@@ -18,8 +18,9 @@ import numpy as np
 cimport numpy as np
 cimport cython
 from libc.stdlib cimport malloc, free
-from fp_utils cimport fclip, iclip, fmax, fmin
-from .oct_container cimport OctreeContainer, OctAllocationContainer, Oct
+from fp_utils cimport fclip, iclip, fmax, fmin, i64clip
+from .oct_container cimport OctreeContainer, OctAllocationContainer, Oct, \
+    ORDER_MAX
 cimport oct_visitors
 from .oct_visitors cimport cind
 from yt.utilities.lib.grid_traversal cimport \
@@ -1679,6 +1680,139 @@ cdef class IndexedOctreeSubsetSelector(SelectorObject):
 
 indexed_octree_subset_selector = IndexedOctreeSubsetSelector
 
+cdef np.uint64_t _const20 = 0x000001FFC00003FF
+cdef np.uint64_t _const10 = 0x0007E007C00F801F
+cdef np.uint64_t _const04 = 0x00786070C0E181C3
+cdef np.uint64_t _const2a = 0x0199219243248649
+cdef np.uint64_t _const2b = 0x0649249249249249
+cdef np.uint64_t _const2c = 0x1249249249249249
+
+cdef inline np.uint64_t _spread_bits(np.uint64_t x) nogil:
+    # Interleave the bits of x with two zero bits each, as
+    # yt.utilities.lib.geometry_utils does for Morton indices.
+    x = (x | (x << 20)) & _const20
+    x = (x | (x << 10)) & _const10
+    x = (x | (x << 4)) & _const04
+    x = (x | (x << 2)) & _const2a
+    x = (x | (x << 2)) & _const2b
+    x = (x | (x << 2)) & _const2c
+    return x
+
+cdef class ParticleDomainSelector(SelectorObject):
+    # This picks out the particles selected by the base selector of a
+    # particle octree subset whose Morton indices lie between its min_ind
+    # and max_ind, which is to say in the octs of its domain.  The data files
+    # of neighbouring domains overlap, so this is what keeps particles from
+    # being returned by more than one of them.
+    cdef SelectorObject base_selector
+    cdef np.uint64_t min_ind
+    cdef np.uint64_t max_ind
+    cdef np.float64_t DLE[3]
+    cdef np.float64_t DRE[3]
+    cdef np.float64_t dds[3]
+
+    def __init__(self, dobj):
+        self.base_selector = dobj.base_selector
+        self.min_ind = dobj.min_ind
+        self.max_ind = dobj.max_ind
+        self.min_level = self.base_selector.min_level
+        self.max_level = self.base_selector.max_level
+        self.overlap_cells = self.base_selector.overlap_cells
+        DLE = _ensure_code(dobj.ds.domain_left_edge)
+        DRE = _ensure_code(dobj.ds.domain_right_edge)
+        for i in range(3):
+            self.DLE[i] = DLE[i]
+            self.DRE[i] = DRE[i]
+            self.dds[i] = (self.DRE[i] - self.DLE[i]) / (1 << ORDER_MAX)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int select_index(self, np.float64_t pos[3]) nogil:
+        # This matches the Morton indices the octree is built from.
+        cdef int i
+        cdef np.uint64_t ii[3], mi
+        for i in range(3):
+            if pos[i] < self.DLE[i] or pos[i] > self.DRE[i]:
+                return 0
+            ii[i] = <np.uint64_t> ((pos[i] - self.DLE[i]) / self.dds[i])
+            ii[i] = i64clip(ii[i], 0, (1 << ORDER_MAX) - 1)
+        mi = (_spread_bits(ii[0]) << 2) | (_spread_bits(ii[1]) << 1) | \
+             _spread_bits(ii[2])
+        return self.min_ind <= mi < self.max_ind
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    def select_points(self, np.ndarray[anyfloat, ndim=1] x,
+                            np.ndarray[anyfloat, ndim=1] y,
+                            np.ndarray[anyfloat, ndim=1] z,
+                            np.float64_t radius):
+        cdef int count = 0
+        cdef np.int64_t i
+        cdef np.float64_t pos[3]
+        cdef np.ndarray[np.uint8_t, ndim=1] mask
+        base_mask = self.base_selector.select_points(x, y, z, radius)
+        if base_mask is None: return None
+        mask = base_mask.view("uint8")
+        with nogil:
+            for i in range(x.shape[0]):
+                if mask[i] == 0: continue
+                pos[0] = x[i]
+                pos[1] = y[i]
+                pos[2] = z[i]
+                mask[i] = self.select_index(pos)
+                count += mask[i]
+        if count == 0: return None
+        return mask.view("bool")
+
+    def count_points(self, np.ndarray[anyfloat, ndim=1] x,
+                           np.ndarray[anyfloat, ndim=1] y,
+                           np.ndarray[anyfloat, ndim=1] z,
+                           np.float64_t radius):
+        mask = self.select_points(x, y, z, radius)
+        if mask is None: return 0
+        return mask.sum()
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int select_point(self, np.float64_t pos[3]) nogil:
+        if self.base_selector.select_point(pos) == 0:
+            return 0
+        return self.select_index(pos)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int select_sphere(self, np.float64_t pos[3], np.float64_t radius) nogil:
+        if self.base_selector.select_sphere(pos, radius) == 0:
+            return 0
+        return self.select_index(pos)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int select_cell(self, np.float64_t pos[3], np.float64_t dds[3]) nogil:
+        return self.base_selector.select_cell(pos, dds)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int select_bbox(self, np.float64_t left_edge[3],
+                               np.float64_t right_edge[3]) nogil:
+        return self.base_selector.select_bbox(left_edge, right_edge)
+
+    cdef int select_grid(self, np.float64_t left_edge[3],
+                         np.float64_t right_edge[3], np.int32_t level,
+                         Oct *o = NULL) nogil:
+        return self.base_selector.select_grid(left_edge, right_edge, level, o)
+
+    def _hash_vals(self):
+        return (hash(self.base_selector), self.min_ind, self.max_ind)
+
+particle_domain_selector = ParticleDomainSelector
+
 cdef class AlwaysSelector(SelectorObject):
 
     def __init__(self, dobj):
@@ -0,0 +1,38 @@
+import gc
+import numpy as np
+from yt.testing import assert_equal
+from yt.geometry.grid_geometry_handler import GridSequence
+
+class FakeGrid(object):
+    def __init__(self, id):
+        self.id = id
+
+class FakeIndex(object):
+    def __init__(self, num_grids):
+        self.created = 0
+        self.grids = GridSequence(self, num_grids)
+
+    def _materialize_grid(self, i):
+        self.created += 1
+        return FakeGrid(i + 1)
+
+def test_grid_sequence():
+    index = FakeIndex(10)
+    grids = index.grids
+    yield assert_equal, len(grids), 10
+    yield assert_equal, index.created, 0
+    g = grids[3]
+    yield assert_equal, g.id, 4
+    yield assert_equal, grids[-1].id, 10
+    # Grids we still refer to are handed back, not re-created
+    yield assert_equal, grids[3] is g, True
+    mask = np.zeros(10, dtype="bool")
+    mask[[1, 3, 5]] = True
+    yield assert_equal, [h.id for h in grids[mask]], [2, 4, 6]
+    yield assert_equal, [h.id for h in grids[2:5]], [3, 4, 5]
+    yield assert_equal, [h.id for h in grids[(np.array([7, 0]),)]], [8, 1]
+    yield assert_equal, [h.id for h in grids], range(1, 11)
+    del h
+    gc.collect()
+    # Only the one we're holding on to should still be around
+    yield assert_equal, [h.id for h in grids.materialized()], [4]
@@ -6,12 +6,18 @@ from yt.geometry.particle_oct_container import \
     ParticleOctreeContainer, \
     ParticleRegions
 from yt.geometry.oct_container import _ORDER_MAX
-from yt.utilities.lib.geometry_utils import get_morton_indices
+from yt.utilities.lib.geometry_utils import get_morton_indices, \
+    compute_morton
 from yt.frontends.stream.api import load_particles
 from yt.geometry.selection_routines import RegionSelector, AlwaysSelector
 from yt.units.unit_registry import UnitRegistry
 import yt.units.dimensions as dimensions
+from yt.frontends.sph.api import GadgetHDF5Dataset
+from yt.data_objects.static_output import _cached_datasets
+from yt.config import ytcfg
+import yt.utilities.parallel_tools.parallel_analysis_interface as pai
 import yt.data_objects.api
+import h5py
 import time, os
 
 NPART = 32**3
@@ -125,6 +131,143 @@ def test_particle_overrefine():
             cv2 = dd2["cell_volume"].sum(dtype="float64")
             yield assert_equal, cv1, cv2
 
+def _write_gadget_snapshot(prefix, nfiles, npart, ordered=False):
+    # With ordered, the particles are spread evenly over the domain and laid
+    # out along a space-filling curve across the data files, as simulation
+    # codes usually arrange them, rather than each file holding a cluster
+    # of particles from anywhere at all.
+    np.random.seed(int(0x4d3d3d3))
+    if ordered:
+        positions = np.random.random((npart*nfiles, 3))
+        morton = compute_morton(positions[:,0], positions[:,1],
+                                positions[:,2], [0.0]*3, [1.0]*3)
+        positions = positions[np.argsort(morton)]
+    for i in range(nfiles):
+        f = h5py.File("%s.%s.hdf5" % (prefix, i), "w")
+        h = f.create_group("Header")
+        h.attrs["NumPart_ThisFile"] = np.array([0, npart, 0, 0, 0, 0], "int32")
+        h.attrs["NumPart_Total"] = np.array([0, npart*nfiles, 0, 0, 0, 0],
+                                            "uint32")
+        h.attrs["MassTable"] = np.zeros(6)
+        h.attrs["NumFilesPerSnapshot"] = nfiles
+        h.attrs["BoxSize"] = 1.0
+        h.attrs["Time"] = 1.0
+        h.attrs["Redshift"] = 0.0
+        h.attrs["Omega0"] = 0.3
+        h.attrs["OmegaLambda"] = 0.0
+        h.attrs["HubbleParam"] = 0.7
+        g = f.create_group("PartType1")
+        if ordered:
+            pos = positions[i*npart:(i+1)*npart]
+        else:
+            pos = np.random.normal(0.5, scale=0.1, size=(npart, 3))
+        g.create_dataset("Coordinates", data=pos.clip(0.0, 0.999))
+        g.create_dataset("Masses", data=np.ones(npart))
+        g.create_dataset("ParticleIDs", data=np.arange(npart) + i*npart)
+        f.close()
+
+def _load_gadget_snapshot(prefix):
+    # Drop any earlier instance, which would otherwise be reused.
+    _cached_datasets.pop(os.path.abspath("%s.0.hdf5" % prefix), None)
+    ds = GadgetHDF5Dataset("%s.0.hdf5" % prefix,
+                           unit_base={"length": (1.0, "Mpc")})
+    ds.index
+    return ds
+
+def test_particle_index_cache():
+    _attrs = ('icoords', 'fcoords', 'fwidth', 'ires')
+    with process_pool_test_dir() as use_processes:
+        _write_gadget_snapshot("snap", 5, 10000)
+        ytcfg["yt", "index_cache"] = "False"
+        ds = _load_gadget_snapshot("snap")
+        yield assert_equal, os.path.exists("snap.0.hdf5.ytindex"), False
+        dd = ds.all_data()
+        answer = dict((a, getattr(dd, a)) for a in _attrs)
+        mesh_id = dd["all", "mesh_id"]
+        masks = ds.index.regions.masks
+        ytcfg["yt", "index_cache"] = "True"
+        # The first load writes the cache and the second one reads it back,
+        # as does a load that builds the index on several processes.
+        for parallel in (False, False, True):
+            if parallel:
+                os.remove("snap.0.hdf5.ytindex")
+                use_processes(2)
+            ds = _load_gadget_snapshot("snap")
+            yield assert_equal, os.path.exists("snap.0.hdf5.ytindex"), True
+            dd = ds.all_data()
+            for a in _attrs:
+                yield assert_equal, getattr(dd, a), answer[a]
+            yield assert_equal, dd["all", "mesh_id"], mesh_id
+            for m1, m2 in zip(ds.index.regions.masks, masks):
+                yield assert_equal, m1, m2
+            pai.process_parallel = False
+        # The cache is not used once a data file changes.
+        f = h5py.File("snap.3.hdf5", "r+")
+        f["PartType1/Coordinates"][:100] = 0.1
+        f.close()
+        ires = _load_gadget_snapshot("snap").all_data().ires
+        ytcfg["yt", "index_cache"] = "False"
+        answer = _load_gadget_snapshot("snap").all_data().ires
+        yield assert_equal, ires, answer
+
+def _files_read(dobj):
+    # The data files read for each IO chunk of dobj.
+    files = []
+    for chunk in dobj.chunks([], "io"):
+        subset = dobj._current_chunk.objs[0]
+        if subset.domain_id > 0:
+            domain_files = subset.ds.index._domain_data_files
+            files.append(sorted(domain_files[subset.domain_id - 1][0]))
+        else:
+            files.append([data_file.file_id
+                          for data_file in subset.data_files])
+    return files
+
+def test_particle_io_chunks():
+    with process_pool_test_dir():
+        _write_gadget_snapshot("snap", 5, 10000, ordered=True)
+        ytcfg["yt", "index_cache"] = "False"
+        answers = []
+        for chunk_size in ("0", "20000"):
+            ytcfg["yt", "particle_chunk_size"] = chunk_size
+            ds = _load_gadget_snapshot("snap")
+            for dobj in (ds.all_data(),
+                         ds.sphere([0.45, 0.5, 0.5], (0.2, "Mpc"))):
+                chunks = list(dobj.chunks([], "io"))
+                ids = np.concatenate([dobj["all", "ParticleIDs"].d
+                                      for chunk in dobj.chunks([], "io")])
+                dobj.field_data.clear()
+                answers.append((len(chunks), np.sort(ids),
+                    dobj["deposit", "all_count"],
+                    dobj.quantities.total_quantity(("all", "particle_mass")),
+                    [dobj._current_chunk.objs[0].particle_count
+                     for chunk in dobj.chunks([], "io")],
+                    _files_read(dobj)))
+        # Every particle and every cell turns up in exactly one of the
+        # chunks.
+        for whole, split in zip(answers[:2], answers[2:]):
+            yield assert_equal, whole[0], 1
+            yield assert_equal, split[0] > 1, True
+            yield assert_equal, split[1], whole[1]
+            yield assert_equal, split[2], whole[2]
+            yield assert_rel_equal, split[3], whole[3], 12
+            yield assert_equal, min(split[4]) > 0, True
+        # The particles of the files are shared out between the domains.
+        yield assert_equal, answers[0][4], [50000]
+        yield assert_rel_equal, sum(answers[2][4]), 50000, 12
+        # The domains are made of pairs of files.  Each file is read for a
+        # single domain, except where a leaf of the octree straddles two
+        # files and the domain holding it reads the other file as well.
+        files = answers[2][5]
+        yield assert_equal, len(files), 3
+        yield assert_equal, sorted(set(sum(files, []))), range(5)
+        yield assert_equal, len(sum(files, [])) <= 5 + len(files) - 1, True
+        # Files laid out in no particular order all overlap, so they are
+        # kept together rather than read over and over.
+        _write_gadget_snapshot("snap", 5, 10000)
+        ds = _load_gadget_snapshot("snap")
+        yield assert_equal, len(list(ds.all_data().chunks([], "io"))), 1
+
 class FakeDS:
     domain_left_edge = None
     domain_right_edge = None
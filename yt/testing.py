@@ -18,6 +18,9 @@ import itertools as it
 import numpy as np
 import importlib
 import os
+import contextlib
+import shutil
+import tempfile
 from yt.funcs import *
 from yt.config import ytcfg
 from numpy.testing import assert_array_equal, assert_almost_equal, \
@@ -321,7 +324,41 @@ def requires_file(req_file):
             return ftrue
         else:
             return ffalse
-                                        
+
+@contextlib.contextmanager
+def process_pool_test_dir():
+    r"""A context manager for tests that write files or use worker processes.
+
+    The body runs in a new temporary directory, which is removed afterwards.
+    The function it yields, called with a number of processes, switches on
+    the multiprocessing backend with that many workers.  Serial execution and
+    any configuration options the body changes are restored on exit.
+
+    Examples
+    --------
+
+    >>> with process_pool_test_dir() as use_processes:
+    ...     serial = make_something()
+    ...     use_processes(2)
+    ...     assert_equal(make_something(), serial)
+    """
+    import yt.utilities.parallel_tools.parallel_analysis_interface as pai
+    tmpdir = tempfile.mkdtemp()
+    curdir = os.getcwd()
+    os.chdir(tmpdir)
+    old_config = ytcfg.items("yt", raw=True)
+    def use_processes(nprocs):
+        ytcfg["yt", "parallel_processes"] = str(nprocs)
+        pai.enable_parallelism(backend = "multiprocessing")
+    try:
+        yield use_processes
+    finally:
+        pai.process_parallel = False
+        for option, value in old_config:
+            ytcfg.set("yt", option, value)
+        os.chdir(curdir)
+        shutil.rmtree(tmpdir)
+
 # This is an export of the 40 grids in IsolatedGalaxy that are of level 4 or
 # lower.  It's just designed to give a sample AMR index to deal with.
 _amr_grid_index = [
@@ -30,6 +30,7 @@ from yt.units.dimensions import \
 from yt.units.unit_object import get_conversion_factor
 # classes
 from yt.units.unit_object import Unit, UnitParseError
+from yt.units.yt_array import YTArray
 # objects
 from yt.units.unit_lookup_table import \
     default_unit_symbol_lut, unit_prefixes, prefixable_units
@@ -440,3 +441,73 @@ def test_is_code_unit():
     yield assert_true, u4.is_code_unit
     yield assert_true, not u5.is_code_unit
     yield assert_true, not u6.is_code_unit
+
+def test_operation_cache():
+    from yt.units.unit_object import unit_operation_cache
+    unit_operation_cache.clear()
+    g = Unit("g")
+    cm = Unit("cm")
+    m = Unit("m")
+
+    u1 = g / cm**3
+    u2 = g / cm**3
+    yield assert_true, u1 == u2
+    yield assert_true, unit_operation_cache.stats["div_misses"] == 1
+    yield assert_true, unit_operation_cache.stats["div_hits"] == 1
+
+    # m and 100 cm compare equal, but the results must keep their own symbols.
+    hcm = Unit("100*cm")
+    yield assert_true, g * m == g * hcm
+    yield assert_true, str(g * m) == "g*m"
+    yield assert_true, str(g * hcm) != "g*m"
+    yield assert_true, m.same_dimensions_as(cm)
+    yield assert_true, not m.same_dimensions_as(g)
+    yield assert_true, m.same_dimensions_as(cm)
+    yield assert_true, unit_operation_cache.stats["same_dimensions_hits"] == 1
+
+    # The same symbol means different things in different registries.
+    ds1 = fake_random_ds(16, nprocs=1, length_unit=1.0)
+    ds2 = fake_random_ds(16, nprocs=1, length_unit=2.0)
+    v1 = Unit("code_length", registry=ds1.unit_registry) * cm
+    v2 = Unit("code_length", registry=ds2.unit_registry) * cm
+    yield assert_allclose, v2.cgs_value / v1.cgs_value, 2.0, 1e-12
+
+    # Callers may give a result another registry in place; that must not
+    # change the units of any other result.
+    a = ds1.arr([1.0], "code_length") * ds1.arr([3.0], "code_length")
+    YTArray(a, registry=ds2.unit_registry)
+    b = ds1.arr([1.0], "code_length") * ds1.arr([3.0], "code_length")
+    yield assert_true, b.units.registry is ds1.unit_registry
+    yield assert_allclose, b.in_units("code_length**2").d, [3.0], 1e-12
+
+    unit_operation_cache.enabled = False
+    try:
+        u3 = g / cm**3
+    finally:
+        unit_operation_cache.enabled = True
+    yield assert_true, u3 is not u1
+    yield assert_true, u3 == u1
+
+def _benchmark_arithmetic(n=2000, size=16):
+    import time
+    a = YTArray(np.random.random(size), "g/cm**3")
+    b = YTArray(np.random.random(size), "cm**3")
+    v = YTArray(np.random.random(size), "km/s")
+    t0 = time.time()
+    for i in range(n):
+        a * b
+        a / b
+        (v * v).in_units("cm**2/s**2")
+    return (time.time() - t0) / n
+
+if __name__ == "__main__":
+    # A microbenchmark of arithmetic on small arrays, with and without the
+    # unit operation cache.
+    from yt.units.unit_object import unit_operation_cache
+    unit_operation_cache.enabled = False
+    uncached = _benchmark_arithmetic()
+    unit_operation_cache.enabled = True
+    cached = _benchmark_arithmetic()
+    print "Without cache: %0.1f us per iteration" % (uncached * 1e6)
+    print "With cache:    %0.1f us per iteration" % (cached * 1e6)
+    print dict(unit_operation_cache.stats)
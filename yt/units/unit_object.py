@@ -32,6 +32,7 @@ from yt.units.unit_registry import UnitRegistry
 import copy
 import string
 import token
+from collections import defaultdict
 
 class UnitParseError(Exception):
     pass
@@ -102,6 +103,54 @@ def auto_positive_symbol(tokens, local_dict, global_dict):
 
 unit_text_transform = (auto_positive_symbol, rationalize, auto_number)
 
+class UnitOperationCache(object):
+    """
+    A memo of the results of unit algebra.
+
+    Multiplying, dividing and exponentiating units, and comparing their
+    dimensions, requires building and simplifying sympy expressions, which is
+    slow compared to arithmetic on small arrays.  The results only depend on
+    the operands' expressions, cgs values, offsets and dimensions, so they are
+    memoized here, keyed on those.  Unit objects are not stored: callers may
+    change the registry of the unit they get back, so every operation builds
+    a new one from the memoized attributes.  The number of hits and misses for
+    each kind of operation is kept in ``stats``.
+    """
+    def __init__(self, max_size=8192):
+        self.max_size = max_size
+        self.enabled = True
+        self._results = {}
+        self.stats = defaultdict(int)
+
+    def lookup(self, op, key):
+        try:
+            rv = self._results[(op,) + key]
+        except KeyError:
+            self.stats[op + "_misses"] += 1
+            return None
+        self.stats[op + "_hits"] += 1
+        return rv
+
+    def store(self, op, key, value):
+        if len(self._results) >= self.max_size:
+            self._results.clear()
+        self._results[(op,) + key] = value
+
+    def get(self, op, key, func, *args):
+        if not self.enabled:
+            return func(*args)
+        rv = self.lookup(op, key)
+        if rv is None:
+            rv = func(*args)
+            self.store(op, key, rv)
+        return rv
+
+    def clear(self):
+        self._results.clear()
+        self.stats.clear()
+
+unit_operation_cache = UnitOperationCache()
+
 class Unit(Expr):
     """
     A symbolic unit, using sympy functionality. We only add "dimensions" so
@@ -255,7 +304,9 @@ class Unit(Expr):
             raise InvalidUnitOperation("Tried to multiply a Unit object with "
                                        "'%s' (type %s). This behavior is "
                                        "undefined." % (u, type(u)))
+        return self._cached_operation("mul", (u,), self._mul, u)
 
+    def _mul(self, u):
         cgs_offset = 0.0
         if self.cgs_offset or u.cgs_offset:
             if u.dimensions is temperature and self.is_dimensionless:
@@ -278,12 +329,14 @@ class Unit(Expr):
             raise InvalidUnitOperation("Tried to divide a Unit object by '%s' "
                                        "(type %s). This behavior is "
                                        "undefined." % (u, type(u)))
+        return self._cached_operation("div", (u,), self._div, u)
 
+    def _div(self, u):
         cgs_offset = 0.0
         if self.cgs_offset or u.cgs_offset:
-            if u.dimensions is dims.temperature and self.is_dimensionless:
+            if u.dimensions is temperature and self.is_dimensionless:
                 cgs_offset = u.cgs_offset
-            elif self.dimensions is dims.temperature and u.is_dimensionless:
+            elif self.dimensions is temperature and u.is_dimensionless:
                 cgs_offset = self.cgs_offset
             else:
                 raise InvalidUnitOperation("Quantities with units of Farhenheit "
@@ -299,6 +352,15 @@ class Unit(Expr):
 
     def __pow__(self, p):
         """ Take Unit to power p (float). """
+        if not unit_operation_cache.enabled:
+            return self._pow(p)
+        try:
+            hash(p)
+        except TypeError:
+            return self._pow(p)
+        return self._cached_operation("pow", (p,), self._pow, p)
+
+    def _pow(self, p):
         try:
             p = Rational(str(p)).limit_denominator()
         except ValueError:
@@ -309,6 +371,29 @@ class Unit(Expr):
         return Unit(self.expr**p, cgs_value=(self.cgs_value**p),
                     dimensions=(self.dimensions**p), registry=self.registry)
 
+    def _operation_key(self):
+        # Everything the result of an operation on this unit depends on.
+        return (self.expr, self.cgs_value, self.cgs_offset, self.dimensions)
+
+    def _cached_operation(self, op, args, func, *func_args):
+        # Callers may change the registry of the unit they get back, so the
+        # cache holds the attributes of the result and we hand out a new
+        # unit, in our own registry, every time.
+        cache = unit_operation_cache
+        if not cache.enabled:
+            return func(*func_args)
+        key = (self._operation_key(),) + tuple(
+            a._operation_key() if isinstance(a, Unit) else a for a in args)
+        attrs = cache.lookup(op, key)
+        if attrs is not None:
+            expr, cgs_value, cgs_offset, dimensions = attrs
+            return Unit(expr, cgs_value=cgs_value, cgs_offset=cgs_offset,
+                        dimensions=dimensions, registry=self.registry)
+        rv = func(*func_args)
+        cache.store(op, key, (rv.expr, rv.cgs_value, rv.cgs_offset,
+                              rv.dimensions))
+        return rv
+
     def __eq__(self, u):
         """ Test unit equality. """
         if not isinstance(u, Unit):
@@ -340,7 +425,9 @@ class Unit(Expr):
 
     def same_dimensions_as(self, other_unit):
         """ Test if dimensions are the same. """
-        return (self.dimensions / other_unit.dimensions) == sympy_one
+        return unit_operation_cache.get(
+            "same_dimensions", (self.dimensions, other_unit.dimensions),
+            _same_dimensions, self.dimensions, other_unit.dimensions)
 
     @property
     def is_dimensionless(self):
@@ -401,6 +488,9 @@ class Unit(Expr):
 # Unit manipulation functions
 #
 
+def _same_dimensions(dimensions1, dimensions2):
+    return (dimensions1 / dimensions2) == sympy_one
+
 def get_conversion_factor(old_units, new_units):
     """
     Get the conversion factor between two units of equivalent dimensions. This
@@ -15,6 +15,8 @@ AMR kD-Tree Framework
 from yt.funcs import *
 import numpy as np
 import h5py
+from collections import OrderedDict
+from yt.config import ytcfg
 from amr_kdtools import \
         receive_and_reduce, send_to_parent, scatter_image
 
@@ -137,9 +139,15 @@ class AMRKDTree(ParallelAnalysisInterface):
         ParallelAnalysisInterface.__init__(self)
 
         self.ds = ds
-        self.current_vcds = []
-        self.current_saved_grids = []
-        self.bricks = []
+        # Vertex-centered data of grids whose kd-nodes have not all been
+        # turned into bricks yet, and bricks that have been built, both
+        # keyed for least-recently-used eviction.
+        self.max_cache_bytes = ytcfg.getint("yt", "brick_cache_bytes")
+        self._vcd_cache = OrderedDict()
+        self._vcd_bytes = 0
+        self._brick_cache = OrderedDict()
+        self._brick_bytes = 0
+        self._grid_nodes_left = {}
         self.brick_dimensions = []
         self.sdx = ds.index.get_smallest_dx()
 
@@ -157,20 +165,53 @@ class AMRKDTree(ParallelAnalysisInterface):
         self.tree = Tree(ds, self.comm.rank, self.comm.size,
                          min_level=min_level, max_level=max_level,
                          data_source=data_source)
+        self._grid_node_counts = defaultdict(int)
+        for node in kd_traverse(self.tree.trunk):
+            self._grid_node_counts[node.grid] += 1
 
     def set_fields(self, fields, log_fields, no_ghost):
         self.fields = self.data_source._determine_fields(fields)
         self.log_fields = log_fields
         self.no_ghost = no_ghost
-        del self.bricks, self.brick_dimensions
-        self.brick_dimensions = []
-        bricks = []
-        for b in self.traverse():
-            bricks.append(b)
-        self.bricks = np.array(bricks)
-        self.brick_dimensions = np.array(self.brick_dimensions)
+        self.clear_brick_cache()
+        # Bricks are only built as they are traversed, but their dimensions
+        # follow from the tree alone.
+        self.brick_dimensions = np.array(
+            [self._get_brick_slice(node)[3] for node in
+             kd_traverse(self.tree.trunk)], dtype="int64").reshape((-1, 3))
         self._initialized = True
 
+    @property
+    def bricks(self):
+        r"""An array of all bricks, which are all built and kept in memory.
+
+        Use iter_bricks to go through them without holding on to them.
+        """
+        return np.array(list(self.iter_bricks()))
+
+    def iter_bricks(self):
+        r"""Iterate over all bricks, building them as needed."""
+        return self.traverse()
+
+    def clear_brick_cache(self):
+        for node, size in self._brick_cache.itervalues():
+            node.data = None
+        self._brick_cache.clear()
+        self._brick_bytes = 0
+        self._vcd_cache.clear()
+        self._vcd_bytes = 0
+        self._grid_nodes_left.clear()
+
+    def _evict(self, cache, nbytes):
+        # Drop least recently used entries until we are within budget, always
+        # keeping the most recent one.
+        while nbytes > self.max_cache_bytes and len(cache) > 1:
+            key, (value, size) = cache.popitem(last=False)
+            nbytes -= size
+            if cache is self._brick_cache:
+                value.data = None
+        return nbytes
+
     def initialize_source(self, fields, log_fields, no_ghost):
         if fields == self.fields and log_fields == self.log_fields and \
                 no_ghost == self.no_ghost:
@@ -248,8 +289,7 @@ class AMRKDTree(ParallelAnalysisInterface):
 
         return scatter_image(self.comm, owners[1], image)
 
-    def get_brick_data(self, node):
-        if node.data is not None: return node.data
+    def _get_brick_slice(self, node):
         grid = self.ds.index.grids[node.grid - self._id_offset]
         dds = grid.dds.ndarray_view()
         gle = grid.LeftEdge.ndarray_view()
@@ -258,19 +298,50 @@ class AMRKDTree(ParallelAnalysisInterface):
         li = np.rint((nle-gle)/dds).astype('int32')
         ri = np.rint((nre-gle)/dds).astype('int32')
         dims = (ri - li).astype('int32')
+        return grid, li, ri, dims
+
+    def _get_vertex_centered_data(self, grid):
+        # Keyed by grid id, which is what the kd-nodes store.
+        if grid.id in self._vcd_cache:
+            dds, size = self._vcd_cache.pop(grid.id)
+            self._vcd_cache[grid.id] = (dds, size)
+            return dds
+        dds = []
+        for i, field in enumerate(self.fields):
+            vcd = grid.get_vertex_centered_data(field, smoothed=True, no_ghost=self.no_ghost).astype('float64')
+            if self.log_fields[i]: vcd = np.log10(vcd)
+            dds.append(vcd)
+        size = sum(vcd.nbytes for vcd in dds)
+        self._vcd_cache[grid.id] = (dds, size)
+        self._vcd_bytes = self._evict(self._vcd_cache, self._vcd_bytes + size)
+        return dds
+
+    def _release_vertex_centered_data(self, node):
+        # Once every kd-node of a grid has been made into a brick, we do not
+        # need its vertex-centered data anymore.
+        left = self._grid_nodes_left.get(node.grid,
+                                         self._grid_node_counts[node.grid]) - 1
+        if left > 0:
+            self._grid_nodes_left[node.grid] = left
+            return
+        self._grid_nodes_left.pop(node.grid, None)
+        entry = self._vcd_cache.pop(node.grid, None)
+        if entry is not None:
+            self._vcd_bytes -= entry[1]
+
+    def get_brick_data(self, node):
+        if node.data is not None:
+            if node.node_id in self._brick_cache:
+                self._brick_cache[node.node_id] = \
+                    self._brick_cache.pop(node.node_id)
+            return node.data
+        grid, li, ri, dims = self._get_brick_slice(node)
+        nle = get_left_edge(node)
+        nre = get_right_edge(node)
         assert(np.all(grid.LeftEdge <= nle))
         assert(np.all(grid.RightEdge >= nre))
 
-        if grid in self.current_saved_grids:
-            dds = self.current_vcds[self.current_saved_grids.index(grid)]
-        else:
-            dds = []
-            for i, field in enumerate(self.fields):
-                vcd = grid.get_vertex_centered_data(field, smoothed=True, no_ghost=self.no_ghost).astype('float64')
-                if self.log_fields[i]: vcd = np.log10(vcd)
-                dds.append(vcd)
-                self.current_saved_grids.append(grid)
-                self.current_vcds.append(dds)
+        dds = self._get_vertex_centered_data(grid)
 
         if self.data_source.selector is None:
             mask = np.ones(dims, dtype='uint8')
@@ -286,9 +357,12 @@ class AMRKDTree(ParallelAnalysisInterface):
                                 nle.copy(),
                                 nre.copy(),
                                 dims.astype('int64'))
+        self._release_vertex_centered_data(node)
         node.data = brick
-        if not self._initialized:
-            self.brick_dimensions.append(dims)
+        size = mask.nbytes + sum(d.nbytes for d in data)
+        self._brick_cache[node.node_id] = (node, size)
+        self._brick_bytes = self._evict(self._brick_cache,
+                                        self._brick_bytes + size)
         return brick
 
     def locate_brick(self, position):
@@ -427,10 +501,8 @@ class AMRKDTree(ParallelAnalysisInterface):
                                                  node.r_corner.copy(), 
                                                  node.dims.astype('int64'))
                     
-                    self.bricks.append(node.data)
                     self.brick_dimensions.append(node.dims)
 
-            self.bricks = np.array(self.bricks)
             self.brick_dimensions = np.array(self.brick_dimensions)
 
             self._initialized=True
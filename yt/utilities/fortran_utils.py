@@ -181,6 +181,91 @@ def read_vector(f, d, endian='='):
     assert(vec_len == vec_len2)
     return tr
 
+def read_vector_buffer(buf, offset, d, endian='='):
+    r"""This function accepts a buffer (such as an mmap) and reads from it,
+    starting at a byte offset, a vector of values without copying them.
+
+    Parameters
+    ----------
+    buf : buffer
+        An object supporting the buffer interface, for instance an mmap
+        of a Fortran unformatted file.
+    offset : int
+        The byte offset of the start of the record, including its padding.
+    d : data type
+        This is the datatype (from the struct module) that we should read.
+    endian : str
+        '=' is native, '>' is big, '<' is little endian
+
+    Returns
+    -------
+    tr : numpy.ndarray
+        This is the vector of values, a read-only view into the buffer.
+    offset : int
+        The byte offset of the start of the next record.
+
+    Examples
+    --------
+
+    >>> f = open("fort.3", "rb")
+    >>> mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    >>> rv, offset = read_vector_buffer(mm, 0, 'd')
+    """
+    pad_fmt = "%sI" % (endian)
+    pad_size = struct.calcsize(pad_fmt)
+    vec_len = struct.unpack_from(pad_fmt, buf, offset)[0] # bytes
+    vec_fmt = "%s%s" % (endian, d)
+    vec_size = struct.calcsize(vec_fmt)
+    if vec_len % vec_size != 0:
+        print("fmt = '%s' ; length = %s ; size= %s"
+              % (vec_fmt, vec_len, vec_size))
+        raise RuntimeError
+    vec_num = vec_len / vec_size
+    tr = np.frombuffer(buf, vec_fmt, count=vec_num, offset=offset + pad_size)
+    offset += pad_size + vec_len
+    vec_len2 = struct.unpack_from(pad_fmt, buf, offset)[0]
+    assert(vec_len == vec_len2)
+    return tr, offset + pad_size
+
+def skip_buffer(buf, offset, n=1, endian='='):
+    r"""This function accepts a buffer (such as an mmap) and skips Fortran
+    unformatted records in it, starting at a byte offset, checking the pad
+    bytes of each one.
+
+    Parameters
+    ----------
+    buf : buffer
+        An object supporting the buffer interface, for instance an mmap
+        of a Fortran unformatted file.
+    offset : int
+        The byte offset of the start of the first record to skip.
+    n : int
+        Number of records to skip.
+    endian : str
+        '=' is native, '>' is big, '<' is little endian
+
+    Returns
+    -------
+    offset : int
+        The byte offset of the start of the next record.
+
+    Examples
+    --------
+
+    >>> f = open("fort.3", "rb")
+    >>> mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    >>> offset = skip_buffer(mm, 0, 3)
+    """
+    pad_fmt = "%sI" % (endian)
+    pad_size = struct.calcsize(pad_fmt)
+    for i in range(n):
+        s1 = struct.unpack_from(pad_fmt, buf, offset)[0]
+        offset += pad_size + s1
+        s2 = struct.unpack_from(pad_fmt, buf, offset)[0]
+        assert s1 == s2
+        offset += pad_size
+    return offset
+
 def skip(f, n=1, endian='='):
     r"""This function accepts a file pointer and skips a Fortran unformatted
     record. Optionally check that the skip was done correctly by checking 
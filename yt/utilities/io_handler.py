@@ -124,17 +124,14 @@ class BaseIOHandler(object):
 
     def _read_particle_selection(self, chunks, selector, fields):
         rv = {}
-        ind = {}
         # We first need a set of masks for each particle type
         ptf = defaultdict(list)        # ON-DISK TO READ
-        fsize = defaultdict(lambda: 0) # COUNT RV
         field_maps = defaultdict(list) # ptypes -> fields
         chunks = list(chunks)
         unions = self.ds.particle_unions
         # What we need is a mapping from particle types to return types
         for field in fields:
             ftype, fname = field
-            fsize[field] = 0
             # We should add a check for p.fparticle_unions or something here
             if ftype in unions:
                 for pt in unions[ftype]:
@@ -143,42 +140,35 @@ class BaseIOHandler(object):
             else:
                 ptf[ftype].append(fname)
                 field_maps[field].append(field)
-        # We can't hash chunks, but otherwise this is a neat idea.
         # Now we have our full listing.
         # Here, ptype_map means which particles contribute to a given type.
         # And ptf is the actual fields from disk to read.
-        psize = self._count_particles_chunks(chunks, ptf, selector)
-        # Now we allocate
-        # ptf, remember, is our mapping of what we want to read
-        #for ptype in ptf:
-        for field in fields:
-            if field[0] in unions:
-                for pt in unions[field[0]]:
-                    fsize[field] += psize.get(pt, 0)
-            else:
-                fsize[field] += psize.get(field[0], 0)
-        for field in fields:
-            if field[1] in self._vector_fields:
-                shape = (fsize[field], 3)
-            else:
-                shape = (fsize[field], )
-            rv[field] = np.empty(shape, dtype="float64")
-            ind[field] = 0
-        # Now we read.
+        # We used to count the particles first, which meant reading all of
+        # the coordinates from disk twice.  Instead, we read each chunk once
+        # and hang on to the selected pieces, concatenating at the end.
+        pieces = defaultdict(list)
         for field_r, vals in self._read_particle_fields(chunks, ptf, selector):
             # Note that we now need to check the mappings
             for field_f in field_maps[field_r]:
-                my_ind = ind[field_f]
-                #mylog.debug("Filling %s from %s to %s with %s",
-                #    field_f, my_ind, my_ind+vals.shape[0], field_r)
-                rv[field_f][my_ind:my_ind + vals.shape[0],...] = vals
-                ind[field_f] += vals.shape[0]
-        # Now we need to truncate all our fields, since we allow for
-        # over-estimating.
-        for field_f in ind:
-            rv[field_f] = rv[field_f][:ind[field_f]]
+                pieces[field_f].append(vals)
+        for field in fields:
+            if field[1] in self._vector_fields:
+                shape = (0, 3)
+            else:
+                shape = (0, )
+            rv[field] = _concatenate_pieces(pieces.pop(field, []), shape)
         return rv
 
+def _concatenate_pieces(pieces, shape):
+    # Always hand back a fresh float64 array, as we did when we were filling
+    # preallocated buffers, so that we never return views into on-disk or
+    # in-memory storage.
+    if len(pieces) == 0:
+        return np.empty(shape, dtype="float64")
+    elif len(pieces) == 1:
+        return np.array(pieces[0], dtype="float64")
+    return np.concatenate(pieces).astype("float64", copy=False)
+
 class IOHandlerExtracted(BaseIOHandler):
 
     _dataset_type = 'extracted'
@@ -314,7 +314,7 @@ cdef class QuadTree:
             np.ndarray[np.float64_t, ndim=2] pvals,
             np.ndarray[np.float64_t, ndim=1] pweight_vals):
         cdef int ps = pxs.shape[0]
-        cdef int p
+        cdef int p, rv
         cdef cnp.float64_t *vals
         cdef cnp.float64_t *data = <cnp.float64_t *> pvals.data
         cdef cnp.int64_t pos[2]
@@ -322,7 +322,11 @@ cdef class QuadTree:
             vals = data + self.nvals*p
             pos[0] = pxs[p]
             pos[1] = pys[p]
-            self.add_to_position(level[p], pos, vals, pweight_vals[p])
+            rv = self.add_to_position(level[p], pos, vals, pweight_vals[p])
+            if rv == -1:
+                raise YTIntDomainOverflow(
+                    (self.last_dims[0], self.last_dims[1]),
+                    (self.top_grid_dims[0], self.top_grid_dims[1]))
         return
 
     @cython.boundscheck(False)
@@ -436,13 +440,16 @@ cdef class QuadTree:
                 vtoadd[i] += node.val[i]
             wtoadd += node.weight_val
         elif self.merged == -1:
+            # Carry the maximum over all of the ancestors, so that the result
+            # does not depend on whether coarse values were added before or
+            # after the node was refined.
             for i in range(self.nvals):
-                vtoadd[i] = node.val[i]
+                vorig[i] = vtoadd[i]
         for i in range(2):
             for j in range(2):
                 if self.merged == -1:
                     for n in range(self.nvals):
-                        vtoadd[n] = node.val[n]
+                        vtoadd[n] = fmax(vorig[n], node.val[n])
                 added += self.fill(node.children[i][j],
                         curpos + added, px, py, pdx, pdy, vdata, wdata,
                         vtoadd, wtoadd, level + 1)
@@ -450,6 +457,9 @@ cdef class QuadTree:
             for i in range(self.nvals):
                 vtoadd[i] = vorig[i]
             wtoadd -= node.weight_val
+        elif self.merged == -1:
+            for i in range(self.nvals):
+                vtoadd[i] = vorig[i]
         free(vorig)
         return added
 
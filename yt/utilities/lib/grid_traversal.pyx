@@ -20,7 +20,8 @@ cimport cython
 from libc.stdlib cimport malloc, free, abs
 from libc.math cimport exp, floor, log2, \
     lrint, fabs, atan, asin, cos, sin, sqrt
-from fp_utils cimport imax, fmax, imin, fmin, iclip, fclip, i64clip
+from fp_utils cimport imax, fmax, imin, fmin, iclip, fclip, i64clip, \
+    i64max, i64min
 from field_interpolation_tables cimport \
     FieldInterpolationTable, FIT_initialize_table, FIT_eval_transfer,\
     FIT_eval_transfer_with_light
@@ -289,12 +290,16 @@ cdef class ImageSampler:
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
-    def __call__(self, PartitionedGrid pg, int num_threads = 0):
+    def __call__(self, PartitionedGrid pg, int num_threads = 0,
+                 window = None):
         # This routine will iterate over all of the vectors and cast each in
         # turn.  Might benefit from a more sophisticated intersection check,
         # like http://courses.csusm.edu/cs697exz/ray_box.htm
+        # If a window (x_start, x_stop, y_start, y_stop) of pixels is given,
+        # only rays through those pixels are cast; for lists of vectors, only
+        # the vectors from x_start to x_stop are.
         cdef int vi, vj, hit, i, j, ni, nj, nn
-        cdef np.int64_t offset, iter[4]
+        cdef np.int64_t offset, iter[4], start
         cdef VolumeContainer *vc = pg.container
         cdef ImageContainer *im = self.image
         self.setup(pg)
@@ -309,14 +314,25 @@ cdef class ImageSampler:
             iter[1] = i64clip(iter[1]+1, 0, im.nv[0])
             iter[2] = i64clip(iter[2]-1, 0, im.nv[1])
             iter[3] = i64clip(iter[3]+1, 0, im.nv[1])
+            if window is not None:
+                iter[0] = i64max(iter[0], window[0])
+                iter[1] = i64min(iter[1], window[1])
+                iter[2] = i64max(iter[2], window[2])
+                iter[3] = i64min(iter[3], window[3])
             nx = (iter[1] - iter[0])
             ny = (iter[3] - iter[2])
             size = nx * ny
+            start = 0
         else:
             nx = im.nv[0]
             ny = 1
             iter[0] = iter[1] = iter[2] = iter[3] = 0
+            start = 0
+            if window is not None:
+                start = i64clip(window[0], 0, nx)
+                nx = i64clip(window[1], 0, nx) - start
             size = nx
+        if nx <= 0 or ny <= 0: return hit
         cdef ImageAccumulator *idata
         cdef np.float64_t px, py 
         cdef np.float64_t width[3] 
@@ -352,7 +368,8 @@ cdef class ImageSampler:
                 v_dir = <np.float64_t *> malloc(3 * sizeof(np.float64_t))
                 # If we do not have a simple image plane, we have to cast all
                 # our rays 
-                for j in prange(size, schedule="dynamic", chunksize=100):
+                for j in prange(start, start + size, schedule="dynamic",
+                                chunksize=100):
                     offset = j * 3
                     for i in range(3): v_pos[i] = im.vp_pos[i + offset]
                     for i in range(3): v_dir[i] = im.vp_dir[i + offset]
@@ -39,6 +39,8 @@ from yt.utilities.logger import ytLogger as mylog
 # will be changed.
 MPI = None
 parallel_capable = False
+# Set when parallel_objects should fork worker processes instead of using MPI.
+process_parallel = False
 
 dtype_names = dict(
         float32 = "MPI.FLOAT",
@@ -55,8 +57,29 @@ op_names = dict(
 
 # Set up translation table and import things
 
-def enable_parallelism():
-    global parallel_capable, MPI
+def enable_parallelism(backend = None):
+    r"""Turn on parallel computation.
+
+    With the default ``mpi`` backend, this imports mpi4py and sets up yt to
+    run across the processes launched by ``mpirun``.  With the
+    ``multiprocessing`` backend,
+    :func:`~yt.utilities.parallel_tools.parallel_analysis_interface.parallel_objects`
+    (and :meth:`~yt.data_objects.time_series.DatasetSeries.piter`), profiles
+    and derived quantities are parallelized by forking worker processes on
+    the local machine.  The
+    backend defaults to the ``parallel_backend`` configuration option.
+    """
+    global parallel_capable, MPI, process_parallel
+    if backend is None:
+        backend = ytcfg.get("yt", "parallel_backend")
+    if backend == "multiprocessing":
+        from .process_pool import get_pool_size
+        process_parallel = True
+        mylog.info("Process-based parallel computation enabled: %s processes",
+                   get_pool_size())
+        return True
+    elif backend != "mpi":
+        raise ValueError("Unknown parallel backend: %s" % backend)
     try:
         from mpi4py import MPI as _MPI
     except ImportError:
@@ -106,6 +129,13 @@ def enable_parallelism():
     ))
     return True
 
+def using_process_pool():
+    """
+    Return whether parallel_objects, profiles and derived quantities should be
+    spread over forked worker processes rather than MPI ranks.
+    """
+    return process_parallel and not parallel_capable
+
 # Because the dtypes will == correctly but do not hash the same, we need this
 # function for dictionary access.
 def get_mpi_type(dtype):
@@ -392,8 +422,17 @@ def parallel_objects(objects, njobs = 0, storage = None, barrier = True,
         This governs whether or not dynamic load balancing will be enabled.
         This requires one dedicated processor; if this is enabled with a set of
         128 processors available, only 127 will be available to iterate over
-        objects as one will be load balancing the rest.
-
+        objects as one will be load balancing the rest.  With the
+        ``multiprocessing`` backend no processor is set aside.
+
+    Notes
+    -----
+    If parallelism was enabled with the ``multiprocessing`` backend (see
+    :func:`~yt.utilities.parallel_tools.parallel_analysis_interface.enable_parallelism`),
+    *njobs* worker processes are forked on the local machine, each of which
+    runs the body of the loop on its share of the objects.  The workers exit
+    at the end of the loop, so only the calling process continues past it;
+    the contents of *storage* are sent back to it.
 
     Examples
     --------
@@ -418,6 +457,15 @@ def parallel_objects(objects, njobs = 0, storage = None, barrier = True,
     ...
 
     """
+    if using_process_pool():
+        from .process_pool import process_parallel_objects
+        for my_obj in process_parallel_objects(objects, njobs=njobs,
+                                               storage=storage,
+                                               barrier=barrier,
+                                               dynamic=dynamic):
+            yield my_obj
+        return
+
     if dynamic:
         from .task_queue import dynamic_parallel_objects
         for my_obj in dynamic_parallel_objects(objects, njobs=njobs,
@@ -0,0 +1,258 @@
+"""
+Process-based parallelism for parallel_objects, for use without MPI
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2013, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import cPickle
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import traceback
+
+from yt.config import ytcfg
+from yt.utilities.logger import ytLogger as mylog
+from .parallel_analysis_interface import ResultsStorage
+
+# Set in forked workers so that nested calls to parallel_objects run
+# serially inside the worker rather than forking again.
+_in_worker = False
+_worker_id = 0
+_worker_exit_callbacks = []
+
+def get_pool_size():
+    """
+    Return the number of worker processes used by the process backend.  This
+    is the ``parallel_processes`` configuration option, or the number of
+    available cores if that is zero.
+    """
+    size = ytcfg.getint("yt", "parallel_processes")
+    if size <= 0:
+        size = multiprocessing.cpu_count()
+    return size
+
+def get_worker_id():
+    """
+    Return the index of the worker process we are running in, counting the
+    calling process of a parallel_objects loop as worker zero.
+    """
+    return _worker_id
+
+def at_worker_exit(func):
+    """
+    Register *func* to be called, with no arguments, in each forked worker
+    once it has processed its share of a parallel_objects loop, just before
+    it exits.  This lets a worker finish off anything it has been writing.
+    Callbacks registered in the calling process before the loop are
+    inherited by the workers; remove them with
+    :func:`remove_worker_exit_callback` afterwards.
+    """
+    _worker_exit_callbacks.append(func)
+
+def remove_worker_exit_callback(func):
+    """
+    Remove *func*, registered with :func:`at_worker_exit`.
+    """
+    if func in _worker_exit_callbacks:
+        _worker_exit_callbacks.remove(func)
+
+def _send_results(fd, results):
+    data = cPickle.dumps(results, cPickle.HIGHEST_PROTOCOL)
+    while len(data) > 0:
+        n = os.write(fd, data)
+        data = data[n:]
+
+def _receive_results(fd):
+    pieces = []
+    while True:
+        data = os.read(fd, 1 << 20)
+        if len(data) == 0: break
+        pieces.append(data)
+    os.close(fd)
+    if len(pieces) == 0: return None
+    return cPickle.loads("".join(pieces))
+
+def process_parallel_objects(objects, njobs = 0, storage = None,
+                             barrier = True, dynamic = False):
+    r"""Dispatch the components of *objects* to forked worker processes.
+
+    This is the process-based backend of
+    :func:`~yt.utilities.parallel_tools.parallel_analysis_interface.parallel_objects`,
+    used when ``parallel_backend`` is set to ``multiprocessing``.  The calling
+    process forks ``njobs - 1`` workers at the start of the loop and acts as
+    the first worker itself.  Each worker runs the body of the loop on its
+    share of the objects and exits at the end of the loop, after calling any
+    functions registered with :func:`at_worker_exit` and sending the contents
+    of its *storage* back to the calling process, which is the only one that
+    continues past the loop.
+
+    With *dynamic* load balancing the objects are handed out one at a time
+    from a shared counter, so that workers that finish early pick up the
+    remaining objects; otherwise they are assigned round-robin, as with MPI.
+
+    The calling process always waits for every worker at the end of the loop,
+    so there is always a barrier there; asking for none with *barrier* set to
+    False raises a RuntimeError.
+
+    A worker that leaves the loop early, because the loop body raised or with
+    ``break``, prints where it left the loop and exits at once, so that it
+    never runs the code after the loop.  A RuntimeError is then raised in the
+    calling process once the loop is over.
+    """
+    global _in_worker, _worker_id
+    if not barrier:
+        raise RuntimeError("The multiprocessing backend always waits for its "
+                           "workers at the end of the loop.")
+    size = get_pool_size()
+    if njobs <= 0:
+        njobs = size
+    if njobs > size:
+        mylog.error("You have asked for %s jobs, but you only have %s processes.",
+            njobs, size)
+        raise RuntimeError
+    # Objects that can be indexed, like time series, are loaded only by the
+    # worker that processes them.  Anything else is iterated by every worker,
+    # so that iterators that set up state as they go, such as chunks of a data
+    # object, remain valid.
+    indexable = hasattr(objects, "__len__") and hasattr(objects, "__getitem__")
+    if indexable:
+        nobjs = len(objects)
+        njobs = min(njobs, nobjs)
+    if _in_worker or njobs <= 1 or not hasattr(os, "fork"):
+        njobs = 1
+    counter = None
+    if dynamic and njobs > 1:
+        counter = multiprocessing.Value("l", 0)
+    # Flush before forking so buffered output is not written once per worker.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    my_id = 0
+    workers = []
+    for i in range(1, njobs):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(rfd)
+            for _pid, _rfd in workers:
+                os.close(_rfd)
+            workers = []
+            _in_worker = True
+            _worker_id = my_id = i
+            break
+        os.close(wfd)
+        workers.append((pid, rfd))
+    if njobs > 1:
+        mylog.debug("Worker %s of %s processing objects", my_id, njobs)
+
+    def my_indices():
+        # Either round-robin, or the next unclaimed object when balancing the
+        # load dynamically.
+        if counter is None:
+            for obj_id in itertools.count(my_id, njobs):
+                yield obj_id
+        else:
+            while True:
+                with counter.get_lock():
+                    obj_id = counter.value
+                    counter.value += 1
+                yield obj_id
+
+    def my_objects():
+        indices = my_indices()
+        if indexable:
+            for obj_id in itertools.takewhile(lambda i: i < nobjs, indices):
+                yield obj_id, objects[obj_id]
+            return
+        wanted = next(indices)
+        for obj_id, obj in enumerate(objects):
+            if obj_id == wanted:
+                yield obj_id, obj
+                wanted = next(indices)
+
+    to_share = {}
+    completed = False
+    try:
+        for obj_id, obj in my_objects():
+            if storage is not None:
+                rstore = ResultsStorage()
+                rstore.result_id = obj_id
+                yield rstore, obj
+                to_share[rstore.result_id] = rstore.result
+            else:
+                yield obj
+        completed = True
+    finally:
+        if my_id > 0:
+            # A worker never returns into the code after the loop.  Only one
+            # that made it through the whole loop reports back; otherwise the
+            # closed pipe and exit status tell the calling process that it
+            # failed.  When the loop body raises, we are closed while the
+            # exception is on its way out of the caller, so we can only show
+            # where that happened.
+            status = 1
+            if completed:
+                try:
+                    for func in _worker_exit_callbacks:
+                        func()
+                    _send_results(wfd, to_share)
+                    status = 0
+                except Exception:
+                    traceback.print_exc()
+            else:
+                sys.stderr.write("Worker %s of %s left the loop early, at:\n"
+                                 % (my_id, njobs))
+                traceback.print_stack(sys._getframe(1))
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+        elif not completed:
+            for pid, rfd in workers:
+                os.close(rfd)
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+    failed = 0
+    for pid, rfd in workers:
+        results = _receive_results(rfd)
+        status = os.waitpid(pid, 0)[1]
+        if results is None or status != 0:
+            failed += 1
+            continue
+        to_share.update(results)
+    if failed > 0:
+        raise RuntimeError("%s of %s worker processes failed." %
+                           (failed, njobs))
+    if storage is not None:
+        storage.update(to_share)
+
+def process_map(func, nprocs = 0):
+    r"""Call *func* once in each of *nprocs* worker processes.
+
+    *func* is called as ``func(worker_id, nworkers)`` and is expected to
+    process the share of the work belonging to *worker_id*, for instance every
+    *nworkers*-th chunk of a data object, accumulating into storage private to
+    that worker.  The results are returned to the calling process as a list
+    ordered by worker id, ready to be merged.  Inside a worker process, or if
+    *nprocs* is one, *func* is simply called as ``func(0, 1)``.
+    """
+    if nprocs <= 0:
+        nprocs = get_pool_size()
+    if _in_worker or not hasattr(os, "fork"):
+        nprocs = 1
+    if nprocs == 1:
+        return [func(0, 1)]
+    storage = {}
+    for sto, worker_id in process_parallel_objects(range(nprocs), nprocs,
+                                                   storage = storage):
+        sto.result = func(worker_id, nprocs)
+    return [storage[i] for i in range(nprocs)]
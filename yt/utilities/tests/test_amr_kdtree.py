@@ -61,3 +61,37 @@ def test_amr_kdtree_coverage():
         tree_ok *= np.all(dims > 0)
 
     yield assert_equal, True, tree_ok
+
+def test_amr_kdtree_brick_cache():
+    from yt.testing import fake_random_ds
+    ds = fake_random_ds(16, nprocs = 8)
+    kd = AMRKDTree(ds)
+    kd.set_fields(["density"], [False], True)
+    bricks = [b.my_data[0].copy() for b in kd.traverse()]
+    yield assert_equal, len(bricks), len(kd.brick_dimensions)
+    yield assert_equal, sum(b.size for b in bricks), \
+        (kd.brick_dimensions + 1).prod(axis=-1).sum()
+    # Every grid's nodes have been emitted, so no vertex-centered data is
+    # left behind.
+    yield assert_equal, len(kd._vcd_cache), 0
+    yield assert_equal, kd._vcd_bytes, 0
+
+    # With a budget of a single byte, only the most recent brick is kept,
+    # and the bricks are rebuilt identically.
+    kd.max_cache_bytes = 1
+    kd.set_fields(["density"], [False], True)
+    small = [b.my_data[0].copy() for b in kd.traverse()]
+    yield assert_equal, len(kd._brick_cache), 1
+    yield assert_equal, len(kd._vcd_cache), 0
+    for b1, b2 in zip(bricks, small):
+        yield assert_equal, b1, b2
+    # The array of bricks can be read more than once.
+    yield assert_equal, len(kd.bricks), len(bricks)
+    yield assert_equal, len(kd.bricks), len(bricks)
+    yield assert_equal, sum(1 for b in kd.iter_bricks()), len(bricks)
+
+    # A tree without any grids has no cells.
+    kd = AMRKDTree(ds, min_level = 3)
+    kd.set_fields(["density"], [False], True)
+    yield assert_equal, kd.brick_dimensions.prod(axis=-1).sum(), 0
+    yield assert_equal, len(kd.bricks), 0
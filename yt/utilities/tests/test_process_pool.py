@@ -0,0 +1,62 @@
+import os
+from yt.testing import *
+from yt.data_objects.time_series import DatasetSeries
+import yt.utilities.parallel_tools.parallel_analysis_interface as pai
+
+def setup():
+    from yt.config import ytcfg
+    ytcfg["yt","__withintesting"] = "True"
+
+def _run_series(ts, dynamic):
+    storage = {}
+    for sto, ds in ts.piter(storage = storage, dynamic = dynamic):
+        ad = ds.all_data()
+        sto.result = (os.getpid(), ad["density"].sum().d)
+    return storage
+
+def test_process_parallel_objects():
+    ts = DatasetSeries([fake_random_ds(16, nprocs = 2) for i in range(5)])
+    answers = dict((i, ds.all_data()["density"].sum().d)
+                   for i, ds in enumerate(ts))
+    with process_pool_test_dir() as use_processes:
+        use_processes(2)
+        for dynamic in (False, True):
+            storage = _run_series(ts, dynamic)
+            yield assert_equal, sorted(storage.keys()), range(5)
+            for i, (pid, total) in storage.items():
+                yield assert_equal, total, answers[i]
+            pids = set(pid for pid, total in storage.values())
+            yield assert_equal, os.getpid() in pids, True
+            if not dynamic:
+                yield assert_equal, len(pids), 2
+        # Without storage, every object is still visited exactly once.
+        seen = []
+        for obj in pai.parallel_objects(range(7), njobs = 2):
+            seen.append(obj)
+        yield assert_equal, seen, range(0, 7, 2)
+
+def _leave_early(how, log):
+    # Every process that gets past the loop adds a line to the log.
+    try:
+        for obj in pai.parallel_objects(range(6), njobs = 3):
+            if obj == 4:
+                if how == "raise":
+                    raise ValueError(obj)
+                break
+    except ValueError:
+        pass
+    finally:
+        open(log, "a").write("%s\n" % os.getpid())
+
+def test_process_workers_leaving_early():
+    with process_pool_test_dir() as use_processes:
+        use_processes(3)
+        # The worker that leaves the loop exits there, so only the calling
+        # process runs the code after it, and learns that the worker failed.
+        for how in ("raise", "break"):
+            assert_raises(RuntimeError, _leave_early, how, how)
+            pids = open(how).read().split()
+            yield assert_equal, pids, [str(os.getpid())]
+        # The calling process always waits for its workers.
+        assert_raises(RuntimeError, list,
+                      pai.parallel_objects(range(6), barrier = False))
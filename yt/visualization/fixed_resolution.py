@@ -15,6 +15,9 @@ Fixed resolution buffer support, along with a primitive image analysis tool.
 
 from yt.funcs import *
 from yt.units.unit_object import Unit
+from yt.units.yt_array import YTArray
+from yt.geometry.cartesian_coordinates import \
+    CartesianCoordinateHandler
 from .volume_rendering.api import off_axis_projection
 from yt.data_objects.image_array import ImageArray
 from yt.utilities.lib.misc_utilities import \
@@ -25,6 +28,89 @@ import weakref
 import re
 import string
 
+class PixelizationIndex(object):
+    r"""
+    An index over the cells of an axis-aligned 2D data object, such as a
+    Projection or Slice, that finds the cells overlapping a window of the
+    image plane without visiting all of them.
+
+    The cells are grouped by their half-width in the image x direction, which
+    for AMR data is one group per level, and sorted by their x position in
+    each group, so that the cells that can reach into a window are found by
+    binary search.  These are then filtered by their extent in y.  Windows
+    are also searched one period away on either side, so that the cells a
+    periodic pixelization wraps around are found too.
+    """
+    # Beyond this many distinct cell widths, fall back to a single group
+    # searched with the largest width.
+    max_groups = 32
+
+    def __init__(self, data_source):
+        ds = data_source.ds
+        axis = data_source.axis
+        xax = ds.coordinates.x_axis[axis]
+        yax = ds.coordinates.y_axis[axis]
+        period = ds.coordinates.period
+        if hasattr(period, "in_units"):
+            period = period.in_units("code_length").d
+        self.period = (period[xax], period[yax])
+        px = data_source["px"].in_units("code_length").d
+        pdx = data_source["pdx"].in_units("code_length").d
+        self.py = data_source["py"].in_units("code_length").d
+        self.pdy = data_source["pdy"].in_units("code_length").d
+        self.size = px.size
+        widths = np.unique(pdx)
+        if widths.size > self.max_groups:
+            order = np.argsort(px, kind="mergesort")
+            self.groups = [(order, px[order], pdx.max())]
+            return
+        order = np.lexsort((px, pdx))
+        breaks = np.flatnonzero(np.diff(pdx[order])) + 1
+        self.groups = [(idx, px[idx], pdx[idx[0]])
+                       for idx in np.split(order, breaks) if idx.size > 0]
+
+    def _shifted(self, left, right, period):
+        if period > 0:
+            return [(left + s*period, right + s*period) for s in (-1, 0, 1)]
+        return [(left, right)]
+
+    def select(self, bounds):
+        r"""Return the indices, in their original order, of the cells that
+        overlap *bounds*, given as (xmin, xmax, ymin, ymax) in code units.
+        """
+        pieces = []
+        for idx, gpx, width in self.groups:
+            for left, right in self._shifted(bounds[0], bounds[1],
+                                             self.period[0]):
+                i0 = np.searchsorted(gpx, left - width, "left")
+                i1 = np.searchsorted(gpx, right + width, "right")
+                if i1 > i0: pieces.append(idx[i0:i1])
+        if len(pieces) == 0:
+            return np.empty(0, dtype="int64")
+        # Sorting keeps the order in which the cells are deposited, and with
+        # it the resulting image, the same as for the full data object.
+        sel = np.unique(np.concatenate(pieces))
+        ly = self.py[sel] - self.pdy[sel]
+        ry = self.py[sel] + self.pdy[sel]
+        mask = np.zeros(sel.size, dtype="bool")
+        for bottom, top in self._shifted(bounds[2], bounds[3],
+                                         self.period[1]):
+            mask |= (ry >= bottom) & (ly <= top)
+        return sel[mask]
+
+class PixelizationSubset(object):
+    r"""
+    The cells of a 2D data object selected by a
+    :class:`~yt.visualization.fixed_resolution.PixelizationIndex`, which can
+    be pixelized in its place.
+    """
+    def __init__(self, data_source, indices):
+        self.data_source = data_source
+        self.indices = indices
+
+    def __getitem__(self, item):
+        return self.data_source[item][self.indices]
+
 class FixedResolutionBuffer(object):
     r"""
     FixedResolutionBuffer(data_source, bounds, buff_size, antialias = True)
@@ -117,14 +203,7 @@ class FixedResolutionBuffer(object):
         if item in self.data: return self.data[item]
         mylog.info("Making a fixed resolution buffer of (%s) %d by %d" % \
             (item, self.buff_size[0], self.buff_size[1]))
-        bounds = []
-        for b in self.bounds:
-            if hasattr(b, "in_units"):
-                b = float(b.in_units("code_length"))
-            bounds.append(b)
-        buff = self.ds.coordinates.pixelize(self.data_source.axis,
-            self.data_source, item, bounds, self.buff_size,
-            int(self.antialias))
+        buff = self._pixelize(item, self._get_code_bounds(), self.buff_size)
         # Need to add _period and self.periodic
         # self._period, int(self.periodic)
         ia = ImageArray(buff, input_units=self.data_source[item].units,
@@ -132,6 +211,89 @@ class FixedResolutionBuffer(object):
         self.data[item] = ia
         return self.data[item]
 
+    def _get_code_bounds(self):
+        bounds = []
+        for b in self.bounds:
+            if hasattr(b, "in_units"):
+                b = float(b.in_units("code_length"))
+            bounds.append(b)
+        return bounds
+
+    def _get_pixelization_index(self):
+        # The index is kept on the data object, so that it is shared by all
+        # of the buffers made from it, for instance as a plot is zoomed.
+        if self.data_source.axis >= 3 or \
+           not isinstance(self.ds.coordinates, CartesianCoordinateHandler):
+            return None
+        index = getattr(self.data_source, "_pixelization_index", None)
+        if index is None:
+            index = PixelizationIndex(self.data_source)
+            self.data_source._pixelization_index = index
+        return index
+
+    def _pixelize(self, item, bounds, size):
+        data_source = self.data_source
+        index = self._get_pixelization_index()
+        if index is not None:
+            indices = index.select(bounds)
+            # Only bother with a subset if it is much smaller.
+            if indices.size < 0.5 * index.size:
+                data_source = PixelizationSubset(data_source, indices)
+        return self.ds.coordinates.pixelize(self.data_source.axis,
+            data_source, item, bounds, size, int(self.antialias))
+
+    def _shift_data(self, other):
+        r"""Fill this buffer from *other*, a buffer of the same data object
+        and size, if our bounds are those of *other* moved by a whole number
+        of pixels.  The overlapping part of each image is copied, and only the
+        newly exposed strips are pixelized.  Returns whether it did so.
+        """
+        if type(self) is not FixedResolutionBuffer or \
+           type(other) is not FixedResolutionBuffer or \
+           other.data_source is not self.data_source or \
+           bool(other.antialias) != bool(self.antialias) or \
+           tuple(other.buff_size) != tuple(self.buff_size) or \
+           len(other.data) == 0:
+            return False
+        bounds = self._get_code_bounds()
+        old_bounds = other._get_code_bounds()
+        ny, nx = other.data.values()[0].shape
+        shifts = []
+        for i, n in ((0, nx), (2, ny)):
+            width = bounds[i+1] - bounds[i]
+            dp = width / n
+            if abs(width - (old_bounds[i+1] - old_bounds[i])) > 1e-6 * dp:
+                return False
+            shift = (bounds[i] - old_bounds[i]) / dp
+            if abs(shift - np.rint(shift)) > 1e-6: return False
+            shifts.append(int(np.rint(shift)))
+        kx, ky = shifts
+        if abs(kx) >= nx or abs(ky) >= ny: return False
+        dx = (bounds[1] - bounds[0]) / nx
+        dy = (bounds[3] - bounds[2]) / ny
+        # The columns and rows of the new image that were in the old one.
+        x0, x1 = max(0, -kx), nx - max(0, kx)
+        y0, y1 = max(0, -ky), ny - max(0, ky)
+        # Newly exposed columns over the full height, then newly exposed rows
+        # over the remaining columns.
+        strips = [((c0, c1), (0, ny)) for c0, c1 in ((0, x0), (x1, nx))
+                  if c1 > c0]
+        strips += [((x0, x1), (r0, r1)) for r0, r1 in ((0, y0), (y1, ny))
+                   if r1 > r0]
+        for item, old in other.data.items():
+            if old.shape != (ny, nx): continue
+            buff = np.empty((ny, nx), dtype="float64")
+            buff[y0:y1, x0:x1] = old.d[y0+ky:y1+ky, x0+kx:x1+kx]
+            units = self.data_source[item].units
+            for (c0, c1), (r0, r1) in strips:
+                strip_bounds = (bounds[0] + c0*dx, bounds[0] + c1*dx,
+                                bounds[2] + r0*dy, bounds[2] + r1*dy)
+                strip = self._pixelize(item, strip_bounds, (r1 - r0, c1 - c0))
+                buff[r0:r1, c0:c1] = YTArray(strip, units).in_units(old.units)
+            self.data[item] = ImageArray(buff, input_units=old.units,
+                                         info=self._get_info(item))
+        return True
+
     def __setitem__(self, item, val):
         self.data[item] = val
 
@@ -328,7 +490,146 @@ class FixedResolutionBuffer(object):
             for k,v in other_keys.items():
                 fib.update_all_headers(k,v)
         fib.writeto(filename, clobber=clobber)
-        
+
+    def export_tiles(self, directory, fields = None, tile_size = 256,
+                     max_level = None, format = "npy", take_log = None,
+                     color_bounds = None, cmap_name = "algae",
+                     overwrite = False):
+        r"""Export a pyramid of image tiles covering our bounds.
+
+        The tiles are written level by level, as they are made, so that the
+        full-resolution image, which may be much larger than would fit in
+        memory, is never assembled.  Level *L* of the pyramid is an image of
+        ``tile_size * 2**L`` pixels on a side, split into ``2**L`` by
+        ``2**L`` tiles, and each tile is pixelized from only the cells of the
+        data object that intersect it.  Tiles are written to
+        ``directory/<field>/<level>/<column>_<row>.<format>``, with row zero
+        at the top of the image and the top row of pixels first in each
+        tile, alongside a ``pyramid.json`` file describing the layout.
+        Tiles that already exist are skipped, unless *overwrite* is set, so
+        an interrupted export can be resumed.  When running in parallel, the
+        tiles of each level are divided between the processors.
+
+        Parameters
+        ----------
+        directory : string
+            The directory the tiles are written under.
+        fields : list of strings, optional
+            These fields will be pixelized and output.  Defaults to the
+            fields already in the buffer.
+        tile_size : int, optional
+            The number of pixels on a side of each tile.
+        max_level : int, optional
+            The deepest level of the pyramid.  Defaults to the first level
+            with at least as many pixels on a side as our buffer size.
+        format : string, optional
+            Either "npy", to save the values of each tile as a float64 array
+            with numpy.save, or "png", to save a colormapped image.
+        take_log : bool, optional
+            For PNG tiles, whether to color by the logarithm of the values.
+            Defaults to the take_log setting of each field.
+        color_bounds : tuple of floats, optional
+            For PNG tiles, the values (not their logarithms) to scale
+            between, so that all tiles share a color scale.  Defaults to the
+            extrema of each field in the data object.
+        cmap_name : string, optional
+            For PNG tiles, the colormap to use.
+        overwrite : bool, optional
+            Whether to write tiles that already exist.
+
+        Returns
+        -------
+        The number of tiles written.
+
+        Examples
+        --------
+
+        >>> proj = ds.proj("density", 2)
+        >>> frb = FixedResolutionBuffer(proj, (0.0, 1.0, 0.0, 1.0),
+        ...                             (65536, 65536))
+        >>> frb.export_tiles("tiles", ["density"], format="png")
+        """
+        import json
+        from yt.utilities.parallel_tools.parallel_analysis_interface import \
+            parallel_objects, communication_system
+        from .image_writer import write_image
+        if format not in ("npy", "png"):
+            raise ValueError("format must be 'npy' or 'png', not %s" % format)
+        if fields is None: fields = self.data.keys()
+        if max_level is None:
+            max_level = max(0, int(np.ceil(np.log2(
+                max(self.buff_size) / float(tile_size)))))
+        bounds = self._get_code_bounds()
+        comm = communication_system.communicators[-1]
+        written = 0
+        for field in ensure_list(fields):
+            if isinstance(field, tuple):
+                name = "_".join(field)
+            else:
+                name = field
+            field_dir = os.path.join(directory, name)
+            units = self.data_source[field].units
+            if format == "png":
+                log = take_log
+                if log is None:
+                    finfo = self.ds._get_field_info(
+                        *self.data_source._determine_fields(field)[0])
+                    log = finfo.take_log
+                func = np.log10 if log else (lambda x: x)
+                if color_bounds is None:
+                    values = self.data_source[field].d
+                    if log: values = values[values > 0]
+                    cbounds = (values.min(), values.max())
+                else:
+                    cbounds = color_bounds
+                cbounds = tuple(func(np.array(cbounds, dtype="float64")))
+            ensure_dir(field_dir)
+            if comm.rank == 0:
+                info = dict(bounds = bounds, units = str(units),
+                            tile_size = tile_size, max_level = max_level,
+                            format = format, field = name)
+                with open(os.path.join(field_dir, "pyramid.json"), "w") as f:
+                    json.dump(info, f)
+            for level in range(max_level + 1):
+                level_dir = os.path.join(field_dir, str(level))
+                ensure_dir(level_dir)
+                comm.barrier()
+                ntiles = 2**level
+                dx = (bounds[1] - bounds[0]) / ntiles
+                dy = (bounds[3] - bounds[2]) / ntiles
+                tiles = []
+                for col in range(ntiles):
+                    for row in range(ntiles):
+                        fn = os.path.join(level_dir, "%s_%s.%s" %
+                                          (col, row, format))
+                        if overwrite or not os.path.exists(fn):
+                            tiles.append((col, row, fn))
+                storage = {}
+                for sto, (col, row, fn) in parallel_objects(tiles,
+                                                            storage = storage):
+                    tile_bounds = (bounds[0] + col*dx,
+                                   bounds[0] + (col + 1)*dx,
+                                   bounds[3] - (row + 1)*dy,
+                                   bounds[3] - row*dy)
+                    buff = self._pixelize(field, tile_bounds,
+                                          (tile_size, tile_size))[::-1,:]
+                    # Write to a temporary file first, so that an
+                    # interrupted export never leaves a partial tile behind.
+                    tmp_fn = "%s.tmp" % fn
+                    if format == "npy":
+                        with open(tmp_fn, "wb") as f:
+                            np.save(f, buff)
+                    else:
+                        with np.errstate(divide = "ignore",
+                                         invalid = "ignore"):
+                            image = func(buff)
+                        write_image(image, tmp_fn, color_bounds = cbounds,
+                                    cmap_name = cmap_name)
+                    os.rename(tmp_fn, fn)
+                    sto.result = fn
+                written += len(storage)
+        return written
+
     @property
     def limits(self):
         rv = dict(x = None, y = None, z = None)
@@ -339,8 +339,12 @@ class PlotWindow(ImagePlotContainer):
         if self._frb_generator is ObliqueFixedResolutionBuffer:
             bounds = np.array(bounds)
 
+        old_frb = self.frb
         self.frb = self._frb_generator(self.data_source, bounds, self.buff_size,
                                        self.antialias, periodic=self._periodic)
+        # Pans by whole pixels only need the newly exposed strips pixelized.
+        if old_frb is not None:
+            self.frb._shift_data(old_frb)
         if old_fields is None:
             self.frb._get_data_source_fields()
         else:
@@ -0,0 +1,141 @@
+"""
+Tests for fixed resolution buffers
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2014, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from yt.testing import \
+    fake_random_ds, fake_amr_ds, assert_equal, assert_rel_equal, \
+    assert_raises
+from yt.visualization.fixed_resolution import \
+    FixedResolutionBuffer
+
+def setup():
+    """Test specific setup."""
+    from yt.config import ytcfg
+    ytcfg["yt", "__withintesting"] = "True"
+
+def _full_pixelize(frb, field):
+    bounds = frb._get_code_bounds()
+    buff = frb.ds.coordinates.pixelize(frb.data_source.axis,
+        frb.data_source, field, bounds, frb.buff_size, int(frb.antialias))
+    return buff
+
+def test_pixelization_index():
+    ds = fake_amr_ds(fields=("Density",))
+    for dobj in [ds.proj("Density", 2), ds.slice(0, 0.4)]:
+        # Windows inside the domain, zoomed in on the refined region, and
+        # crossing the periodic boundaries.
+        for bounds in [(0.0, 1.0, 0.0, 1.0), (0.4, 0.6, 0.45, 0.55),
+                       (0.3, 0.32, 0.7, 0.71), (-0.2, 0.3, 0.8, 1.3)]:
+            for antialias in [True, False]:
+                frb = FixedResolutionBuffer(dobj, bounds, (64, 80),
+                                            antialias = antialias)
+                yield assert_equal, frb["Density"].d, \
+                    _full_pixelize(frb, "Density")
+
+def test_frb_shift():
+    ds = fake_random_ds(32)
+    proj = ds.proj("density", 2)
+    n = 100
+    dp = 0.6 / n
+    frb = FixedResolutionBuffer(proj, (0.2, 0.8, 0.2, 0.8), (n, n))
+    frb["density"]
+    frb["ones"].convert_to_units("km")
+    for sx, sy in [(7, 0), (0, -11), (-3, 5), (40, 40)]:
+        bounds = (0.2 + sx*dp, 0.8 + sx*dp, 0.2 + sy*dp, 0.8 + sy*dp)
+        shifted = FixedResolutionBuffer(proj, bounds, (n, n))
+        yield assert_equal, shifted._shift_data(frb), True
+        yield assert_equal, sorted(shifted.keys()), sorted(frb.keys())
+        yield assert_equal, str(shifted["ones"].units), str(frb["ones"].units)
+        fresh = FixedResolutionBuffer(proj, bounds, (n, n))
+        for field in ["density", "ones"]:
+            yield assert_rel_equal, shifted[field], \
+                fresh[field].in_units(shifted[field].units), 10
+    # Neither a zoom, nor a pan by a fraction of a pixel, can be shifted.
+    for bounds in [(0.3, 0.7, 0.3, 0.7),
+                   (0.2 + dp/2, 0.8 + dp/2, 0.2, 0.8)]:
+        other = FixedResolutionBuffer(proj, bounds, (n, n))
+        yield assert_equal, other._shift_data(frb), False
+        yield assert_equal, len(other.keys()), 0
+
+def test_export_tiles():
+    ds = fake_random_ds(32)
+    proj = ds.proj("density", 2)
+    frb = FixedResolutionBuffer(proj, (0.0, 1.0, 0.0, 1.0), (128, 128))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        yield assert_equal, frb.export_tiles(tmpdir, ["density"], 32), 21
+        tile_dir = os.path.join(tmpdir, "density")
+        yield assert_equal, sorted(os.listdir(tile_dir)), \
+            ["0", "1", "2", "pyramid.json"]
+        image = np.empty((128, 128))
+        for col in range(4):
+            for row in range(4):
+                fn = os.path.join(tile_dir, "2", "%s_%s.npy" % (col, row))
+                image[row*32:(row+1)*32, col*32:(col+1)*32] = np.load(fn)
+        yield assert_rel_equal, image, frb["density"].d[::-1,:], 10
+        top = np.load(os.path.join(tile_dir, "0", "0_0.npy"))
+        yield assert_equal, top.shape, (32, 32)
+        # Existing tiles are skipped, so an export can be resumed.
+        os.remove(os.path.join(tile_dir, "1", "1_0.npy"))
+        yield assert_equal, frb.export_tiles(tmpdir, ["density"], 32), 1
+        yield assert_equal, frb.export_tiles(tmpdir, ["density"], 32,
+                                             overwrite=True), 21
+        yield assert_raises, ValueError, frb.export_tiles, tmpdir, \
+            ["density"], 32, None, "jpg"
+    finally:
+        shutil.rmtree(tmpdir)
+
+def _benchmark_pan_zoom(n=2048, buff_size=1024):
+    from yt.frontends.stream.api import load_uniform_grid
+    data = {"density": np.random.random((n, n, 2))}
+    bbox = np.array([[0.0, 1.0], [0.0, 1.0], [0.0, 1.0]])
+    ds = load_uniform_grid(data, (n, n, 2), bbox=bbox)
+    proj = ds.proj("density", 2)
+    # A scripted sequence of windows: zoom in, pan right by whole pixels,
+    # zoom in again and pan down.
+    windows = []
+    x0, y0, width = 0.0, 0.0, 1.0
+    for zoom, step in [(4.0, (1, 0)), (2.0, (0, -1))]:
+        x0 += width * (1.0 - 1.0/zoom) / 2.0
+        y0 += width * (1.0 - 1.0/zoom) / 2.0
+        width /= zoom
+        windows.append((x0, y0, width))
+        for i in range(10):
+            x0 += step[0] * width * 64.0 / buff_size
+            y0 += step[1] * width * 64.0 / buff_size
+            windows.append((x0, y0, width))
+    size = (buff_size, buff_size)
+    frb = FixedResolutionBuffer(proj, (0.0, 1.0, 0.0, 1.0), size)
+    frb["density"]
+    t1 = time.time()
+    for x0, y0, width in windows:
+        new = FixedResolutionBuffer(proj, (x0, x0 + width, y0, y0 + width),
+                                    size)
+        new._shift_data(frb)
+        new["density"]
+        frb = new
+    t2 = time.time()
+    for x0, y0, width in windows:
+        ds.coordinates.pixelize(2, proj, "density",
+            (x0, x0 + width, y0, y0 + width), size, 1)
+    t3 = time.time()
+    print "%s windows: %0.3f s incremental, %0.3f s full pixelization" % \
+        (len(windows), t2 - t1, t3 - t2)
+
+if __name__ == "__main__":
+    _benchmark_pan_zoom()
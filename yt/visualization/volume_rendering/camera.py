@@ -15,7 +15,10 @@ Import the components of the volume rendering extension
 
 from yt.extern.six.moves import builtins
 import numpy as np
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
+from yt.config import ytcfg
 from yt.funcs import *
 from yt.utilities.math_utils import *
 from yt.units.yt_array import YTArray
@@ -121,6 +124,12 @@ class Camera(ParallelAnalysisInterface):
         Optionally specify an arbitrary data source to the volume rendering.
         All cells not included in the data source will be ignored during ray
         casting. By default this will get set to ds.all_data().
+    render_workers: int, optional
+        The number of threads that cast rays through separate strips of the
+        image plane.  Each strip is sampled front-to-back through every
+        brick, so the image is identical to a serial rendering, but many
+        small bricks can be worked on at once.  Defaults to the
+        ``render_workers`` configuration option; zero means one per core.
 
     Examples
     --------
@@ -154,6 +163,7 @@ class Camera(ParallelAnalysisInterface):
     _pylab = None
     _tf_figure = None
     _render_figure = None
+    render_workers = None
     def __init__(self, center, normal_vector, width,
                  resolution, transfer_function = None,
                  north_vector = None, steady_north=False,
@@ -162,7 +172,7 @@ class Camera(ParallelAnalysisInterface):
                  sub_samples = 5, ds = None,
                  min_level=None, max_level=None, no_ghost=True,
                  data_source=None,
-                 use_light=False):
+                 use_light=False, render_workers=None):
         ParallelAnalysisInterface.__init__(self)
         if ds is not None: self.ds = ds
         if not iterable(resolution):
@@ -198,6 +208,7 @@ class Camera(ParallelAnalysisInterface):
         self.use_light = use_light
         self.light_dir = None
         self.light_rgba = None
+        self.render_workers = render_workers
         if self.no_ghost:
             mylog.info('Warning: no_ghost is currently True (default). This may lead to artifacts at grid boundaries.')
 
@@ -593,26 +604,82 @@ class Camera(ParallelAnalysisInterface):
         return image
 
     def _render(self, double_check, num_threads, image, sampler):
-        ncells = sum(b.source_mask.size for b in self.volume.bricks)
+        ncells = self.volume.brick_dimensions.prod(axis=-1).sum()
         pbar = get_pbar("Ray casting", ncells)
         total_cells = 0
         if double_check:
-            for brick in self.volume.bricks:
+            for brick in self.volume.iter_bricks():
                 for data in brick.my_data:
                     if np.any(np.isnan(data)):
                         raise RuntimeError
 
         view_pos = self.front_center + self.orienter.unit_vectors[2] * 1.0e6 * self.width[2]
-        for brick in self.volume.traverse(view_pos):
-            sampler(brick, num_threads=num_threads)
-            total_cells += brick.source_mask.size
-            pbar.update(total_cells)
+        nworkers = self.get_render_workers()
+        if nworkers > 1:
+            self._render_tiles(nworkers, num_threads, sampler,
+                               self.volume.traverse(view_pos), pbar)
+        else:
+            for brick in self.volume.traverse(view_pos):
+                sampler(brick, num_threads=num_threads)
+                total_cells += brick.source_mask.size
+                pbar.update(total_cells)
 
         pbar.finish()
         image = sampler.aimage
         image = self.finalize_image(image)
         return image
 
+    def get_render_workers(self):
+        nworkers = self.render_workers
+        if nworkers is None:
+            nworkers = ytcfg.getint("yt", "render_workers")
+        if nworkers <= 0:
+            nworkers = multiprocessing.cpu_count()
+        return nworkers
+
+    def _render_tiles(self, nworkers, num_threads, sampler, bricks, pbar):
+        # Split the image plane into strips, each with its own sampler, and
+        # cast the rays of each strip on a separate thread.  Every pixel is
+        # still sampled through the bricks in view order, so no compositing
+        # is needed; the samplers release the GIL while casting.
+        image = sampler.aimage
+        nx = image.shape[0]
+        ntiles = min(nx, 4 * nworkers)
+        edges = np.linspace(0, nx, ntiles + 1).astype("int64")
+        tiles = [(self.get_sampler(self.get_sampler_args(image)),
+                  (edges[i], edges[i+1], 0, image.shape[1]))
+                 for i in range(ntiles)]
+        # Each thread already has a core to itself.
+        if num_threads == 0: num_threads = 1
+        def cast(tile):
+            tile_sampler, window = tile
+            for brick in batch:
+                tile_sampler(brick, num_threads=num_threads, window=window)
+        # Bricks are handed out in batches, so that no more of them are held
+        # in memory at once than the volume would otherwise keep.
+        max_bytes = getattr(self.volume, "max_cache_bytes", 0) / 2
+        pool = ThreadPool(nworkers)
+        try:
+            total_cells = 0
+            batch = []
+            nbytes = 0
+            for brick in bricks:
+                batch.append(brick)
+                nbytes += sum(d.nbytes for d in brick.my_data)
+                if nbytes < max_bytes: continue
+                pool.map(cast, tiles, chunksize=1)
+                total_cells += sum(b.source_mask.size for b in batch)
+                pbar.update(total_cells)
+                batch = []
+                nbytes = 0
+            if len(batch) > 0:
+                pool.map(cast, tiles, chunksize=1)
+                total_cells += sum(b.source_mask.size for b in batch)
+                pbar.update(total_cells)
+        finally:
+            pool.close()
+            pool.join()
+
     def show_tf(self):
         if self._pylab is None: 
             import pylab
@@ -1143,7 +1210,7 @@ class PerspectiveCamera(Camera):
         pbar = get_pbar("Ray casting", (self.volume.brick_dimensions + 1).prod(axis=-1).sum())
         total_cells = 0
         if double_check:
-            for brick in self.volume.bricks:
+            for brick in self.volume.iter_bricks():
                 for data in brick.my_data:
                     if np.any(np.isnan(data)):
                         raise RuntimeError
@@ -1250,7 +1317,7 @@ class HEALpixCamera(Camera):
         pbar = get_pbar("Ray casting", (self.volume.brick_dimensions + 1).prod(axis=-1).sum())
         total_cells = 0
         if double_check:
-            for brick in self.volume.bricks:
+            for brick in self.volume.iter_bricks():
                 for data in brick.my_data:
                     if np.any(np.isnan(data)):
                         raise RuntimeError
@@ -1472,7 +1539,7 @@ class FisheyeCamera(Camera):
         pbar = get_pbar("Ray casting", (self.volume.brick_dimensions + 1).prod(axis=-1).sum())
         total_cells = 0
         if double_check:
-            for brick in self.volume.bricks:
+            for brick in self.volume.iter_bricks():
                 for data in brick.my_data:
                     if np.any(np.isnan(data)):
                         raise RuntimeError
@@ -18,7 +18,7 @@ import os.path
 import tempfile
 import shutil
 from yt.testing import \
-    fake_random_ds
+    fake_random_ds, assert_equal
 import numpy as np
 from yt.visualization.volume_rendering.api import \
     PerspectiveCamera, StereoPairCamera, InteractiveCamera, ProjectionCamera, \
@@ -156,3 +156,43 @@ class CameraTest(TestCase):
             snap
         cam.snapshot('final.png')
         assert_fname('final.png')
+
+    def test_render_workers(self):
+        ds = fake_random_ds(64, nprocs=27)
+        tf = self.setup_transfer_function('camera')
+        images = []
+        for workers in (1, 4):
+            cam = ds.camera(self.c, self.L, self.W, self.N,
+                            transfer_function=tf, log_fields=[False],
+                            render_workers=workers)
+            images.append(cam.snapshot())
+        assert_equal(images[0], images[1])
+        cam = ProjectionCamera(self.c, self.L, self.W, self.N, ds=ds,
+                               field=self.field, interpolated=True)
+        serial = cam.snapshot()
+        cam.render_workers = 3
+        assert_equal(serial, cam.snapshot())
+
+
+def _benchmark_render_workers(n=128, resolution=512, nbricks=8):
+    from yt.frontends.stream.api import load_uniform_grid
+    from yt.config import ytcfg
+    import time
+    ytcfg["yt", "serialize"] = "False"
+    data = {"density": np.random.random((n, n, n))}
+    bbox = np.array([[0.0, 1.0]]*3)
+    ds = load_uniform_grid(data, (n, n, n), bbox=bbox, nprocs=nbricks**3)
+    tf = ColorTransferFunction((0.0, 1.0), grey_opacity=True)
+    tf.map_to_colormap(0.0, 1.0, scale=10., colormap='RdBu_r')
+    cam = ds.camera([0.5]*3, [0.5, 0.5, 0.5], 1.5, resolution,
+                    transfer_function=tf, log_fields=[False])
+    cam.snapshot()
+    for workers in (1, 2, 4, 8):
+        cam.render_workers = workers
+        t1 = time.time()
+        cam.snapshot(num_threads=1)
+        t2 = time.time()
+        print "%s render workers: %0.3f s" % (workers, t2 - t1)
+
+if __name__ == "__main__":
+    _benchmark_render_workers()